@@ -0,0 +1,27 @@
+"""Enable incremental auto-vacuum
+
+Revision ID: 6c8e6ac19d2b
+Revises: eb9a5d9d5b5c
+Create Date: 2026-10-18 14:03:27.518290
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6c8e6ac19d2b"
+down_revision = "eb9a5d9d5b5c"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Changing auto_vacuum on an existing database only takes effect once the database has been
+    # rebuilt with VACUUM.
+    op.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    op.execute("VACUUM")
+
+
+def downgrade():
+    op.execute("PRAGMA auto_vacuum = NONE")
+    op.execute("VACUUM")
@@ -0,0 +1,29 @@
+"""Add pending deletions
+
+Revision ID: b1f4a7c3e9d2
+Revises: 6c8e6ac19d2b
+Create Date: 2026-10-18 16:21:45.903112
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b1f4a7c3e9d2"
+down_revision = "6c8e6ac19d2b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "pending_deletions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("path", sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_pending_deletions")),
+    )
+
+
+def downgrade():
+    op.drop_table("pending_deletions")
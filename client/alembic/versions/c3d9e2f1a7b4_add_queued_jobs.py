@@ -0,0 +1,34 @@
+"""Add queued jobs
+
+Revision ID: c3d9e2f1a7b4
+Revises: b1f4a7c3e9d2
+Create Date: 2026-10-18 19:02:11.538207
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c3d9e2f1a7b4"
+down_revision = "b1f4a7c3e9d2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "queued_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("job_type", sa.String(length=64), nullable=False),
+        sa.Column("uuid", sa.String(length=36), nullable=False),
+        sa.Column(
+            "is_started", sa.Boolean(name="is_started"), server_default=sa.text("0"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_queued_jobs")),
+        sa.UniqueConstraint("job_type", "uuid", name="uq_queued_jobs_job_type_uuid"),
+    )
+
+
+def downgrade():
+    op.drop_table("queued_jobs")
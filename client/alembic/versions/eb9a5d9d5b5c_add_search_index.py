@@ -0,0 +1,64 @@
+"""Add full-text search index
+
+Revision ID: eb9a5d9d5b5c
+Revises: 414627c04463
+Create Date: 2026-10-18 10:12:41.204511
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "eb9a5d9d5b5c"
+down_revision = "414627c04463"
+branch_labels = None
+depends_on = None
+
+ROWID_STRIDE = 4
+ROWID_OFFSETS = {"messages": 1, "replies": 2, "files": 3}
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE VIRTUAL TABLE search_index USING fts5(
+            source_uuid UNINDEXED,
+            item_uuid UNINDEXED,
+            content,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        """
+    )
+    for table, offset in ROWID_OFFSETS.items():
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_search_index_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM search_index
+                WHERE rowid = old.id * {ROWID_STRIDE} + {offset};
+            END
+            """  # noqa: S608
+        )
+
+    # Index the plaintext that has already been stored
+    for table, column, condition in [
+        ("messages", "content", "content IS NOT NULL"),
+        ("replies", "content", "content IS NOT NULL"),
+        ("files", "filename", "is_decrypted = 1"),
+    ]:
+        op.execute(
+            f"""
+            INSERT INTO search_index (rowid, source_uuid, item_uuid, content)
+            SELECT {table}.id * {ROWID_STRIDE} + {ROWID_OFFSETS[table]}, sources.uuid,
+                {table}.uuid, {table}.{column}
+            FROM {table} JOIN sources ON sources.id = {table}.source_id
+            WHERE {table}.{condition}
+            """  # noqa: S608
+        )
+
+
+def downgrade():
+    for table in ROWID_OFFSETS:
+        op.execute(f"DROP TRIGGER {table}_search_index_delete")
+    op.execute("DROP TABLE search_index")
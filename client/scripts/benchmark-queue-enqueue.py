@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark for enqueueing jobs in a RunnableQueue.
+
+Compares checking for duplicate jobs by scanning every queued job, which is what the queue used to
+do on every `add_job`:
+
+    job in [queued_job for priority, queued_job in queue.queue.queue]
+
+with the hash index of queued jobs now kept by the queue:
+
+    job in queue.queue
+
+Each pass enqueues the given number of file download jobs into an empty queue and then enqueues
+them all a second time, so that every duplicate check is exercised against a full queue.
+"""
+
+import argparse
+import itertools
+import timeit
+
+from securedrop_client.api_jobs.base import QueueJob
+from securedrop_client.api_jobs.downloads import FileDownloadJob
+from securedrop_client.queue import RunnableQueue
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument("--jobs", type=int, default=10_000, help="number of jobs (default: 10000)")
+parser.add_argument("--repeat", type=int, default=1, help="number of passes (default: 1)")
+
+
+class LinearScanQueue(RunnableQueue):
+    def _check_for_duplicate_jobs(self, job: QueueJob) -> bool:
+        in_progress_jobs = [
+            in_progress_job
+            for priority, in_progress_job in itertools.chain.from_iterable(
+                self.queue.queues.values()
+            )
+        ]
+        if self.current_job is not None:
+            in_progress_jobs.append(self.current_job)
+        return job in in_progress_jobs
+
+
+def measure(
+    label: str, queue_class: type[RunnableQueue], jobs: list[QueueJob], repeat: int
+) -> float:
+    def run() -> None:
+        queue = queue_class(None, None)
+        for job in jobs:
+            queue.add_job(job)
+        for job in jobs:
+            queue.add_job(job)
+
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    print(f"{label:<12} {best:8.3f} s ({best / len(jobs) * 1_000_000:8.1f} µs/job)")
+    return best
+
+
+def main() -> None:
+    args = parser.parse_args()
+    jobs: list[QueueJob] = [
+        FileDownloadJob(f"file-uuid-{i}", "data", None)  # type: ignore[arg-type]
+        for i in range(args.jobs)
+    ]
+
+    before = measure("linear scan", LinearScanQueue, jobs, args.repeat)
+    after = measure("hash index", RunnableQueue, jobs, args.repeat)
+    print(f"speedup      {before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
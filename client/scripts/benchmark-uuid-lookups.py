@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for looking up database objects by uuid.
+
+Compares the per-lookup overhead of building a new query on every call, which is what storage
+functions used to do:
+
+    session.query(File).filter_by(uuid=uuid).one_or_none()
+
+with the cached statements now used by the storage API:
+
+    lookup_by_uuid(session, File).params(uuid=uuid).one_or_none()
+
+The database is a temporary SQLite file populated with one source and the given number of files,
+so the numbers include the round trip to SQLite that every lookup pays either way.
+"""
+
+import argparse
+import tempfile
+import timeit
+from collections.abc import Callable
+from datetime import datetime
+
+from sqlalchemy.orm.session import Session
+
+from securedrop_client import db
+from securedrop_client.utils import lookup_by_uuid
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument(
+    "--objects", type=int, default=1000, help="number of files to look up (default: 1000)"
+)
+parser.add_argument(
+    "--repeat", type=int, default=5, help="number of passes over all files (default: 5)"
+)
+
+
+def populate(session: Session, count: int) -> list[str]:
+    source = db.Source(
+        uuid="source-uuid",
+        journalist_designation="benchmark source",
+        is_flagged=False,
+        public_key="",
+        fingerprint="",
+        interaction_count=count,
+        is_starred=False,
+        last_updated=datetime.now(),
+        document_count=count,
+    )
+    session.add(source)
+    uuids = []
+    for i in range(1, count + 1):
+        uuid = f"file-uuid-{i}"
+        session.add(
+            db.File(
+                uuid=uuid,
+                filename=f"{i}-doc.gz.gpg",
+                size=123,
+                download_url="http://localhost/",
+                is_downloaded=False,
+                source=source,
+            )
+        )
+        uuids.append(uuid)
+    session.commit()
+    return uuids
+
+
+def measure(
+    label: str, lookup: Callable[[str], db.File | None], uuids: list[str], repeat: int
+) -> float:
+    # Warm up so that the cached statements are compiled before timing starts
+    lookup(uuids[0])
+
+    def run() -> None:
+        for uuid in uuids:
+            lookup(uuid)
+
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    print(f"{label:<12} {best / len(uuids) * 1_000_000:8.1f} µs/lookup")
+    return best
+
+
+def main() -> None:
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        session = db.make_session_maker(home)()
+        db.Base.metadata.create_all(bind=session.get_bind())
+        uuids = populate(session, args.objects)
+
+        before = measure(
+            "query",
+            lambda uuid: session.query(db.File).filter_by(uuid=uuid).one_or_none(),
+            uuids,
+            args.repeat,
+        )
+        after = measure(
+            "cached",
+            lambda uuid: lookup_by_uuid(session, db.File).params(uuid=uuid).one_or_none(),
+            uuids,
+            args.repeat,
+        )
+        print(f"speedup      {before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
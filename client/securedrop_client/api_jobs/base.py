@@ -1,10 +1,13 @@
 import logging
+import time
+from collections.abc import Container, Hashable
 from typing import Any, TypeVar
 
 from PyQt5.QtCore import QObject, pyqtSignal
 from sqlalchemy.orm.session import Session
 
 from securedrop_client.sdk import API, AuthError, RequestTimeoutError, ServerConnectionError
+from securedrop_client.utils import backoff_delay
 
 logger = logging.getLogger(__name__)
 
@@ -23,11 +26,24 @@ class ApiInaccessibleError(Exception):
         super().__init__(message)
 
 
+class RetryLaterError(Exception):
+    """
+    Raised when an attempt at calling the API timed out or could not reach the server and the job
+    has attempts left, so that it is tried again once `delay` seconds have passed.
+    """
+
+    def __init__(self, delay: float) -> None:
+        super().__init__(f"Retrying in {delay:.1f}s")
+        self.delay = delay
+
+
 class QueueJob(QObject):
     def __init__(self, remaining_attempts: int = DEFAULT_NUM_ATTEMPTS) -> None:
         super().__init__()
         self.order_number: int | None = None
         self.remaining_attempts = remaining_attempts
+        # Monotonic time at which the job was first added to a queue
+        self.enqueued_at: float | None = None
 
     def __lt__(self, other: QueueJobType) -> bool:
         """
@@ -42,6 +58,37 @@ class QueueJob(QObject):
 
         return self.order_number < other.order_number
 
+    def coalesce(self, job: "QueueJob") -> bool:
+        """
+        Merge a job that is about to be queued into this job, which is still waiting in the queue,
+        and return True if it was merged. A merged job is not queued.
+
+        By default jobs are not merged.
+        """
+        return False
+
+    def coalesce_key(self) -> Hashable | None:
+        """
+        Return a key that is the same for this job and the queued jobs it can be merged into (see
+        coalesce), so that the queue can look them up without scanning, or None if the job is never
+        merged.
+
+        By default jobs are not merged.
+        """
+        return None
+
+    def cancel_for_sources(
+        self, source_uuids: Container[str], conversation_only: bool = False
+    ) -> bool:
+        """
+        Drop the work this queued job would do for the given sources, which are being deleted, and
+        return True if nothing is left for the job to do so that it can be removed from the queue.
+        If `conversation_only` is True, only the sources' conversations are being deleted.
+
+        By default jobs are kept.
+        """
+        return False
+
 
 class ClearQueueJob(QueueJob):
     pass
@@ -64,32 +111,99 @@ class ApiJob(QueueJob):
     """
     failure_signal = pyqtSignal(Exception)
 
+    # Bounds of the backoff delay between attempts after a timeout or connection error, see
+    # utils.backoff_delay
+    RETRY_BASE_DELAY_SECONDS = 1.0
+    RETRY_MAX_DELAY_SECONDS = 8.0
+
     def __init__(self, remaining_attempts: int = DEFAULT_NUM_ATTEMPTS) -> None:
         super().__init__(remaining_attempts)
+        # Jobs that were merged into this job while it was queued (see coalesce), whose signals are
+        # emitted along with this job's
+        self.coalesced_jobs: list[ApiJob] = []
+        # Set to False by call_api when it returns without sending a request to the server, e.g.
+        # because there is nothing left to do
+        self.made_request = True
+        # Number of attempts in a row that timed out or could not reach the server, which sets the
+        # backoff delay before the next attempt
+        self.retries = 0
+
+    def _do_call_api(self, api_client: API | None, session: Session) -> bool:
+        """
+        Call the API, retrying if the request times out or the server cannot be reached, and emit
+        the job's signals.
+
+        Returns True if call_api succeeded after sending a request to the server, so that its
+        success shows that the server can be reached.
 
-    def _do_call_api(self, api_client: API | None, session: Session) -> None:
+        Sleeps through the backoff delay between attempts, so the queues call _try_call_api instead
+        and run other jobs in the meantime.
+        """
         if not api_client:
             raise ApiInaccessibleError()
 
         while self.remaining_attempts >= 1:
             try:
-                self.remaining_attempts -= 1
-                result = self.call_api(api_client, session)
-            except (AuthError, ApiInaccessibleError) as e:
-                raise ApiInaccessibleError() from e
-            except (RequestTimeoutError, ServerConnectionError) as e:
-                if self.remaining_attempts == 0:
-                    self.failure_signal.emit(e)
-                    raise
-                # Timeout errors may mean the user should try changing Tor circuits
-                elif isinstance(e, RequestTimeoutError):
-                    logger.info("Encountered RequestTimeoutError, retrying API call")
-            except Exception as e:
-                self.failure_signal.emit(e)
+                return self._try_call_api(api_client, session)
+            except RetryLaterError as e:
+                time.sleep(e.delay)
+        return False
+
+    def _try_call_api(self, api_client: API | None, session: Session) -> bool:
+        """
+        Make one attempt at calling the API, and emit the job's signals unless it is to be retried.
+
+        Returns True if call_api succeeded after sending a request to the server. Raises
+        RetryLaterError, with a backoff delay that grows with every retry, if the request timed out
+        or the server could not be reached and the job has attempts left.
+        """
+        if not api_client:
+            raise ApiInaccessibleError()
+
+        try:
+            self.remaining_attempts -= 1
+            self.made_request = True
+            result = self.call_api(api_client, session)
+        except (AuthError, ApiInaccessibleError) as e:
+            raise ApiInaccessibleError() from e
+        except (RequestTimeoutError, ServerConnectionError) as e:
+            if self.remaining_attempts <= 0:
+                self.retries = 0
+                self._emit_failure(e)
                 raise
-            else:
-                self.success_signal.emit(result)
-                break
+            # Timeout errors may mean the user should try changing Tor circuits
+            elif isinstance(e, RequestTimeoutError):
+                logger.info("Encountered RequestTimeoutError, retrying API call")
+            # Back off rather than retrying straight away into a connection that just failed
+            delay = backoff_delay(
+                self.retries, self.RETRY_BASE_DELAY_SECONDS, self.RETRY_MAX_DELAY_SECONDS
+            )
+            self.retries += 1
+            raise RetryLaterError(delay) from e
+        except Exception as e:
+            self.retries = 0
+            self._emit_failure(e)
+            raise
+        self.retries = 0
+        self._emit_success(result)
+        return self.made_request
+
+    def _emit_success(self, result: Any) -> None:
+        """
+        Emit success_signal with the result of call_api. Jobs that finish their work after call_api
+        returns can override this to emit the signal themselves once they are done.
+        """
+        self.success_signal.emit(result)
+        for job in self.coalesced_jobs:
+            job._emit_success(result)
+
+    def _emit_failure(self, error: Exception) -> None:
+        """
+        Emit failure_signal with the exception that made the job fail.
+        """
+        self.failure_signal.emit(error)
+        for job in self.coalesced_jobs:
+            job._emit_failure(error)
 
     def call_api(self, api_client: API, session: Session) -> Any:
         """
@@ -117,3 +231,7 @@ class SingleObjectApiJob(ApiJob):
     def __eq__(self, other: object) -> bool:
         # https://github.com/python/mypy/issues/2783
         return self.uuid == getattr(other, "uuid", None) and type(self) is type(other)
+
+    def __hash__(self) -> int:
+        # Equal jobs must hash equally so that queues can index jobs by identity (type and uuid)
+        return hash((type(self), self.uuid))
@@ -3,24 +3,31 @@ import hashlib
 import logging
 import math
 import os
-from tempfile import NamedTemporaryFile
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Container
+from queue import Empty, Full, Queue
 from typing import Any
 
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.session import Session
 
-from securedrop_client.api_jobs.base import SingleObjectApiJob
+from securedrop_client.api_jobs.base import QueueJob, SingleObjectApiJob
 from securedrop_client.crypto import CryptoError, GpgHelper
-from securedrop_client.db import DownloadError, DownloadErrorCodes, File, Message, Reply
+from securedrop_client.database import DatabaseWriter
+from securedrop_client.db import DownloadErrorCodes, File, Message, Reply
 from securedrop_client.sdk import API, BaseError
 from securedrop_client.sdk import Reply as SdkReply
 from securedrop_client.sdk import Submission as SdkSubmission
 from securedrop_client.storage import (
     mark_as_decrypted,
     mark_as_downloaded,
+    set_download_error,
     set_message_or_reply_content,
 )
-from securedrop_client.utils import safe_move
+from securedrop_client.utils import lookup_by_uuid, safe_move
 
 logger = logging.getLogger(__name__)
 
@@ -46,16 +53,290 @@ class DownloadDecryptionException(DownloadException):
     """
 
 
+class DecryptionStage:
+    """
+    Decrypt downloaded files on a pool of worker threads, separately from downloading them.
+
+    Download jobs that have a decryption stage hand the path of each downloaded file to the stage
+    instead of decrypting it on the queue thread, so that the queue can go on to the next download
+    while gpg runs. Once the file has been decrypted, the stage emits the job's success_signal or
+    failure_signal.
+
+    At most MAX_PENDING files wait to be decrypted. When the stage falls behind, `submit` blocks
+    until a worker is free, which in turn holds up the download queue.
+
+    When messages and replies are waiting, a worker decrypts up to MAX_BATCH_SIZE of them with a
+    single gpg process (see GpgHelper.decrypt_messages_or_replies), which saves starting gpg for
+    each of them while a backlog is decrypted. Only one worker at a time takes files from the
+    queue, and once it has taken a message or reply it waits up to BATCH_WINDOW_SECONDS for more
+    to arrive, so that idle workers do not each take one file of a burst of downloads. The other
+    workers decrypt the batches that were already taken meanwhile.
+
+    Messages and replies of the same source can finish decrypting out of order on different
+    workers, so their jobs' signals are held back until the message and reply jobs of the source
+    that were submitted earlier have emitted theirs. They therefore still appear in a conversation
+    in the order they were downloaded. File downloads emit their signals as soon as they are
+    decrypted, so that a large document does not hold back the messages after it.
+    """
+
+    # Number of files decrypted at the same time
+    NUM_WORKERS = 2
+
+    # Number of downloaded files that can wait to be decrypted before downloads are held up
+    MAX_PENDING = 8
+
+    # Maximum number of waiting files that a worker takes to decrypt together
+    MAX_BATCH_SIZE = 8
+
+    # How long a worker waits for more messages or replies to decrypt together with the first
+    BATCH_WINDOW_SECONDS = 0.1
+
+    def __init__(
+        self,
+        session_maker: scoped_session,
+        num_workers: int = NUM_WORKERS,
+        max_pending: int = MAX_PENDING,
+        batch_window: float = BATCH_WINDOW_SECONDS,
+    ) -> None:
+        self.session_maker = session_maker
+        self.num_workers = num_workers
+        self.batch_window = batch_window
+        self._pending: Queue[tuple[DownloadJob, str] | None] = Queue(maxsize=max_pending)
+        self._jobs: set[DownloadJob] = set()
+        # Jobs that were submitted while an equal job was waiting or being decrypted, by that job
+        self._duplicates: dict[DownloadJob, list[DownloadJob]] = {}
+        self._order: dict[str, deque[DownloadJob]] = {}
+        self._results: dict[DownloadJob, Exception | None] = {}
+        self._threads: list[threading.Thread] = []
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._release_lock = threading.Lock()
+        # Held by the worker that is taking files from _pending
+        self._take_lock = threading.Lock()
+
+    def submit(self, job: "DownloadJob", filepath: str) -> None:
+        """
+        Queue the downloaded file at filepath to be decrypted for job, starting the worker threads
+        if needed. Blocks while MAX_PENDING files are already waiting.
+
+        A job that is equal to one that is already waiting or being decrypted, e.g. one enqueued by
+        a sync while the file was being decrypted, is not decrypted again. Its signals are emitted
+        along with those of the equal job.
+        """
+        with self._lock:
+            if job in self._jobs:
+                logger.debug(f"Duplicate decryption for {job}, skipping")
+                self._duplicates.setdefault(job, []).append(job)
+                return
+            self._jobs.add(job)
+            if job.source_uuid is not None and self._keeps_order(job):
+                self._order.setdefault(job.source_uuid, deque()).append(job)
+            self._start()
+        self._pending.put((job, filepath))
+
+    @staticmethod
+    def _keeps_order(job: "DownloadJob") -> bool:
+        """
+        Return True if the job's signals are emitted in submission order with the other jobs of its
+        source, which is the case for all but file downloads.
+        """
+        return not isinstance(job, FileDownloadJob)
+
+    def is_idle(self) -> bool:
+        """
+        Return True if no file is being decrypted or waiting to be decrypted.
+        """
+        with self._lock:
+            return not self._jobs
+
+    def stop(self) -> None:
+        """
+        Stop the worker threads once they have finished the current decryption. Does not wait for
+        them. Files that are still waiting stay downloaded but not decrypted, so they are decrypted
+        after the next sync.
+        """
+        with self._lock:
+            self._stopping = True
+            for _thread in self._threads:
+                try:
+                    self._pending.put_nowait(None)
+                except Full:
+                    break  # Workers check _stopping after each decryption
+
+    def _start(self) -> None:
+        """
+        Start the worker threads that are not running.
+
+        When called self._lock should be held.
+        """
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        while not self._stopping and len(self._threads) < self.num_workers:
+            thread = threading.Thread(target=self._run, name="DecryptionStage", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _take(self) -> tuple[list[tuple["DownloadJob", str]], bool]:
+        """
+        Wait for a file to decrypt and, if it can be decrypted together with others, take the other
+        files that are waiting or that arrive within batch_window, up to MAX_BATCH_SIZE. Returns
+        the files and whether the worker should stop after decrypting them.
+        """
+        with self._take_lock:
+            item = self._pending.get()
+            if item is None:
+                return [], True
+
+            items = [item]
+            if item[0].batch_decryption_gpg() is None:
+                return items, False
+            deadline = time.monotonic() + self.batch_window
+            while len(items) < self.MAX_BATCH_SIZE:
+                try:
+                    timeout = deadline - time.monotonic()
+                    if timeout > 0:
+                        next_item = self._pending.get(timeout=timeout)
+                    else:
+                        next_item = self._pending.get_nowait()
+                except Empty:
+                    break
+                if next_item is None:
+                    return items, True
+                items.append(next_item)
+            return items, False
+
+    def _run(self) -> None:
+        while not self._stopping:
+            items, stopping = self._take()
+            if not items:
+                break
+            try:
+                session = self.session_maker()
+                try:
+                    self._decrypt(items, session)
+                finally:
+                    session.close()
+            except Exception as e:
+                logger.error("Decryption failed")
+                logger.debug(f"Decryption failed: {type(e).__name__}: {e}")
+                # Fail the jobs that were not released yet, so that the stage does not hold on to
+                # them and keep the client from being idle
+                for job, _ in items:
+                    with self._lock:
+                        unreleased = job in self._jobs and job not in self._results
+                    if unreleased:
+                        self._release(job, e)
+            if stopping:
+                break
+
+    def _decrypt(self, items: list[tuple["DownloadJob", str]], session: Session) -> None:
+        batches: dict[GpgHelper, list[tuple[DownloadJob, str]]] = {}
+        for job, filepath in items:
+            gpg = job.batch_decryption_gpg()
+            if gpg is None:
+                self._release(job, job.finish_decryption(filepath, session))
+            else:
+                batches.setdefault(gpg, []).append((job, filepath))
+
+        for gpg, batch in batches.items():
+            results: list[str | CryptoError | None] = [None] * len(batch)
+            if len(batch) > 1:
+                logger.debug(f"Decrypting {len(batch)} files in one batch")
+                try:
+                    results = list(gpg.decrypt_messages_or_replies([path for _, path in batch]))
+                except Exception as e:
+                    logger.debug(f"Batch decryption failed, decrypting individually: {e}")
+            for (job, filepath), result in zip(batch, results, strict=True):
+                self._release(job, job.finish_decryption(filepath, session, result))
+
+    def _release(self, job: "DownloadJob", error: Exception | None) -> None:
+        """
+        Emit the signals of the job, and of the jobs of the same source that were held back until
+        this one had finished, in the order in which they were submitted. Duplicates of these jobs
+        that were submitted in the meantime emit theirs too.
+        """
+        with self._release_lock:
+            with self._lock:
+                ready = [(job, error)]
+                source_uuid = job.source_uuid
+                if source_uuid in self._order and self._keeps_order(job):
+                    order = self._order[source_uuid]
+                    self._results[job] = error
+                    ready = []
+                    while order and order[0] in self._results:
+                        done = order.popleft()
+                        ready.append((done, self._results.pop(done)))
+                    if not order:
+                        del self._order[source_uuid]
+                for done, _ in ready:
+                    self._jobs.discard(done)
+                ready = [
+                    (emitting, done_error)
+                    for done, done_error in ready
+                    for emitting in [done, *self._duplicates.pop(done, [])]
+                ]
+
+            for done, done_error in ready:
+                done.emit_decryption_result(done_error)
+
+
 class DownloadJob(SingleObjectApiJob):
     """
     Download and decrypt a file that contains either a message, reply, or file submission.
+
+    If the job has a decryption stage, the file is decrypted on the stage's worker threads after
+    call_api returns, and the job's signals are emitted once it has been decrypted.
+
+    The uuid of the source the item belongs to, if known, lets the queue run the downloads of the
+    selected conversation first.
     """
 
     CHUNK_SIZE = 4096
 
-    def __init__(self, data_dir: str, uuid: str) -> None:
+    def __init__(
+        self,
+        data_dir: str,
+        uuid: str,
+        writer: DatabaseWriter | None = None,
+        decryption_stage: DecryptionStage | None = None,
+        source_uuid: str | None = None,
+    ) -> None:
         super().__init__(uuid)
         self.data_dir = data_dir
+        self.writer = writer
+        self.decryption_stage = decryption_stage
+        self.source_uuid = source_uuid
+        self._decryption_pending = False
+        # Called once the decryption stage has finished with the job, before its signals are
+        # emitted, e.g. so that the queue only forgets the job once its file has been decrypted
+        self.decryption_finished_callback: Callable[[], None] | None = None
+        # Set once the job has started emitting its signals, after which no job can be coalesced
+        # into it. Held while either happens.
+        self._emitted = False
+        self._emit_lock = threading.Lock()
+
+    def cancel_for_sources(
+        self, source_uuids: Container[str], conversation_only: bool = False
+    ) -> bool:
+        """
+        Override QueueJob.
+        """
+        return self.source_uuid in source_uuids
+
+    def _write(self, session: Session, func: Callable, *args: Any, **kwargs: Any) -> None:
+        """
+        Run the storage write command func, through the database writer if there is one.
+
+        The writer commits on its own session, so expire the job's session afterwards to pick up
+        the new state on the next attribute access. The job reads back what it wrote, so it waits
+        for the write to be committed, and the writer only batches the writes of jobs that run at
+        the same time on different threads.
+        """
+        if self.writer is None:
+            func(*args, session=session, **kwargs)
+            return
+
+        self.writer.submit(func, *args, **kwargs).result()
+        session.expire_all()
 
     def _get_realistic_timeout(self, size_in_bytes: int) -> int:
         """
@@ -109,6 +390,15 @@ class DownloadJob(SingleObjectApiJob):
         """
         raise NotImplementedError
 
+    def store_plaintext(self, filepath: str, plaintext: str, session: Session | None = None) -> str:
+        """
+        Method for storing the plaintext that was decrypted from the file at filepath, for jobs
+        that support batch decryption.
+
+        Returns the original filename.
+        """
+        raise NotImplementedError
+
     def get_db_object(self, session: Session) -> File | Message | Reply:
         """
         Get the database object associated with this job; may raise
@@ -122,21 +412,109 @@ class DownloadJob(SingleObjectApiJob):
 
         Download and decrypt the file associated with the database object.
         """
+        self._decryption_pending = False
+        self._emitted = False
         db_object = self.get_db_object(session)
 
         if db_object.is_decrypted:
             logger.debug(f"item with uuid {self.uuid} already decrypted, returning")
+            self.made_request = False
             return db_object.uuid
 
         if db_object.is_downloaded:
             logger.debug(f"item with uuid {self.uuid} already downloaded, now decrypting")
-            self._decrypt(db_object.location(self.data_dir), db_object, session)
+            self.made_request = False
+            self._decrypt_or_submit(db_object.location(self.data_dir), db_object, session)
             return db_object.uuid
 
         destination = self._download(api_client, db_object, session)
-        self._decrypt(destination, db_object, session)
+        self._decrypt_or_submit(destination, db_object, session)
         return db_object.uuid
 
+    @property
+    def decryption_pending(self) -> bool:
+        """
+        True if the last call_api handed the file to the decryption stage, which has not
+        necessarily finished with it yet.
+        """
+        return self._decryption_pending
+
+    def _emit_success(self, result: Any) -> None:
+        """
+        Override ApiJob.
+
+        The decryption stage emits success_signal once the file has been decrypted.
+        """
+        if self._decryption_pending:
+            return
+        self._mark_emitted()
+        super()._emit_success(result)
+
+    def _emit_failure(self, error: Exception) -> None:
+        """
+        Override ApiJob.
+        """
+        self._mark_emitted()
+        super()._emit_failure(error)
+
+    def _mark_emitted(self) -> None:
+        with self._emit_lock:
+            self._emitted = True
+
+    def _decrypt_or_submit(
+        self, filepath: str, db_object: File | Message | Reply, session: Session
+    ) -> None:
+        """
+        Decrypt the file now, or hand it to the decryption stage if the job has one.
+        """
+        if self.decryption_stage is None:
+            self._decrypt(filepath, db_object, session)
+            return
+
+        self._decryption_pending = True
+        self.decryption_stage.submit(self, filepath)
+
+    def batch_decryption_gpg(self) -> GpgHelper | None:
+        """
+        Return the GpgHelper that can decrypt the job's file together with the files of other jobs
+        that return the same helper, or None if the file has to be decrypted on its own.
+        """
+        return None
+
+    def finish_decryption(
+        self, filepath: str, session: Session, plaintext: str | CryptoError | None = None
+    ) -> Exception | None:
+        """
+        Decrypt the file that was handed to the decryption stage, or store the plaintext or error
+        of its batch decryption.
+
+        Returns the exception that made the decryption fail, or None if it succeeded. The stage
+        passes it on to emit_decryption_result.
+        """
+        try:
+            db_object = self.get_db_object(session)
+            self._decrypt(filepath, db_object, session, plaintext)
+        except Exception as e:
+            logger.debug(f"Decryption of {self.uuid} failed: {type(e).__name__}: {e}")
+            return e
+        return None
+
+    def emit_decryption_result(self, error: Exception | None) -> None:
+        """
+        Emit success_signal, or failure_signal with the error, once the decryption stage has
+        finished with the job.
+        """
+        self._mark_emitted()
+        if self.decryption_finished_callback is not None:
+            self.decryption_finished_callback()
+        if error is None:
+            self.success_signal.emit(self.uuid)
+        else:
+            self.failure_signal.emit(error)
+        for job in self.coalesced_jobs:
+            if isinstance(job, DownloadJob):
+                job.emit_decryption_result(error)
+
     def _download(self, api: API, db_object: File | Message | Reply, session: Session) -> str:
         """
         Download the encrypted file. Check file integrity and move it to the data directory before
@@ -148,13 +526,13 @@ class DownloadJob(SingleObjectApiJob):
             etag, download_path = self.call_download_api(api, db_object)
 
             if not self._check_file_integrity(etag, download_path):
-                download_error = (
-                    session.query(DownloadError)
-                    .filter_by(name=DownloadErrorCodes.CHECKSUM_ERROR.name)
-                    .one()
+                self._write(
+                    session,
+                    set_download_error,
+                    type(db_object),
+                    db_object.uuid,
+                    DownloadErrorCodes.CHECKSUM_ERROR,
                 )
-                db_object.download_error = download_error
-                session.commit()
                 exception = DownloadChecksumMismatchException(
                     "Downloaded file had an invalid checksum.", type(db_object), db_object.uuid
                 )
@@ -162,8 +540,7 @@ class DownloadJob(SingleObjectApiJob):
 
             destination = db_object.location(self.data_dir)
             safe_move(download_path, destination, self.data_dir)
-            db_object.download_error = None
-            mark_as_downloaded(type(db_object), db_object.uuid, session)
+            self._write(session, mark_as_downloaded, type(db_object), db_object.uuid)
             logger.info(f"File downloaded to {destination}")
             return destination
         except (ValueError, FileNotFoundError, RuntimeError, BaseError) as e:
@@ -173,34 +550,57 @@ class DownloadJob(SingleObjectApiJob):
                 f"Failed to download {db_object.uuid}", type(db_object), db_object.uuid
             ) from e
 
-    def _decrypt(self, filepath: str, db_object: File | Message | Reply, session: Session) -> None:
+    def _decrypt(
+        self,
+        filepath: str,
+        db_object: File | Message | Reply,
+        session: Session,
+        plaintext: str | CryptoError | None = None,
+    ) -> None:
         """
-        Decrypt the file located at the given filepath and mark it as decrypted.
+        Decrypt the file located at the given filepath, or store the given result of decrypting it,
+        and mark it as decrypted.
         """
         try:
-            original_filename = self.call_decrypt(filepath, session)
-            db_object.download_error = None
-            mark_as_decrypted(
-                type(db_object), db_object.uuid, session, original_filename=original_filename
+            if plaintext is None:
+                original_filename = self.call_decrypt(filepath, session)
+            elif isinstance(plaintext, CryptoError):
+                raise plaintext
+            else:
+                original_filename = self.store_plaintext(filepath, plaintext, session)
+            self._write(
+                session,
+                mark_as_decrypted,
+                type(db_object),
+                db_object.uuid,
+                original_filename=original_filename,
             )
             logger.info(f"File decrypted to {os.path.dirname(filepath)}")
         except CryptoError as e:
             logger.error("Decryption failed")
             logger.debug(f"Decryption failed: {e}")
-            mark_as_decrypted(type(db_object), db_object.uuid, session, is_decrypted=False)
-            download_error = (
-                session.query(DownloadError)
-                .filter_by(name=DownloadErrorCodes.DECRYPTION_ERROR.name)
-                .one()
+            self._write(
+                session, mark_as_decrypted, type(db_object), db_object.uuid, is_decrypted=False
+            )
+            self._write(
+                session,
+                set_download_error,
+                type(db_object),
+                db_object.uuid,
+                DownloadErrorCodes.DECRYPTION_ERROR,
             )
-            db_object.download_error = download_error
-            session.commit()
             raise DownloadDecryptionException(
                 f"Failed to decrypt file: {os.path.basename(filepath)}",
                 type(db_object),
                 db_object.uuid,
             ) from e
 
+    def _remove_decryption_directory(self, filepath: str) -> None:
+        try:
+            os.rmdir(os.path.dirname(filepath))
+        except OSError:
+            logger.debug(f"Could not delete decryption directory: {os.path.dirname(filepath)}")
+
     @classmethod
     def _check_file_integrity(cls, etag: str, file_path: str) -> bool:
         """
@@ -236,8 +636,16 @@ class ReplyDownloadJob(DownloadJob):
     Download and decrypt a reply from a source.
     """
 
-    def __init__(self, uuid: str, data_dir: str, gpg: GpgHelper) -> None:
-        super().__init__(data_dir, uuid)
+    def __init__(
+        self,
+        uuid: str,
+        data_dir: str,
+        gpg: GpgHelper,
+        writer: DatabaseWriter | None = None,
+        decryption_stage: DecryptionStage | None = None,
+        source_uuid: str | None = None,
+    ) -> None:
+        super().__init__(data_dir, uuid, writer, decryption_stage, source_uuid)
         self.gpg = gpg
 
     def get_db_object(self, session: Session) -> Reply:
@@ -245,7 +653,7 @@ class ReplyDownloadJob(DownloadJob):
         Override DownloadJob.
         """
         try:
-            return session.query(Reply).filter_by(uuid=self.uuid).one()
+            return lookup_by_uuid(session, Reply).params(uuid=self.uuid).one()
         except NoResultFound:
             raise DownloadException("Reply not found in database", Reply, self.uuid)
 
@@ -269,23 +677,40 @@ class ReplyDownloadJob(DownloadJob):
         Decrypt the file located at the given filepath and store its plaintext content in the local
         database.
 
-        The file containing the plaintext should be deleted once the content is stored in the db.
+        The plaintext is passed from gpg in memory, without writing it to a file.
 
         The return value is an empty string; replies have no original filename.
         """
-        with NamedTemporaryFile("w+") as plaintext_file:
-            try:
-                self.gpg.decrypt_submission_or_reply(filepath, plaintext_file.name, is_doc=False)
-                set_message_or_reply_content(
-                    model_type=Reply, uuid=self.uuid, session=session, content=plaintext_file.read()
-                )
-            finally:
-                try:
-                    os.rmdir(os.path.dirname(filepath))
-                except OSError:
-                    msg = f"Could not delete decryption directory: {os.path.dirname(filepath)}"
-                    logger.debug(msg)
+        try:
+            plaintext = self.gpg.decrypt_message_or_reply(filepath)
+        except Exception:
+            self._remove_decryption_directory(filepath)
+            raise
+        return self.store_plaintext(filepath, plaintext, session)
+
+    def batch_decryption_gpg(self) -> GpgHelper:
+        """
+        Override DownloadJob.
+        """
+        return self.gpg
+
+    def store_plaintext(self, filepath: str, plaintext: str, session: Session | None = None) -> str:
+        """
+        Override DownloadJob.
 
+        Store the plaintext content in the local database, then delete the directory of the file
+        if it is empty.
+        """
+        try:
+            self._write(
+                session,
+                set_message_or_reply_content,
+                model_type=Reply,
+                uuid=self.uuid,
+                content=plaintext,
+            )
+        finally:
+            self._remove_decryption_directory(filepath)
         return ""
 
 
@@ -294,8 +719,16 @@ class MessageDownloadJob(DownloadJob):
     Download and decrypt a message from a source.
     """
 
-    def __init__(self, uuid: str, data_dir: str, gpg: GpgHelper) -> None:
-        super().__init__(data_dir, uuid)
+    def __init__(
+        self,
+        uuid: str,
+        data_dir: str,
+        gpg: GpgHelper,
+        writer: DatabaseWriter | None = None,
+        decryption_stage: DecryptionStage | None = None,
+        source_uuid: str | None = None,
+    ) -> None:
+        super().__init__(data_dir, uuid, writer, decryption_stage, source_uuid)
         self.uuid = uuid
         self.gpg = gpg
 
@@ -304,7 +737,7 @@ class MessageDownloadJob(DownloadJob):
         Override DownloadJob.
         """
         try:
-            return session.query(Message).filter_by(uuid=self.uuid).one()
+            return lookup_by_uuid(session, Message).params(uuid=self.uuid).one()
         except NoResultFound:
             raise DownloadException("Message not found in database", Message, self.uuid)
 
@@ -326,44 +759,118 @@ class MessageDownloadJob(DownloadJob):
         Decrypt the file located at the given filepath and store its plaintext content in the local
         database.
 
-        The file containing the plaintext should be deleted once the content is stored in the db.
+        The plaintext is passed from gpg in memory, without writing it to a file.
 
         The return value is an empty string; messages have no original filename.
         """
-        with NamedTemporaryFile("w+") as plaintext_file:
-            try:
-                self.gpg.decrypt_submission_or_reply(filepath, plaintext_file.name, is_doc=False)
-                set_message_or_reply_content(
-                    model_type=Message,
-                    uuid=self.uuid,
-                    session=session,
-                    content=plaintext_file.read(),
-                )
-            finally:
-                try:
-                    os.rmdir(os.path.dirname(filepath))
-                except OSError:
-                    msg = f"Could not delete decryption directory: {os.path.dirname(filepath)}"
-                    logger.debug(msg)
+        try:
+            plaintext = self.gpg.decrypt_message_or_reply(filepath)
+        except Exception:
+            self._remove_decryption_directory(filepath)
+            raise
+        return self.store_plaintext(filepath, plaintext, session)
+
+    def batch_decryption_gpg(self) -> GpgHelper:
+        """
+        Override DownloadJob.
+        """
+        return self.gpg
+
+    def store_plaintext(self, filepath: str, plaintext: str, session: Session | None = None) -> str:
+        """
+        Override DownloadJob.
 
+        Store the plaintext content in the local database, then delete the directory of the file
+        if it is empty.
+        """
+        try:
+            self._write(
+                session,
+                set_message_or_reply_content,
+                model_type=Message,
+                uuid=self.uuid,
+                content=plaintext,
+            )
+        finally:
+            self._remove_decryption_directory(filepath)
         return ""
 
 
 class FileDownloadJob(DownloadJob):
     """
     Download and decrypt a file from a source.
+
+    File downloads are scheduled shortest first with aging: a file is queued as if it had been
+    added one second later for every AGING_BYTES_PER_SECOND bytes of its size. Small files
+    therefore overtake large files that were queued shortly before them, while a large file still
+    runs once it has waited long enough.
+
+    A prefetch job downloads a file that the user has not asked for yet while the client is idle,
+    and gives way to every other job (see ApiJobQueue.enqueue). If the user asks for the file while
+    it is being prefetched, the prefetch job is upgraded to download it for the user instead.
     """
 
-    def __init__(self, uuid: str, data_dir: str, gpg: GpgHelper) -> None:
-        super().__init__(data_dir, uuid)
+    AGING_BYTES_PER_SECOND = 1_000_000
+
+    def __init__(
+        self,
+        uuid: str,
+        data_dir: str,
+        gpg: GpgHelper,
+        writer: DatabaseWriter | None = None,
+        decryption_stage: DecryptionStage | None = None,
+        source_uuid: str | None = None,
+        size: int | None = None,
+        prefetch: bool = False,
+    ) -> None:
+        super().__init__(data_dir, uuid, writer, decryption_stage, source_uuid)
         self.gpg = gpg
+        self.size = size
+        self.prefetch = prefetch
+
+    def upgrade_prefetch(self, job: "FileDownloadJob") -> bool:
+        """
+        Turn this prefetch job into a download of the same file that the user asked for with job,
+        which is not run. The job is no longer a prefetch job, and it emits the signals of the
+        user's job rather than the signals that the client connected for the prefetch, so that a
+        failure is shown to the user.
+
+        Returns False, and leaves the job as it is, if it has already emitted its signals.
+        """
+        with self._emit_lock:
+            if self._emitted:
+                return False
+            self.prefetch = False
+            for signal in (self.success_signal, self.failure_signal):
+                try:
+                    signal.disconnect()
+                except TypeError:
+                    pass  # Nothing was connected
+            self.coalesced_jobs.append(job)
+        return True
+
+    def __lt__(self, other: QueueJob) -> bool:
+        """
+        Override QueueJob to order file downloads by size and time waited.
+        """
+        if not isinstance(other, FileDownloadJob):
+            return super().__lt__(other)
+        return self._sort_key() < other._sort_key()
+
+    def _sort_key(self) -> tuple[float, int]:
+        if self.enqueued_at is None or self.order_number is None:
+            raise ValueError("cannot compare jobs that have not been queued!")
+        return (
+            self.enqueued_at + (self.size or 0) / self.AGING_BYTES_PER_SECOND,
+            self.order_number,
+        )
 
     def get_db_object(self, session: Session) -> File:
         """
         Override DownloadJob.
         """
         try:
-            return session.query(File).filter_by(uuid=self.uuid).one()
+            return lookup_by_uuid(session, File).params(uuid=self.uuid).one()
         except NoResultFound:
             raise DownloadException("File not found in database", File, self.uuid)
 
@@ -1,15 +1,74 @@
+from collections.abc import Container, Hashable
+
 from sqlalchemy.orm.session import Session
 
-from securedrop_client.api_jobs.base import ApiJob
+from securedrop_client.api_jobs.base import ApiJob, QueueJob
 from securedrop_client.sdk import API
 
 
 class SeenJob(ApiJob):
-    def __init__(self, files: list[str], messages: list[str], replies: list[str]) -> None:
+    def __init__(
+        self,
+        files: list[str],
+        messages: list[str],
+        replies: list[str],
+        source_uuid: str | None = None,
+    ) -> None:
         super().__init__()
         self.files = files
         self.messages = messages
         self.replies = replies
+        # The uuids of the items to mark as seen by source, if known, so that the items of deleted
+        # sources can be dropped (see cancel_for_sources)
+        self.items_by_source: dict[str, set[str]] = {}
+        if source_uuid is not None:
+            self.items_by_source[source_uuid] = set(files + messages + replies)
+
+    def coalesce(self, job: QueueJob) -> bool:
+        """
+        Override QueueJob.
+
+        Add the items of another SeenJob to this job, so that they are marked as seen in a single
+        request.
+        """
+        if not isinstance(job, SeenJob):
+            return False
+
+        self.files = list(dict.fromkeys(self.files + job.files))
+        self.messages = list(dict.fromkeys(self.messages + job.messages))
+        self.replies = list(dict.fromkeys(self.replies + job.replies))
+        for source_uuid, items in job.items_by_source.items():
+            self.items_by_source.setdefault(source_uuid, set()).update(items)
+        self.coalesced_jobs.append(job)
+        return True
+
+    def coalesce_key(self) -> Hashable:
+        """
+        Override QueueJob.
+
+        Any SeenJob can be merged into the one that is queued.
+        """
+        return SeenJob
+
+    def cancel_for_sources(
+        self, source_uuids: Container[str], conversation_only: bool = False
+    ) -> bool:
+        """
+        Override QueueJob.
+
+        Drop the items of the given sources, and cancel the job if no items are left.
+        """
+        cancelled_items: set[str] = set()
+        for source_uuid in list(self.items_by_source):
+            if source_uuid in source_uuids:
+                cancelled_items.update(self.items_by_source.pop(source_uuid))
+        if not cancelled_items:
+            return False
+
+        self.files = [uuid for uuid in self.files if uuid not in cancelled_items]
+        self.messages = [uuid for uuid in self.messages if uuid not in cancelled_items]
+        self.replies = [uuid for uuid in self.replies if uuid not in cancelled_items]
+        return not self.files and not self.messages and not self.replies
 
     def call_api(self, api_client: API, session: Session) -> None:
         """
@@ -19,6 +78,7 @@ class SeenJob(ApiJob):
         be marked as seen.
         """
         if not self.files and not self.messages and not self.replies:
+            self.made_request = False
             return
 
         api_client.seen(self.files, self.messages, self.replies)
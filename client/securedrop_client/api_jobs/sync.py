@@ -51,9 +51,11 @@ class MetadataSyncJob(ApiJob):
                 f"default_request_timeout={api_client.default_request_timeout}"
             )
 
-        users = api_client.get_users()
-        MetadataSyncJob._update_users(session, users)
-        sources, submissions, replies = get_remote_data(api_client)
+        # Use the rate limiter's reserved budget, so that the sync is not held up by queued jobs
+        with api_client.rate_limiter.reserved():
+            users = api_client.get_users()
+            MetadataSyncJob._update_users(session, users)
+            sources, submissions, replies = get_remote_data(api_client)
         update_local_storage(session, sources, submissions, replies, self.data_dir)
         if self._state is not None:
             _update_state(self._state, submissions)
@@ -1,9 +1,10 @@
 import logging
+from collections.abc import Container, Hashable
 
 from sqlalchemy.orm.session import Session
 
 from securedrop_client import sdk
-from securedrop_client.api_jobs.base import SingleObjectApiJob
+from securedrop_client.api_jobs.base import QueueJob, SingleObjectApiJob
 from securedrop_client.sdk import API, RequestTimeoutError, ServerConnectionError
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,45 @@ class UpdateStarJob(SingleObjectApiJob):
     def __init__(self, uuid: str, is_starred: bool) -> None:
         super().__init__(uuid)
         self.is_starred = is_starred
+        # Whether later star updates for the source that were merged into this job undo it
+        self.is_cancelled_out = False
+
+    def __eq__(self, other: object) -> bool:
+        # Every star update must be applied, even if one for the same source is already running.
+        # Updates that are still queued are merged instead, see coalesce.
+        return self is other
+
+    def __hash__(self) -> int:
+        return id(self)
+
+    def coalesce(self, job: QueueJob) -> bool:
+        """
+        Override QueueJob.
+
+        Merge a later star update for the same source into this one. `is_starred` is the state the
+        source had when the star was toggled, so the updates cancel out when the later one toggles
+        the star back to the state it had before this one, and this job then makes no request.
+        """
+        if not isinstance(job, UpdateStarJob) or job.uuid != self.uuid:
+            return False
+
+        self.is_cancelled_out = job.is_starred != self.is_starred
+        self.coalesced_jobs.append(job)
+        return True
+
+    def coalesce_key(self) -> Hashable:
+        """
+        Override QueueJob.
+        """
+        return (UpdateStarJob, self.uuid)
+
+    def cancel_for_sources(
+        self, source_uuids: Container[str], conversation_only: bool = False
+    ) -> bool:
+        """
+        Override QueueJob.
+        """
+        return not conversation_only and self.uuid in source_uuids
 
     def call_api(self, api_client: API, session: Session) -> str:
         """
@@ -20,6 +60,11 @@ class UpdateStarJob(SingleObjectApiJob):
 
         Star or Unstar an user on the server
         """
+        if self.is_cancelled_out:
+            logger.debug(f"Star updates for source {self.uuid} cancelled out, skipping")
+            self.made_request = False
+            return self.uuid
+
         try:
             source_sdk_object = sdk.Source(uuid=self.uuid)
 
@@ -1,7 +1,11 @@
 import logging
 import os
+import threading
+from queue import SimpleQueue
 
+from PyQt5.QtCore import QObject, pyqtSignal
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.session import Session
 
 from securedrop_client import sdk
@@ -16,7 +20,13 @@ from securedrop_client.db import (
     User,
 )
 from securedrop_client.sdk import API, RequestTimeoutError, ServerConnectionError
-from securedrop_client.storage import VALID_FILENAME, update_draft_replies
+from securedrop_client.storage import (
+    VALID_FILENAME,
+    set_draft_reply_ciphertext,
+    update_draft_replies,
+    update_search_index,
+)
+from securedrop_client.utils import lookup_by_uuid
 
 logger = logging.getLogger(__name__)
 
@@ -33,23 +43,27 @@ class SendReplyJob(SingleObjectApiJob):
         """
         Override ApiJob.
 
-        Encrypt the reply and send it to the server. If the call is successful, add it to the local
-        database and return the reply uuid string. Otherwise raise a SendReplyJobException so that
-        we can return the reply uuid.
+        Send the reply to the server, encrypting it first unless the ReplyEncryptor stored its
+        ciphertext with the draft. If the call is successful, add it to the local database and
+        return the reply uuid string. Otherwise raise a SendReplyJobException so that we can return
+        the reply uuid.
         """
 
         try:
             # If the reply has already made it to the server but we didn't get a 201 response back,
             # then a reply with self.reply_uuid will exist in the replies table.
-            reply_db_object = session.query(Reply).filter_by(uuid=self.reply_uuid).one_or_none()
+            reply_db_object = (
+                lookup_by_uuid(session, Reply).params(uuid=self.reply_uuid).one_or_none()
+            )
             if reply_db_object:
                 logger.debug(f"Reply {self.reply_uuid} has already been sent successfully")
+                self.made_request = False
                 return reply_db_object.uuid
 
             # If the draft does not exist because it was deleted locally then do not send the
             # message to the source.
             draft_reply_db_object = (
-                session.query(DraftReply).filter_by(uuid=self.reply_uuid).one_or_none()
+                lookup_by_uuid(session, DraftReply).params(uuid=self.reply_uuid).one_or_none()
             )
             if not draft_reply_db_object:
                 raise Exception(f"Draft reply {self.reply_uuid} does not exist")
@@ -57,7 +71,7 @@ class SendReplyJob(SingleObjectApiJob):
             session.commit()
 
             # If the source was deleted locally then do not send the message and delete the draft.
-            source = session.query(Source).filter_by(uuid=self.source_uuid).one_or_none()
+            source = lookup_by_uuid(session, Source).params(uuid=self.source_uuid).one_or_none()
             if not source:
                 session.delete(draft_reply_db_object)
                 session.commit()
@@ -67,13 +81,17 @@ class SendReplyJob(SingleObjectApiJob):
             # draft reply so that the failed reply associated with the deleted account can be
             # displayed.
             sender = (
-                session.query(User).filter_by(uuid=api_client.token_journalist_uuid).one_or_none()
+                lookup_by_uuid(session, User)
+                .params(uuid=api_client.token_journalist_uuid)
+                .one_or_none()
             )
             if not sender:
                 raise Exception(f"Sender of reply {self.reply_uuid} has been deleted")
 
             # Send the draft reply to the source
-            encrypted_reply = self.gpg.encrypt_to_source(self.source_uuid, self.message)
+            encrypted_reply = draft_reply_db_object.ciphertext
+            if not encrypted_reply:
+                encrypted_reply = self.gpg.encrypt_to_source(self.source_uuid, self.message)
             sdk_reply = self._make_call(encrypted_reply, api_client)
 
             # Create a new reply object.  Since the server is authoritative for
@@ -105,6 +123,8 @@ class SendReplyJob(SingleObjectApiJob):
             # Add reply to replies table and increase the source interaction count by 1 and delete
             # the draft reply.
             session.add(reply_db_object)
+            session.flush()
+            update_search_index(session, reply_db_object)
             source.interaction_count = source.interaction_count + 1
             session.add(source)
 
@@ -126,7 +146,9 @@ class SendReplyJob(SingleObjectApiJob):
 
     def _set_status_to_failed(self, session: Session) -> None:
         try:  # If draft exists, we set it to failed.
-            draft_reply_db_object = session.query(DraftReply).filter_by(uuid=self.reply_uuid).one()
+            draft_reply_db_object = (
+                lookup_by_uuid(session, DraftReply).params(uuid=self.reply_uuid).one()
+            )
             reply_status = (
                 session.query(ReplySendStatus)
                 .filter_by(name=ReplySendStatusCodes.FAILED.value)
@@ -163,3 +185,72 @@ class SendReplyJobTimeoutError(RequestTimeoutError):
 
     def __str__(self) -> str:
         return self.message
+
+
+class ReplyEncryptor(QObject):
+    """
+    Encrypt replies on a worker thread as soon as they are sent, before their SendReplyJob is
+    queued, so that the main queue only has to upload them.
+
+    Replies are encrypted one at a time in the order in which they were sent, so that their jobs
+    are queued in the same order. The ciphertext is stored with the draft reply, where the job picks
+    it up. If a reply cannot be encrypted here, its job is queued anyway and encrypts the reply on
+    the queue thread, which reports the failure as before.
+    """
+
+    # Emitted with the SendReplyJob once its reply has been encrypted or failed to encrypt
+    encrypted = pyqtSignal(object)
+
+    def __init__(self, session_maker: scoped_session, gpg: GpgHelper) -> None:
+        super().__init__()
+        self.session_maker = session_maker
+        self.gpg = gpg
+        self._jobs: SimpleQueue[SendReplyJob | None] = SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def submit(self, job: SendReplyJob) -> None:
+        """
+        Queue the reply of the job to be encrypted, starting the worker thread if needed.
+        """
+        with self._lock:
+            if self._stopping:
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="ReplyEncryptor", daemon=True
+                )
+                self._thread.start()
+            self._jobs.put(job)
+
+    def stop(self) -> None:
+        """
+        Stop the worker thread once it has finished the current encryption. Does not wait for it.
+        Replies that are still waiting stay as pending drafts, which are marked as failed on the
+        next start.
+        """
+        with self._lock:
+            self._stopping = True
+            self._jobs.put(None)
+
+    def _run(self) -> None:
+        session = self.session_maker()
+        try:
+            while not self._stopping:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                self._encrypt(job, session)
+        finally:
+            session.close()
+
+    def _encrypt(self, job: SendReplyJob, session: Session) -> None:
+        try:
+            ciphertext = self.gpg.encrypt_to_source(job.source_uuid, job.message)
+            set_draft_reply_ciphertext(job.reply_uuid, ciphertext, session)
+        except Exception as e:
+            logger.error("Could not encrypt reply before queueing it")
+            logger.debug(f"Could not encrypt reply {job.reply_uuid} before queueing it: {e}")
+            session.rollback()
+        self.encrypted.emit(job)
@@ -260,6 +260,10 @@ def start_app(args, qt_args) -> NoReturn:  # type: ignore[no-untyped-def]
             file_download_queue_thread,
         )
         controller.setup()
+        app.aboutToQuit.connect(controller.database_writer.stop)
+        app.aboutToQuit.connect(controller.disk_deleter.stop)
+        app.aboutToQuit.connect(controller.decryption_stage.stop)
+        app.aboutToQuit.connect(controller.reply_encryptor.stop)
 
         configure_signal_handlers(app)
         timer = QTimer()
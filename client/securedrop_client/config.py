@@ -40,12 +40,37 @@ class Config:
         "journalist_key_fingerprint": "SD_SUBMISSION_KEY_FPR",
         "download_retry_limit": "SD_DOWNLOAD_RETRY_LIMIT",
         "proxy_vm_name": "SD_PROXY_VM_NAME",
+        "main_queue_workers": "SD_MAIN_QUEUE_WORKERS",
+        "file_download_workers": "SD_FILE_DOWNLOAD_WORKERS",
+        "api_requests_per_second": "SD_API_REQUESTS_PER_SECOND",
+        "api_bytes_per_second": "SD_API_BYTES_PER_SECOND",
+        "sync_requests_per_second": "SD_SYNC_REQUESTS_PER_SECOND",
+        "crypto_backend": "SD_CRYPTO_BACKEND",
+        "prefetch_max_file_size": "SD_PREFETCH_MAX_FILE_SIZE",
+        "prefetch_disk_budget": "SD_PREFETCH_DISK_BUDGET",
+        "prefetch_recency_days": "SD_PREFETCH_RECENCY_DAYS",
+        "file_cache_quota": "SD_FILE_CACHE_QUOTA",
     }
 
     journalist_key_fingerprint: str
     gpg_domain: str | None = None
     download_retry_limit: int = 3
     proxy_vm_name: str = "sd-proxy"
+    main_queue_workers: int = 4
+    file_download_workers: int = 3
+    # Limits on the traffic sent through the proxy, see sdk.ratelimit.RateLimiter (0 is unlimited)
+    api_requests_per_second: int = 8
+    api_bytes_per_second: int = 0
+    sync_requests_per_second: int = 2
+    # OpenPGP backend of crypto.GpgHelper outside of Qubes, "gpg" or "openpgp" (in-process)
+    crypto_backend: str = "gpg"
+    # Background downloads of files while the queues are idle, see prefetch.PrefetchPolicy
+    # (a maximum file size of 0 disables prefetching)
+    prefetch_max_file_size: int = 0
+    prefetch_disk_budget: int = 1_000_000_000
+    prefetch_recency_days: int = 7
+    # Bytes of decrypted files to keep on disk, see file_cache.FileCache (0 is unlimited)
+    file_cache_quota: int = 0
 
     @classmethod
     def load(cls) -> "Config":
@@ -15,18 +15,31 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import io
 import logging
 import os
 import struct
 import subprocess
 import tempfile
+import threading
+from collections.abc import Callable, Generator
+from contextlib import AbstractContextManager, contextmanager
+from functools import partial
+from itertools import chain
 from pathlib import Path
+from typing import IO, Any, cast
 
 from sqlalchemy.orm import scoped_session
 
 from securedrop_client.config import Config
 from securedrop_client.db import Source
-from securedrop_client.utils import safe_copy, safe_gzip_extract, safe_mkdir
+from securedrop_client.utils import (
+    check_path_traversal,
+    lookup_by_uuid,
+    relative_filepath,
+    safe_gzip_decompress,
+    safe_mkdir,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -43,104 +56,112 @@ GZIP_FLAG_FILENAME = 8  # gzip.FNAME
 def read_gzip_header_filename(filename: str) -> str:
     """
     Extract the original filename from the header of a gzipped file.
+    """
+    with open(filename, "rb") as f:
+        return parse_gzip_header_filename(f.read)
+
+
+def parse_gzip_header_filename(read: Callable[[int], bytes]) -> str:
+    """
+    Extract the original filename from a gzip header, reading the header with the given read
+    function, e.g. the read method of a file or a stream.
 
     Adapted from Python's gzip._GzipReader._read_gzip_header.
     """
     original_filename = ""
-    with open(filename, "rb") as f:
-        gzip_header_identification = f.read(2)
-        if gzip_header_identification != GZIP_FILE_IDENTIFICATION:
-            raise OSError(f"Not a gzipped file ({gzip_header_identification!r})")
-
-        (gzip_header_compression_method, gzip_header_flags, _) = struct.unpack("<BBIxx", f.read(8))
-        if gzip_header_compression_method != 8:
-            raise OSError("Unknown compression method")
-
-        if gzip_header_flags & GZIP_FLAG_EXTRA_FIELDS:
-            (extra_len,) = struct.unpack("<H", f.read(2))
-            f.read(extra_len)
-
-        if gzip_header_flags & GZIP_FLAG_FILENAME:
-            fb = b""
-            while True:
-                s = f.read(1)
-                if not s or s == b"\000":
-                    break
-                fb += s
-            original_filename = str(fb, "utf-8")
+    gzip_header_identification = read(2)
+    if gzip_header_identification != GZIP_FILE_IDENTIFICATION:
+        raise OSError(f"Not a gzipped file ({gzip_header_identification!r})")
+
+    (gzip_header_compression_method, gzip_header_flags, _) = struct.unpack("<BBIxx", read(8))
+    if gzip_header_compression_method != 8:
+        raise OSError("Unknown compression method")
+
+    if gzip_header_flags & GZIP_FLAG_EXTRA_FIELDS:
+        (extra_len,) = struct.unpack("<H", read(2))
+        read(extra_len)
+
+    if gzip_header_flags & GZIP_FLAG_FILENAME:
+        fb = b""
+        while True:
+            s = read(1)
+            if not s or s == b"\000":
+                break
+            fb += s
+        original_filename = str(fb, "utf-8")
 
     return original_filename
 
 
-class GpgHelper:
-    # The extraction path should be the tempdir provided by the system
-    EXTRACTION_PATH = str(Path(tempfile.gettempdir()))
+class CryptoBackend:
+    """
+    The OpenPGP operations that GpgHelper dispatches to. Every method raises CryptoError if the
+    operation fails.
 
-    def __init__(self, sdc_home: str, session_maker: scoped_session, is_qubes: bool) -> None:
+    GpgBackend, which runs gpg or qubes-gpg-client, is the default. OpenPGPBackend runs in-process
+    for development and testing outside of Qubes. Both are checked by the conformance tests in
+    tests/test_crypto_backends.py.
+    """
+
+    def decrypt(self, filepath: str) -> bytes:
         """
-        :param sdc_home: Home directory for the SecureDrop client
-        :param is_qubes: Whether the client is running in Qubes or not
+        Return the plaintext of the file located at the given filepath.
         """
-        safe_mkdir(sdc_home, "gpg")
-        self.sdc_home = sdc_home
-        self.is_qubes = is_qubes
-        self.session_maker = session_maker
+        raise NotImplementedError
 
-        config = Config.load()
-        self.journalist_key_fingerprint = config.journalist_key_fingerprint
+    def decrypt_files(self, filepaths: list[str]) -> list[bytes | CryptoError]:
+        """
+        Return the plaintext of each file located at the given filepaths, or the CryptoError that
+        made its decryption fail, in the order of filepaths.
+        """
+        results: list[bytes | CryptoError] = []
+        for filepath in filepaths:
+            try:
+                results.append(self.decrypt(filepath))
+            except CryptoError as e:
+                results.append(e)
+        return results
 
-    def decrypt_submission_or_reply(
-        self, filepath: str, plaintext_filepath: str, is_doc: bool = False
-    ) -> str:
+    def open_decrypted(self, filepath: str) -> AbstractContextManager[IO[bytes]]:
         """
-        Decrypt the file located at the given filepath. If is_doc is False, store the decrypted
-        plaintext contents to plaintext_filepath in /tmp. Otherwise, unzip and extract the document
-        to the parent directory of plaintext_filepath. The document will be saved as the filename
-        in the gzip header if it exists otherwise the plaintext_filepath name will be used.
+        Return a context manager for a stream of the plaintext of the file located at the given
+        filepath. The context manager may only raise CryptoError for a failed decryption once all
+        of the plaintext has been read.
         """
-        original_filename = Path(Path(filepath).stem).stem  # Remove one or two suffixes
+        raise NotImplementedError
 
-        err = tempfile.NamedTemporaryFile(suffix=".message-error", delete=False)  # noqa: SIM115
-        with tempfile.NamedTemporaryFile(suffix=".message") as out:
-            cmd = self._gpg_cmd_base()
-            cmd.extend(["--decrypt", filepath])
-            res = subprocess.call(cmd, stdout=out, stderr=err)
-
-            if res != 0:
-                # The err tempfile was created with delete=False, so needs to
-                # be explicitly cleaned up. We will do that after we've read the file.
-                err.close()
-
-                with open(err.name) as e:
-                    msg = f"GPG Error: {e.read()}"
-
-                os.unlink(err.name)
-
-                raise CryptoError(msg)
-
-            # Delete err file
-            err.close()
-            os.unlink(err.name)
-
-            # Delete encrypted file now that it's been successfully decrypted
-            os.unlink(filepath)
-
-            # If is_doc is True, unzip and extract the document to the parent directory of filepath.
-            # The document will be saved as the filename in the gzip header, which should contain
-            # the name of the original file that was gzipped. If the name is not in the header, use
-            # the filepath name.
-            #
-            # If is_doc is False, store the decrypted plaintext contents to the plaintext_filepath
-            # in /tmp that will automatically be deleted after decryption because it is a named
-            # temporary file.
-            if is_doc:
-                original_filename = read_gzip_header_filename(out.name) or original_filename
-                safe_gzip_extract(out.name, filepath, original_filename, self.sdc_home)
-            else:
-                # plaintext_filepath is a NamedTemporaryFile in /tmp so the base_dir is /tmp
-                safe_copy(out.name, plaintext_filepath, self.EXTRACTION_PATH)
+    def import_key(self, key_data: str) -> None:
+        """
+        Import the armored key in key_data into the keyring.
+        """
+        raise NotImplementedError
+
+    def list_fingerprints(self) -> set[str]:
+        """
+        Return the fingerprints of the keys and subkeys in the keyring, in upper case.
+        """
+        raise NotImplementedError
+
+    def encrypt(self, data: str, fingerprints: list[str]) -> str:
+        """
+        Return the armored ciphertext of data, encrypted to the keys with the given fingerprints.
+        """
+        raise NotImplementedError
 
-        return original_filename
+
+class GpgBackend(CryptoBackend):
+    """
+    Run gpg with the client's keyring, or qubes-gpg-client in Qubes, for each operation.
+    """
+
+    def __init__(self, sdc_home: str, is_qubes: bool) -> None:
+        safe_mkdir(sdc_home, "gpg")
+        # Where decrypt_files has gpg write plaintexts, with 700 permissions in the client's home
+        # rather than in the shared temporary directory
+        safe_mkdir(sdc_home, "decryption")
+        self.sdc_home = sdc_home
+        self.decryption_dir = os.path.join(sdc_home, "decryption")
+        self.is_qubes = is_qubes
 
     def _gpg_cmd_base(self) -> list:
         if self.is_qubes:  # pragma: no cover
@@ -151,18 +172,118 @@ class GpgHelper:
         cmd.extend(["--trust-model", "always"])
         return cmd
 
-    def import_key(self, source: Source) -> None:
+    def decrypt(self, filepath: str) -> bytes:
         """
-        Imports a Source's GPG key.
+        Override CryptoBackend.
+
+        The plaintext is read from gpg's stdout and its errors from stderr, so no temporary files
+        are created.
         """
-        logger.debug("Importing key for source %s", source.uuid)
-        if not source.public_key:
-            raise CryptoError(f"Could not import key: source {source.uuid} has no key")
-        self._import(source.public_key)
+        cmd = self._gpg_cmd_base()
+        cmd.extend(["--decrypt", filepath])
+        res = subprocess.run(cmd, capture_output=True, check=False)
+        if res.returncode != 0:
+            raise CryptoError(f"GPG Error: {res.stderr.decode(errors='replace')}")
+        return res.stdout
 
-    def _import(self, key_data: str) -> None:
-        """Imports a key to the client GnuPG keyring."""
+    def decrypt_files(self, filepaths: list[str]) -> list[bytes | CryptoError]:
+        """
+        Override CryptoBackend.
+
+        Decrypt all of the files with a single gpg process, instead of starting gpg and loading the
+        keyring once per file. qubes-gpg-client decrypts one file at a time, so in Qubes the files
+        are decrypted one after the other.
+        """
+        if self.is_qubes:  # pragma: no cover
+            return super().decrypt_files(filepaths)
+
+        # gpg --decrypt-files writes the plaintext of each file next to it, with the .gpg suffix
+        # removed, so link the files into a private directory under numbered names.
+        with tempfile.TemporaryDirectory(dir=self.decryption_dir) as workdir:
+            names = []
+            for i, filepath in enumerate(filepaths):
+                name = f"{i}.gpg"
+                os.symlink(os.path.abspath(filepath), os.path.join(workdir, name))
+                names.append(name)
+
+            cmd = self._gpg_cmd_base()
+            cmd.extend(["--batch", "--yes", "--status-fd", "1", "--decrypt-files", *names])
+            res = subprocess.run(cmd, cwd=workdir, capture_output=True, text=True, check=False)
+            decrypted = self._get_decrypted_files(res.stdout)
+
+            results: list[bytes | CryptoError] = []
+            for name in names:
+                if name not in decrypted:
+                    errors = [
+                        line for line in res.stderr.splitlines() if line.startswith(f"gpg: {name}:")
+                    ]
+                    results.append(CryptoError(f"GPG Error: {' '.join(errors) or 'no plaintext'}"))
+                    continue
+                with open(os.path.join(workdir, name.removesuffix(".gpg")), "rb") as plaintext:
+                    results.append(plaintext.read())
+
+        return results
+
+    def _get_decrypted_files(self, status: str) -> set[str]:
+        """
+        Return the names of the files that the status output of gpg --decrypt-files reports as
+        decrypted.
+        """
+        decrypted = set()
+        name = None
+        is_decrypted = False
+        for line in status.splitlines():
+            keyword, *args = line.removeprefix("[GNUPG:] ").split(" ")
+            if keyword == "FILE_START":
+                name = args[1]
+                is_decrypted = False
+            elif keyword == "DECRYPTION_OKAY":
+                is_decrypted = True
+            elif keyword in ("DECRYPTION_FAILED", "ERROR"):
+                name = None
+            elif keyword == "FILE_DONE":
+                if name is not None and is_decrypted:
+                    decrypted.add(name)
+                name = None
+        return decrypted
+
+    @contextmanager
+    def open_decrypted(self, filepath: str) -> Generator[IO[bytes], None, None]:
+        """
+        Override CryptoBackend.
 
+        Yield gpg's stdout as it decrypts the file. gpg only reports a failed integrity check once
+        it has written all of its output.
+        """
+        cmd = self._gpg_cmd_base()
+        cmd.extend(["--decrypt", filepath])
+        with tempfile.TemporaryFile() as err:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err)
+            stdout = cast(IO[bytes], proc.stdout)
+            try:
+                yield stdout
+            except Exception as e:
+                # Unless gpg has stopped writing, the failure is not gpg's
+                is_gpg_writing = bool(stdout.read(1))
+                if is_gpg_writing:
+                    proc.kill()
+                if proc.wait() == 0 or is_gpg_writing:
+                    raise
+                raise CryptoError(f"GPG Error: {self._read_error(err)}") from e
+            finally:
+                stdout.close()
+
+            if proc.wait() != 0:
+                raise CryptoError(f"GPG Error: {self._read_error(err)}")
+
+    def _read_error(self, err: IO[bytes]) -> str:
+        err.seek(0)
+        return err.read().decode(errors="replace")
+
+    def import_key(self, key_data: str) -> None:
+        """
+        Override CryptoBackend.
+        """
         with (
             tempfile.NamedTemporaryFile("w+") as temp_key,
             tempfile.NamedTemporaryFile("w+") as stdout,
@@ -184,12 +305,393 @@ class GpgHelper:
                 stderr.seek(0)
                 raise CryptoError(f"Could not import key: {e}\n{stderr.read()}")
 
+    def list_fingerprints(self) -> set[str]:
+        """
+        Override CryptoBackend.
+        """
+        cmd = self._gpg_cmd_base()
+        cmd.extend(["--list-keys", "--with-colons"])
+        res = subprocess.run(cmd, capture_output=True, text=True, check=False)
+        if res.returncode != 0:
+            raise CryptoError(f"Could not list keys: {res.stderr}")
+
+        # The fingerprint is the 10th field of "fpr" records
+        return {
+            line.split(":")[9].upper()
+            for line in res.stdout.splitlines()
+            if line.startswith("fpr:")
+        }
+
+    def encrypt(self, data: str, fingerprints: list[str]) -> str:
+        """
+        Override CryptoBackend.
+
+        The plaintext is passed on stdin and the ciphertext read from stdout.
+        """
+        cmd = self._gpg_cmd_base()
+        cmd.append("--encrypt")
+        for fingerprint in fingerprints:
+            cmd.extend(["-r", fingerprint])
+        cmd.append("--armor")
+        if not self.is_qubes:
+            # In Qubes, the ciphertext will go to stdout.
+            # In addition the option below cannot be passed
+            # through the gpg client wrapper.
+            cmd.extend(["-o-"])  # write to stdout
+
+        try:
+            res = subprocess.run(cmd, input=data, capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise CryptoError(f"{e}\n{e.stderr}")
+
+        return res.stdout
+
+
+class OpenPGPBackend(CryptoBackend):
+    """
+    Run OpenPGP operations in-process with PGPy, from and to memory buffers, which avoids the cost
+    of starting gpg for each operation in development and test setups. Not for use in Qubes, where
+    the keys are only available through qubes-gpg-client.
+
+    Keys are kept in memory, and saved as armored files in the "openpgp" directory of the client's
+    home directory so that they persist between runs like the gpg keyring.
+    """
+
+    def __init__(self, sdc_home: str) -> None:
+        try:
+            import pgpy
+            from pgpy.constants import SymmetricKeyAlgorithm
+            from pgpy.errors import PGPError
+        except ImportError as e:
+            raise CryptoError("The in-process OpenPGP backend requires PGPy") from e
+
+        self._pgpy = pgpy
+        self._error = PGPError
+        self._cipher = SymmetricKeyAlgorithm.AES256
+        safe_mkdir(sdc_home, "openpgp")
+        self.keyring_dir = os.path.join(sdc_home, "openpgp")
+        self._keys: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+        for filename in sorted(os.listdir(self.keyring_dir)):
+            with open(os.path.join(self.keyring_dir, filename)) as f:
+                try:
+                    self._add_key(self._load_key(f.read()))
+                except CryptoError as e:
+                    logger.debug(f"Could not load key {filename}: {e}")
+
+    def _load_key(self, key_data: str) -> Any:
+        try:
+            key, _ = self._pgpy.PGPKey.from_blob(key_data)
+        except Exception as e:
+            raise CryptoError(f"Could not import key: {e}") from e
+        return key
+
+    def _fingerprint(self, key: Any) -> str:
+        return str(key.fingerprint).replace(" ", "").upper()
+
+    def _add_key(self, key: Any) -> bool:
+        """
+        Add the key unless its secret key is already in the keyring. Returns True if it was added.
+        """
+        fingerprint = self._fingerprint(key)
+        with self._lock:
+            existing = self._keys.get(fingerprint)
+            if existing is not None and not existing.is_public and key.is_public:
+                return False
+            self._keys[fingerprint] = key
+        return True
+
+    def _find_key(self, fingerprint: str) -> Any:
+        fingerprint = fingerprint.upper()
+        with self._lock:
+            for key in self._keys.values():
+                subkeys = [self._fingerprint(subkey) for subkey in key.subkeys.values()]
+                if fingerprint == self._fingerprint(key) or fingerprint in subkeys:
+                    return key
+        raise CryptoError(f"No public key for {fingerprint}")
+
+    def decrypt(self, filepath: str) -> bytes:
+        """
+        Override CryptoBackend.
+        """
+        try:
+            message = self._pgpy.PGPMessage.from_file(filepath)
+        except Exception as e:
+            raise CryptoError(f"OpenPGP Error: {e}") from e
+
+        with self._lock:
+            secret_keys = [key for key in self._keys.values() if not key.is_public]
+        for key in secret_keys:
+            try:
+                plaintext = key.decrypt(message).message
+            except self._error:
+                continue
+            if isinstance(plaintext, str):
+                return plaintext.encode()
+            return bytes(plaintext)
+
+        raise CryptoError("OpenPGP Error: no secret key to decrypt the message")
+
+    @contextmanager
+    def open_decrypted(self, filepath: str) -> Generator[IO[bytes], None, None]:
+        """
+        Override CryptoBackend.
+
+        The message is decrypted in memory before the stream is returned.
+        """
+        yield io.BytesIO(self.decrypt(filepath))
+
+    def import_key(self, key_data: str) -> None:
+        """
+        Override CryptoBackend.
+        """
+        key = self._load_key(key_data)
+        if not self._add_key(key):
+            return
+
+        keypath = os.path.join(self.keyring_dir, f"{self._fingerprint(key)}.asc")
+        with open(os.open(keypath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            f.write(str(key))
+
+    def list_fingerprints(self) -> set[str]:
+        """
+        Override CryptoBackend.
+        """
+        fingerprints = set()
+        with self._lock:
+            for fingerprint, key in self._keys.items():
+                fingerprints.add(fingerprint)
+                fingerprints.update(self._fingerprint(subkey) for subkey in key.subkeys.values())
+        return fingerprints
+
+    def encrypt(self, data: str, fingerprints: list[str]) -> str:
+        """
+        Override CryptoBackend.
+
+        The message is encrypted once with a session key that is encrypted to each recipient.
+        """
+        keys = [self._find_key(fingerprint) for fingerprint in fingerprints]
+        message = self._pgpy.PGPMessage.new(data)
+        session_key = self._cipher.gen_key()
+        try:
+            for key in keys:
+                public_key = key if key.is_public else key.pubkey
+                message = public_key.encrypt(message, cipher=self._cipher, sessionkey=session_key)
+        except self._error as e:
+            raise CryptoError(f"OpenPGP Error: {e}") from e
+        finally:
+            del session_key
+
+        return str(message)
+
+
+class GpgHelper:
+    # The extraction path should be the tempdir provided by the system
+    EXTRACTION_PATH = str(Path(tempfile.gettempdir()))
+
+    # Size of the chunks of plaintext read while a document is decompressed
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        sdc_home: str,
+        session_maker: scoped_session,
+        is_qubes: bool,
+        backend: CryptoBackend | None = None,
+    ) -> None:
+        """
+        :param sdc_home: Home directory for the SecureDrop client
+        :param is_qubes: Whether the client is running in Qubes or not
+        :param backend: The backend for OpenPGP operations, by default the one that is configured
+        """
+        self.sdc_home = sdc_home
+        self.is_qubes = is_qubes
+        self.session_maker = session_maker
+
+        config = Config.load()
+        self.journalist_key_fingerprint = config.journalist_key_fingerprint
+
+        if backend is None:
+            if config.crypto_backend == "openpgp" and not is_qubes:
+                backend = OpenPGPBackend(sdc_home)
+            else:
+                backend = GpgBackend(sdc_home, is_qubes)
+        self.backend = backend
+
+        # Bound the number of gpg processes that decrypt at the same time, from the decryption
+        # stage's workers and the queue threads alike, to the number of CPUs
+        self.num_decryption_workers = os.cpu_count() or 1
+        self._decryption_slots = threading.BoundedSemaphore(self.num_decryption_workers)
+
+        # Fingerprints of the keys known to be in the keyring, listed on the first import
+        self._keyring_fingerprints: set[str] | None = None
+        self._keyring_lock = threading.Lock()
+
+    def decrypt_submission_or_reply(
+        self, filepath: str, plaintext_filepath: str, is_doc: bool = False
+    ) -> str:
+        """
+        Decrypt the file located at the given filepath. If is_doc is False, store the decrypted
+        plaintext contents to plaintext_filepath in /tmp. Otherwise, unzip and extract the document
+        to the parent directory of plaintext_filepath. The document will be saved as the filename
+        in the gzip header if it exists otherwise the plaintext_filepath name will be used.
+        """
+        original_filename = Path(Path(filepath).stem).stem  # Remove one or two suffixes
+        if is_doc:
+            return self._decrypt_document(filepath, original_filename)
+
+        with self._decryption_slots:
+            plaintext = self.backend.decrypt(filepath)
+
+        # Delete encrypted file now that it's been successfully decrypted
+        os.unlink(filepath)
+
+        # plaintext_filepath is a NamedTemporaryFile in /tmp so the base_dir is /tmp
+        check_path_traversal(plaintext_filepath)
+        relative_filepath(plaintext_filepath, self.EXTRACTION_PATH)
+        Path(plaintext_filepath).write_bytes(plaintext)
+        Path(plaintext_filepath).chmod(0o600)
+
+        return original_filename
+
+    def _decrypt_document(self, filepath: str, original_filename: str) -> str:
+        """
+        Decrypt the gzipped document located at the given filepath and extract it to the parent
+        directory of filepath in a single pass, decompressing the plaintext as it is decrypted.
+
+        The document will be saved as the filename in the gzip header, which should contain the
+        name of the original file that was gzipped. If the name is not in the header, the given
+        original_filename is used.
+
+        gpg only reports a failed integrity check once it has written all of its output, so the
+        extracted document is deleted again if decryption fails.
+        """
+        document_path = None
+        try:
+            with self._decryption_slots, self.backend.open_decrypted(filepath) as plaintext:
+                header = bytearray()
+
+                def read_header(size: int) -> bytes:
+                    data = plaintext.read(size)
+                    header.extend(data)
+                    return data
+
+                original_filename = parse_gzip_header_filename(read_header) or original_filename
+                chunks = chain([bytes(header)], iter(partial(plaintext.read, self.CHUNK_SIZE), b""))
+                document_path = safe_gzip_decompress(
+                    chunks, filepath, original_filename, self.sdc_home
+                )
+        except CryptoError:
+            if document_path is not None:
+                document_path.unlink(missing_ok=True)
+            raise
+
+        # Delete encrypted file now that it's been successfully decrypted
+        os.unlink(filepath)
+
+        return original_filename
+
+    def decrypt_message_or_reply(self, filepath: str) -> str:
+        """
+        Decrypt the message or reply in the file located at the given filepath and return its
+        plaintext, then delete the file.
+        """
+        with self._decryption_slots:
+            plaintext = self.backend.decrypt(filepath)
+
+        # Delete encrypted file now that it's been successfully decrypted
+        os.unlink(filepath)
+
+        return plaintext.decode()
+
+    def decrypt_messages_or_replies(self, filepaths: list[str]) -> list[str | CryptoError]:
+        """
+        Decrypt the messages or replies in the files located at the given filepaths together, which
+        for the gpg backend takes a single gpg process instead of one per file.
+
+        Returns the plaintext of each file, or the CryptoError that made its decryption fail, in
+        the order of filepaths. As with decrypt_message_or_reply, each file that is decrypted is
+        deleted, but only once every result is known, so that no file is lost if the batch fails.
+        """
+        with self._decryption_slots:
+            plaintexts = self.backend.decrypt_files(filepaths)
+
+        results: list[str | CryptoError] = []
+        for plaintext in plaintexts:
+            if isinstance(plaintext, CryptoError):
+                results.append(plaintext)
+                continue
+            try:
+                results.append(plaintext.decode())
+            except UnicodeDecodeError as e:
+                results.append(CryptoError(f"Could not decode plaintext: {e}"))
+
+        if len(results) != len(filepaths):
+            raise ValueError(f"Got {len(results)} results for a batch of {len(filepaths)} files")
+        for filepath, result in zip(filepaths, results, strict=False):
+            if not isinstance(result, CryptoError):
+                os.unlink(filepath)
+
+        return results
+
+    def import_key(self, source: Source) -> None:
+        """
+        Imports a Source's GPG key, unless a key with the source's fingerprint is already in the
+        keyring.
+
+        Since the keyring is looked up by the source's current fingerprint, a source whose
+        fingerprint has changed has its new key imported.
+        """
+        if not source.public_key:
+            raise CryptoError(f"Could not import key: source {source.uuid} has no key")
+        if source.fingerprint and self._is_in_keyring(source.fingerprint):
+            logger.debug("Key for source %s is already in the keyring", source.uuid)
+            return
+
+        logger.debug("Importing key for source %s", source.uuid)
+        self._import(source.public_key)
+        if source.fingerprint:
+            with self._keyring_lock:
+                if self._keyring_fingerprints is not None:
+                    self._keyring_fingerprints.add(source.fingerprint.upper())
+
+    def _is_in_keyring(self, fingerprint: str) -> bool:
+        with self._keyring_lock:
+            if self._keyring_fingerprints is None:
+                self._keyring_fingerprints = self._list_keyring_fingerprints()
+            return fingerprint.upper() in self._keyring_fingerprints
+
+    def _forget_key(self, fingerprint: str) -> None:
+        """
+        Stop assuming that the key with the given fingerprint is in the keyring, so that it is
+        imported again before it is next used.
+        """
+        with self._keyring_lock:
+            if self._keyring_fingerprints is not None:
+                self._keyring_fingerprints.discard(fingerprint.upper())
+
+    def _list_keyring_fingerprints(self) -> set[str]:
+        """
+        Return the fingerprints of the keys and subkeys in the keyring, or an empty set if they
+        cannot be listed, in which case keys are imported as before.
+        """
+        try:
+            return self.backend.list_fingerprints()
+        except CryptoError as e:
+            logger.debug(f"Could not list keys in the keyring: {e}")
+            return set()
+
+    def _import(self, key_data: str) -> None:
+        """Imports a key to the client keyring."""
+        self.backend.import_key(key_data)
+
     def encrypt_to_source(self, source_uuid: str, data: str) -> str:
         """
         :param data: A string of data to encrypt to a source.
         """
         session = self.session_maker()
-        source = session.query(Source).filter_by(uuid=source_uuid).one()
+        source = lookup_by_uuid(session, Source).params(uuid=source_uuid).one()
 
         # do not attempt to encrypt if the journalist key is missing
         if not self.journalist_key_fingerprint:
@@ -204,39 +706,9 @@ class GpgHelper:
         except CryptoError as e:
             raise CryptoError("Could not import key before encrypting reply: {e}") from e
 
-        cmd = self._gpg_cmd_base()
-
-        with (
-            tempfile.NamedTemporaryFile("w+") as content,
-            tempfile.NamedTemporaryFile("w+") as stdout,
-            tempfile.NamedTemporaryFile("w+") as stderr,
-        ):
-            content.write(data)
-            content.seek(0)
-
-            cmd.extend(
-                [
-                    "--encrypt",
-                    "-r",
-                    source.fingerprint,
-                    "-r",
-                    self.journalist_key_fingerprint,
-                    "--armor",
-                ]
-            )
-            if not self.is_qubes:
-                # In Qubes, the ciphertext will go to stdout.
-                # In addition the option below cannot be passed
-                # through the gpg client wrapper.
-                cmd.extend(["-o-"])  # write to stdout
-            cmd.extend([content.name])
-
-            try:
-                subprocess.check_call(cmd, stdout=stdout, stderr=stderr)
-            except subprocess.CalledProcessError as e:
-                stderr.seek(0)
-                err = stderr.read()
-                raise CryptoError(f"Could not encrypt to source {source_uuid}: {e}\n{err}")
-
-            stdout.seek(0)
-            return stdout.read()
+        try:
+            return self.backend.encrypt(data, [source.fingerprint, self.journalist_key_fingerprint])
+        except CryptoError as e:
+            # The key may have been removed from the keyring since it was imported
+            self._forget_key(source.fingerprint)
+            raise CryptoError(f"Could not encrypt to source {source_uuid}: {e}") from e
@@ -1,10 +1,25 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 # Copyright © 2022‒2023 The Freedom of the Press Foundation.
 
+import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from queue import Empty, SimpleQueue
+from typing import Any
+
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.session import Session
 
 from securedrop_client.db import File
-from securedrop_client.storage import get_local_files
+from securedrop_client.storage import (
+    delete_pending_deletion_on_disk,
+    get_local_files,
+    get_pending_deletions,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class Database:
@@ -16,3 +31,298 @@ class Database:
 
     def get_files(self) -> list[File]:
         return get_local_files(self.session)
+
+
+class _WriteCommand:
+    def __init__(self, func: Callable, args: tuple, kwargs: dict) -> None:
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+
+    def __repr__(self) -> str:
+        return f"_WriteCommand({self.func.__name__})"
+
+    def run(self, session: Session) -> Any:
+        return self.func(*self.args, session=session, commit=False, **self.kwargs)
+
+
+class DatabaseWriter:
+    """
+    Single writer for status updates to the local database.
+
+    Write commands can be submitted from any thread. They are executed in order on the writer's own
+    thread, and the commands that are already queued when a batch starts are committed together in
+    a single transaction. The writer never waits for more commands before committing, since callers
+    may be blocked on the result of the commands it has. Every other part of the client only needs
+    to read concurrently.
+
+    A write command is a storage function that accepts `session` and `commit` keyword arguments,
+    e.g. `storage.mark_as_downloaded`. The writer supplies its own session and defers the commit
+    to the end of the batch.
+    """
+
+    # Upper bound on the number of commands committed in a single transaction
+    MAX_BATCH_SIZE = 500
+
+    def __init__(self, session_maker: scoped_session) -> None:
+        self.session_maker = session_maker
+        self._commands: SimpleQueue[_WriteCommand | None] = SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Start the writer thread if it is not already running.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="DatabaseWriter", daemon=True)
+            self._thread.start()
+            logger.debug("Started database writer")
+
+    def stop(self) -> None:
+        """
+        Commit every command submitted so far and stop the writer thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._commands.put(None)
+        thread.join()
+        logger.debug("Stopped database writer")
+
+    def submit(self, func: Callable, *args: Any, **kwargs: Any) -> Future:
+        """
+        Queue a write command, starting the writer thread if needed.
+
+        Returns a Future that completes with the command's return value once its batch has been
+        committed, or with the exception it raised.
+        """
+        command = _WriteCommand(func, args, kwargs)
+        self.start()
+        self._commands.put(command)
+        return command.future
+
+    def _run(self) -> None:
+        session = self.session_maker()
+        try:
+            stopping = False
+            while not stopping:
+                command = self._commands.get()
+                if command is None:
+                    break
+
+                batch = [command]
+                while len(batch) < self.MAX_BATCH_SIZE:
+                    try:
+                        next_command = self._commands.get_nowait()
+                    except Empty:
+                        break
+                    if next_command is None:
+                        stopping = True
+                        break
+                    batch.append(next_command)
+
+                self._execute(session, batch)
+        finally:
+            session.close()
+
+    def _execute(self, session: Session, batch: list[_WriteCommand]) -> None:
+        """
+        Run the batch in one transaction. If any command fails, roll back and replay the commands
+        one transaction at a time so that a single bad command cannot fail the whole batch.
+        """
+        results = []
+        try:
+            for command in batch:
+                results.append(command.run(session))
+            session.commit()
+        except Exception as e:
+            logger.debug(f"Database write batch failed, retrying individually: {e}")
+            session.rollback()
+            for command in batch:
+                self._execute_one(session, command)
+            return
+
+        for command, result in zip(batch, results, strict=True):
+            command.future.set_result(result)
+        logger.debug(f"Committed {len(batch)} database writes")
+
+    def _execute_one(self, session: Session, command: _WriteCommand) -> None:
+        try:
+            result = command.run(session)
+            session.commit()
+        except Exception as e:
+            logger.error(f"Database write failed: {command}")
+            logger.debug(f"Database write failed: {command}: {e}")
+            session.rollback()
+            command.future.set_exception(e)
+        else:
+            command.future.set_result(result)
+
+
+class DatabaseMaintenance:
+    """
+    Keep the local database compact and its query planner statistics current.
+
+    Deleted sources and conversations leave free pages behind, so without maintenance the database
+    file only ever grows. Since the database uses `auto_vacuum = INCREMENTAL` (migration
+    6c8e6ac19d2b), free pages can be returned to the filesystem a few at a time with
+    `PRAGMA incremental_vacuum` instead of rewriting the whole file with `VACUUM`.
+
+    `run_if_due` is meant to be called when the client is idle between syncs. It runs maintenance
+    on a background thread at most once every INTERVAL_SECONDS, and each run stops starting new
+    steps once TIME_BUDGET_SECONDS have passed.
+    """
+
+    # Minimum time between maintenance runs
+    INTERVAL_SECONDS = 60 * 60
+
+    # Time after which a maintenance run stops starting new steps
+    TIME_BUDGET_SECONDS = 1.0
+
+    # Number of free pages to release per incremental vacuum step
+    VACUUM_PAGES_PER_STEP = 256
+
+    # Approximate number of rows ANALYZE examines per index, to bound its cost on large tables
+    ANALYSIS_LIMIT = 1000
+
+    def __init__(self, session_maker: scoped_session) -> None:
+        self.session_maker = session_maker
+        self._last_run: float | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def run_if_due(self) -> bool:
+        """
+        Start a maintenance run in the background unless one is already running or the last one
+        started less than INTERVAL_SECONDS ago. Returns True if a run was started.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            if self._last_run is not None and now - self._last_run < self.INTERVAL_SECONDS:
+                return False
+            self._last_run = now
+            self._thread = threading.Thread(
+                target=self.run, name="DatabaseMaintenance", daemon=True
+            )
+            self._thread.start()
+            return True
+
+    def run(self) -> None:
+        """
+        Release free pages, then refresh query planner statistics, within the time budget.
+        """
+        deadline = time.monotonic() + self.TIME_BUDGET_SECONDS
+        session = self.session_maker()
+        try:
+            before = self._get_stats(session)
+            logger.info(f"Database maintenance starting: {before}")
+
+            # `PRAGMA incremental_vacuum(N)` releases one page per step of the statement, and only
+            # executescript() steps a statement to completion in the sqlite3 module.
+            dbapi_connection = session.connection().connection
+            while time.monotonic() < deadline and self._get_freelist_count(session):
+                dbapi_connection.executescript(
+                    f"PRAGMA incremental_vacuum({self.VACUUM_PAGES_PER_STEP});"
+                )
+
+            if time.monotonic() < deadline:
+                session.execute(f"PRAGMA analysis_limit = {self.ANALYSIS_LIMIT}")
+                session.execute("ANALYZE")
+            session.execute("PRAGMA optimize")
+            session.commit()
+
+            after = self._get_stats(session)
+            logger.info(f"Database maintenance finished: {after}")
+        except Exception as e:
+            logger.error("Database maintenance failed")
+            logger.debug(f"Database maintenance failed: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+    def _get_freelist_count(self, session: Session) -> int:
+        return session.execute("PRAGMA freelist_count").scalar()
+
+    def _get_stats(self, session: Session) -> str:
+        page_size = session.execute("PRAGMA page_size").scalar()
+        page_count = session.execute("PRAGMA page_count").scalar()
+        freelist_count = self._get_freelist_count(session)
+        fragmentation = freelist_count / page_count if page_count else 0.0
+        return (
+            f"size {page_size * page_count} bytes, "
+            f"{freelist_count} of {page_count} pages free ({fragmentation:.1%})"
+        )
+
+
+class DiskDeleter:
+    """
+    Delete the files of deleted sources and submissions from disk in the background.
+
+    Deleting records only schedules their files for deletion by adding `PendingDeletion`
+    tombstones in the same transaction, so that a sync which deletes a source with gigabytes of
+    documents can commit straight away. The deleter removes the files on its own thread whenever
+    it is woken up. Tombstones that are left when the client exits are picked up again the next
+    time the deleter is woken up.
+    """
+
+    def __init__(self, session_maker: scoped_session, data_dir: str) -> None:
+        self.session_maker = session_maker
+        self.data_dir = data_dir
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def wake(self) -> None:
+        """
+        Delete everything that has been scheduled for deletion so far, starting the deleter thread
+        if needed.
+        """
+        with self._lock:
+            if self._stopping:
+                return
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="DiskDeleter", daemon=True)
+                self._thread.start()
+                logger.debug("Started disk deleter")
+            self._wakeup.set()
+
+    def stop(self) -> None:
+        """
+        Stop the deleter thread once it has finished the current deletion. Does not wait for it,
+        since the remaining tombstones are kept for the next run.
+        """
+        with self._lock:
+            self._stopping = True
+            self._wakeup.set()
+
+    def _run(self) -> None:
+        session = self.session_maker()
+        try:
+            while True:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                if self._stopping:
+                    break
+                self._delete_pending(session)
+        finally:
+            session.close()
+            logger.debug("Stopped disk deleter")
+
+    def _delete_pending(self, session: Session) -> None:
+        for pending_deletion in get_pending_deletions(session):
+            if self._stopping:
+                return
+            try:
+                delete_pending_deletion_on_disk(session, pending_deletion, self.data_dir)
+            except Exception as e:
+                logger.error("Could not delete files on disk")
+                logger.debug(f"Could not delete {pending_deletion.path}: {e}")
+                session.rollback()
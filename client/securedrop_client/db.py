@@ -6,6 +6,7 @@ from typing import Any
 from uuid import uuid4
 
 from sqlalchemy import (
+    DDL,
     Boolean,
     CheckConstraint,
     Column,
@@ -17,6 +18,7 @@ from sqlalchemy import (
     Text,
     UniqueConstraint,
     create_engine,
+    event,
     text,
 )
 from sqlalchemy.ext.declarative import declarative_base
@@ -197,6 +199,46 @@ class DeletedSource(Base):
         super().__init__(**kwargs)
 
 
+class PendingDeletion(Base):
+    """
+    Tombstone for a file or directory in the data directory that belongs to deleted records and
+    still has to be deleted from disk.
+
+    Tombstones are added in the same transaction that deletes the records, and removed by the
+    `DiskDeleter` once the path is gone, so deletions that are interrupted by the client exiting
+    are resumed the next time it starts.
+    """
+
+    __tablename__ = "pending_deletions"
+
+    id = Column(Integer, primary_key=True)
+    path = Column(Text, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"PendingDeletion ({self.path})"
+
+
+class QueuedJob(Base):
+    """
+    Journal entry for a job in the API job queue, so that the queue can be restored when the client
+    starts again after it exited or crashed.
+
+    Entries are added when a job is queued, marked as started when it starts running, and removed
+    once it has finished. A job that was started but did not finish is queued again on restore.
+    """
+
+    __tablename__ = "queued_jobs"
+    __table_args__ = (UniqueConstraint("job_type", "uuid", name="uq_queued_jobs_job_type_uuid"),)
+
+    id = Column(Integer, primary_key=True)
+    job_type = Column(String(64), nullable=False)
+    uuid = Column(String(36), nullable=False)
+    is_started = Column(Boolean(name="is_started"), nullable=False, server_default=text("0"))
+
+    def __repr__(self) -> str:
+        return f"QueuedJob ({self.job_type} {self.uuid})"
+
+
 class Message(Base):
     __tablename__ = "messages"
     __table_args__ = (
@@ -347,6 +389,10 @@ class File(Base):
     # This reflects read status stored on the server.
     is_read = Column(Boolean(name="is_read"), nullable=False, server_default=text("0"))
 
+    # When the file was last opened or downloaded, to evict the least recently used files when
+    # the decrypted files exceed the disk quota (see file_cache.FileCache).
+    last_opened_at = Column(DateTime, nullable=True)
+
     source_id = Column(Integer, ForeignKey("sources.id"), nullable=False)
     source = relationship(
         "Source", backref=backref("files", order_by=id, cascade="delete"), lazy="joined"
@@ -580,6 +626,9 @@ class DraftReply(Base):
     file_counter = Column(Integer, nullable=False)
     content = Column(Text)
 
+    # The reply encrypted to the source and the journalist, once it has been encrypted for sending
+    ciphertext = Column(Text)
+
     # This tracks the sending status of the reply.
     send_status_id = Column(Integer, ForeignKey("replysendstatuses.id"))
     send_status = relationship("ReplySendStatus")
@@ -683,3 +732,54 @@ class SeenReply(Base):
     journalist_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     reply = relationship("Reply", backref=backref("seen_replies", cascade="all,delete"))
     journalist = relationship("User", backref=backref("seen_replies"))
+
+
+# Full-text search index over the decrypted content of messages and replies and the original
+# filenames of decrypted files. Rows are written by the storage functions that store plaintext
+# (see storage.update_search_index) and removed by triggers, so that every deletion path, including
+# cascades from deleting a source, keeps the index consistent.
+#
+# Messages, replies and files each have their own id sequence, so an item's rowid in the index is
+# its id multiplied by SEARCH_INDEX_ROWID_STRIDE plus an offset for its type, so that updates and
+# deletes look rows up by rowid rather than scanning the index.
+SEARCH_INDEX_ROWID_STRIDE = 4
+SEARCH_INDEX_ROWID_OFFSETS = {"messages": 1, "replies": 2, "files": 3}
+
+
+def search_index_rowid(db_obj: Message | Reply | File) -> int:
+    """
+    Return the rowid of the object in the search index.
+    """
+    return db_obj.id * SEARCH_INDEX_ROWID_STRIDE + SEARCH_INDEX_ROWID_OFFSETS[db_obj.__tablename__]
+
+
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL(
+        """
+        CREATE VIRTUAL TABLE search_index USING fts5(
+            source_uuid UNINDEXED,
+            item_uuid UNINDEXED,
+            content,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        """
+    ),
+)
+for _table, _offset in SEARCH_INDEX_ROWID_OFFSETS.items():
+    event.listen(
+        Base.metadata,
+        "after_create",
+        DDL(
+            f"""
+            CREATE TRIGGER {_table}_search_index_delete AFTER DELETE ON {_table}
+            BEGIN
+                DELETE FROM search_index
+                WHERE rowid = old.id * {SEARCH_INDEX_ROWID_STRIDE} + {_offset};
+            END
+            """  # noqa: S608
+        ),
+    )
+event.listen(Base.metadata, "before_drop", DDL("DROP TABLE IF EXISTS search_index"))
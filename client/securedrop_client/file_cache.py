@@ -0,0 +1,92 @@
+import logging
+import os
+import shutil
+from collections.abc import Container
+from concurrent.futures import Future
+
+from sqlalchemy.orm.session import Session
+
+from securedrop_client import storage
+from securedrop_client.database import DatabaseWriter
+from securedrop_client.db import File
+
+logger = logging.getLogger(__name__)
+
+
+class FileCache:
+    """
+    Keep the files that have been downloaded and decrypted within a disk quota.
+
+    The data directory would otherwise only ever grow, since downloaded files stay on disk until
+    their source is deleted. The cache records when each file was last opened or downloaded, and
+    when the decrypted files take up more than `quota` bytes, evicts the least recently opened
+    ones: they are deleted from disk and marked as not downloaded, so that they can be downloaded
+    again on demand. A quota of 0 is unlimited.
+
+    Writes go through the database writer, and are not waited for.
+    """
+
+    def __init__(self, data_dir: str, quota: int, writer: DatabaseWriter) -> None:
+        self.data_dir = data_dir
+        self.quota = quota
+        self.writer = writer
+
+    def record_open(self, uuid: str) -> None:
+        """
+        Record that the file has just been opened or downloaded. Does not wait for the write.
+        """
+        self.writer.submit(storage.mark_file_as_opened, uuid)
+
+    def evict(self, session: Session, keep: Container[str] = ()) -> "Future[list[File]]":
+        """
+        Evict the least recently opened files until the decrypted files fit within the quota,
+        passing over the files whose uuid is in `keep`. Returns a Future that completes with the
+        evicted files once they have been marked as not downloaded.
+        """
+        eviction: Future[list[File]] = Future()
+        if self.quota <= 0:
+            eviction.set_result([])
+            return eviction
+        files = storage.get_least_recently_opened_files(session)
+        excess = sum(file.size for file in files) - self.quota
+        if excess <= 0:
+            eviction.set_result([])
+            return eviction
+
+        evicted = []
+        for file in files:
+            if excess <= 0:
+                break
+            if file.uuid in keep or not self._delete_on_disk(file):
+                continue
+            excess -= file.size
+            evicted.append(file)
+
+        if not evicted:
+            eviction.set_result([])
+            return eviction
+
+        # The writer runs commands in order, so once the last write is done so are the others
+        for file in evicted:
+            write = self.writer.submit(storage.mark_as_not_downloaded, file.uuid)
+        write.add_done_callback(lambda write: eviction.set_result(evicted))
+
+        logger.info(f"Evicted {len(evicted)} files to stay within the disk quota")
+        return eviction
+
+    def _delete_on_disk(self, file: File) -> bool:
+        """
+        Delete the file's folder, which also contains the encrypted download. This is done straight
+        away rather than through the DiskDeleter, since downloading the file again reuses the
+        folder. Returns False if the folder could not be deleted.
+        """
+        folder = os.path.dirname(file.location(self.data_dir))
+        try:
+            shutil.rmtree(folder)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error("Could not delete evicted file")
+            logger.debug(f"Could not delete evicted file {file.uuid}: {e}")
+            return False
+        return True
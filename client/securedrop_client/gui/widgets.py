@@ -47,6 +47,7 @@ from PyQt5.QtWidgets import (
     QGridLayout,
     QHBoxLayout,
     QLabel,
+    QLineEdit,
     QListWidget,
     QListWidgetItem,
     QMenu,
@@ -431,15 +432,14 @@ class ErrorStatusBar(QWidget):
 
 class InnerTopPane(QWidget):
     """
-    Top pane of the MainView window. This pane holds the Batch Action layout,
-    and eventually will hold the keyword search/filter by codename bar.
+    Top pane of the MainView window. This pane holds the Batch Action layout and the keyword
+    search bar.
     """
 
     def __init__(self) -> None:
         super().__init__()
         self.setObjectName("InnerTopPane")
 
-        # Use a vertical layout so that the keyword search bar can be added later
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
         layout.setSpacing(0)
@@ -450,6 +450,12 @@ class InnerTopPane(QWidget):
         self.batch_actions = BatchActionWidget()
         layout.addWidget(self.batch_actions)
 
+        self.search_box = QLineEdit()
+        self.search_box.setObjectName("SearchBox")
+        self.search_box.setPlaceholderText(_("Search sources and conversations"))
+        self.search_box.setClearButtonEnabled(True)
+        layout.addWidget(self.search_box)
+
     def setup(self, controller: Controller) -> None:
         self.batch_actions.setup(controller)
 
@@ -755,6 +761,9 @@ class MainView(QWidget):
     MULTI_SELECTED_INDEX = 2
     CONVERSATION_INDEX = 3
 
+    # How long to wait after the user stops typing in the search box before searching
+    SEARCH_DELAY_MS = 250
+
     def __init__(
         self,
         parent: Optional[QWidget],
@@ -773,9 +782,13 @@ class MainView(QWidget):
         self._layout.setSpacing(0)
         self.setLayout(self._layout)
 
-        # Top Pane to hold batch actions, eventually will also hold
-        # search bar for keyword filtering
+        # Top Pane to hold batch actions and the search bar for keyword filtering
         self.top_pane = InnerTopPane()
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.search)
+        self.top_pane.search_box.textChanged.connect(self.search_timer.start)
 
         # Hold main conversation view and sourcelist
         inner_container = QHBoxLayout()
@@ -833,12 +846,39 @@ class MainView(QWidget):
         self.source_list.setup(controller)
         self.top_pane.setup(controller)
 
+        # Decrypting a message, reply or file, or sending a reply, changes the search index
+        self.controller.message_ready.connect(self.refresh_search)
+        self.controller.reply_ready.connect(self.refresh_search)
+        self.controller.reply_succeeded.connect(self.refresh_search)
+        self.controller.file_ready.connect(self.refresh_search)
+        self.controller.file_missing.connect(self.refresh_search)
+
     def set_logged_out(self) -> None:
         """
         Logged-out context. Called by parent.
         """
         self.top_pane.set_logged_out()
 
+    @pyqtSlot()
+    def search(self) -> None:
+        """
+        Filter the source list by the text in the search box.
+        """
+        search_text = self.top_pane.search_box.text()
+        matching_source_uuids = []
+        if search_text.strip():
+            matching_source_uuids = self.controller.search_sources(search_text)
+        self.source_list.filter_sources(search_text, matching_source_uuids)
+
+    @pyqtSlot()
+    def refresh_search(self) -> None:
+        """
+        Re-apply an active search after the search index changed. The timer coalesces the bursts
+        of updates that a sync or a batch of decryptions makes into one search.
+        """
+        if self.top_pane.search_box.text().strip():
+            self.search_timer.start()
+
     def set_logged_in(self) -> None:
         """
         Logged-in context. Called by parent.
@@ -859,6 +899,9 @@ class MainView(QWidget):
                 # Then call the function to remove the wrapper and its children.
                 self.delete_conversation(source_uuid)
 
+        # The sync that updated the sources may also have changed the search index
+        self.refresh_search()
+
         # Show the correct conversation pane gui element depending on
         # the number of sources a) available and b) selected.
         # An improved approach will be to create an `on_source_context_update`
@@ -1176,6 +1219,10 @@ class SourceList(QListWidget):
         # To hold references to SourceListWidgetItem instances indexed by source UUID.
         self.source_items: dict[str, SourceListWidgetItem] = {}
 
+        # Current search filter, see filter_sources
+        self.search_text = ""
+        self.matching_source_uuids: set[str] = set()
+
         self.itemSelectionChanged.connect(self._on_item_selection_changed)
 
     def resizeEvent(self, event: QResizeEvent) -> None:
@@ -1246,6 +1293,7 @@ class SourceList(QListWidget):
             self.insertItem(0, source_item)
             self.setItemWidget(source_item, source_widget)
             self.source_items[uuid] = source_item
+            self._apply_search_filter(source_item, source_widget)
             self.adjust_preview.emit(self.width() - self.INITIAL_UPDATE_SCROLLBAR_WIDTH)
 
         # Re-sort SourceList to make sure the most recently-updated sources appear at the top
@@ -1285,6 +1333,7 @@ class SourceList(QListWidget):
                     self.insertItem(0, source_item)
                     self.setItemWidget(source_item, source_widget)
                     self.source_items[source_uuid] = source_item
+                    self._apply_search_filter(source_item, source_widget)
                 except sqlalchemy.exc.InvalidRequestError as e:
                     logger.debug(e)
 
@@ -1302,6 +1351,30 @@ class SourceList(QListWidget):
         # Qt event loop (thus unblocking the UI).
         QTimer.singleShot(1, schedule_source_management)
 
+    def filter_sources(self, search_text: str, matching_source_uuids: list[str]) -> None:
+        """
+        Show only the sources whose designation contains the search text or whose uuid is in
+        matching_source_uuids. An empty search text shows every source.
+        """
+        self.search_text = search_text.strip().casefold()
+        self.matching_source_uuids = set(matching_source_uuids)
+        for source_item in self.source_items.values():
+            source_widget = self.itemWidget(source_item)
+            if isinstance(source_widget, SourceWidget):
+                self._apply_search_filter(source_item, source_widget)
+
+    def _apply_search_filter(
+        self, source_item: SourceListWidgetItem, source_widget: SourceWidget
+    ) -> None:
+        if not self.search_text:
+            source_item.setHidden(False)
+            return
+
+        source_item.setHidden(
+            source_widget.source_uuid not in self.matching_source_uuids
+            and self.search_text not in source_widget.name.text().casefold()
+        )
+
     def get_selected_source(self) -> Optional[Source]:
         # if len == 0, return None
         if not self.selectedItems():
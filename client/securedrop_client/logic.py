@@ -22,6 +22,8 @@ import inspect
 import logging
 import os
 import uuid
+from collections.abc import Callable, Container
+from concurrent.futures import Future
 from datetime import datetime
 from gettext import gettext as _
 from gettext import ngettext
@@ -34,6 +36,7 @@ from sqlalchemy.orm.session import sessionmaker
 from securedrop_client import db, sdk, state, storage
 from securedrop_client.api_jobs.base import ApiInaccessibleError
 from securedrop_client.api_jobs.downloads import (
+    DecryptionStage,
     DownloadChecksumMismatchException,
     DownloadDecryptionException,
     DownloadException,
@@ -54,15 +57,20 @@ from securedrop_client.api_jobs.updatestar import (
     UpdateStarJobTimeoutError,
 )
 from securedrop_client.api_jobs.uploads import (
+    ReplyEncryptor,
     SendReplyJob,
     SendReplyJobError,
     SendReplyJobTimeoutError,
 )
+from securedrop_client.config import Config
 from securedrop_client.crypto import GpgHelper
-from securedrop_client.queue import ApiJobQueue
+from securedrop_client.database import DatabaseMaintenance, DatabaseWriter, DiskDeleter
+from securedrop_client.file_cache import FileCache
+from securedrop_client.prefetch import PrefetchPolicy
+from securedrop_client.queue import ApiJobQueue, JobJournal
 from securedrop_client.sdk import AuthError, RequestTimeoutError, ServerConnectionError
 from securedrop_client.sync import ApiSync
-from securedrop_client.utils import check_dir_permissions
+from securedrop_client.utils import check_dir_permissions, lookup_by_uuid
 
 logger = logging.getLogger(__name__)
 
@@ -310,6 +318,15 @@ class Controller(QObject):
     """
     add_job = pyqtSignal("PyQt_PyObject")
 
+    """
+    This signal carries the result of a database write back to the GUI thread, see _when_written.
+
+    Emits:
+        Future: the completed write
+        Callable: the callback to call with it
+    """
+    _write_done = pyqtSignal(object, object)
+
     def __init__(  # type: ignore[no-untyped-def]
         self,
         hostname: str,
@@ -377,23 +394,60 @@ class Controller(QObject):
         self.session_maker = session_maker
         self.session = session_maker()
 
+        # Single writer for download and decryption status updates, shared by all threads
+        self.database_writer = DatabaseWriter(self.session_maker)
+
+        self.gpg = GpgHelper(home, self.session_maker, proxy)
+
+        # Decrypts downloaded messages, replies and files while the queues go on downloading
+        self.decryption_stage = DecryptionStage(
+            self.session_maker, num_workers=self.gpg.num_decryption_workers
+        )
+
+        # Encrypts replies as soon as they are sent, then queues them to be uploaded
+        self.reply_encryptor = ReplyEncryptor(self.session_maker, self.gpg)
+        self.reply_encryptor.encrypted.connect(self.add_job)
+        self._write_done.connect(self._on_write_done)
+
+        # Compacts and re-analyzes the database while the client is idle between syncs
+        self.database_maintenance = DatabaseMaintenance(self.session_maker)
+
         # Queue that handles running API job
         self.api_job_queue = ApiJobQueue(
-            self.api, self.session_maker, self.main_queue_thread, self.file_download_queue_thread
+            self.api,
+            self.session_maker,
+            self.main_queue_thread,
+            self.file_download_queue_thread,
+            JobJournal(self.database_writer),
         )
         self.api_job_queue.cleared.connect(self.on_queue_cleared)
         self.api_job_queue.paused.connect(self.on_queue_paused)
+        self.api_job_queue.resumed.connect(self.on_queue_resumed)
         self.api_job_queue.main_queue_updated.connect(self._on_main_queue_updated)
         self.add_job.connect(self.api_job_queue.enqueue)
+        if self._state is not None:
+            self._state.selected_conversation_changed.connect(self.on_selected_conversation_changed)
 
         # Contains active threads calling the API.
         self.api_threads = {}  # type: dict[str, dict]
 
-        self.gpg = GpgHelper(home, self.session_maker, proxy)
-
         # File data.
         self.data_dir = os.path.join(self.home, "data")
 
+        # Deletes the files of deleted sources and submissions from disk in the background
+        self.disk_deleter = DiskDeleter(self.session_maker, self.data_dir)
+
+        config = Config.load()
+
+        # Evicts the least recently opened files when the downloaded files exceed the disk quota
+        self.file_cache = FileCache(self.data_dir, config.file_cache_quota, self.database_writer)
+
+        # Chooses files to download while the queues are idle, or None if prefetching is disabled
+        self.prefetch_policy = PrefetchPolicy.from_config(config)
+
+        # Files that failed to prefetch or were evicted, so that they are not prefetched again
+        self._prefetch_skipped: set[str] = set()
+
         # Background sync to keep client up-to-date with server changes
         self.api_sync = ApiSync(
             self.api, self.session_maker, self.gpg, self.data_dir, self.sync_thread, state
@@ -458,6 +512,9 @@ class Controller(QObject):
 
         storage.clear_download_errors(self.session)
 
+        # Resume any deletions on disk that were interrupted when the client last exited
+        self.disk_deleter.wake()
+
     def call_api(  # type: ignore[no-untyped-def]
         self,
         api_call_func,
@@ -505,6 +562,10 @@ class Controller(QObject):
             _("The SecureDrop server cannot be reached. Trying to reconnect..."), duration=0
         )
 
+    def on_queue_resumed(self) -> None:
+        # The queues resumed on their own, so the error shown when they paused no longer applies
+        self.gui.clear_error_status()
+
     def resume_queues(self) -> None:
         self.api_job_queue.resume_queues()
 
@@ -576,6 +637,7 @@ class Controller(QObject):
         self.gui.show_main_window(user)
         self.update_sources()
         self.api_job_queue.start(self.api)
+        self.restore_queued_jobs()
         self.api_sync.start(self.api)
 
     def on_authenticate_failure(self, result: Exception) -> None:
@@ -647,16 +709,22 @@ class Controller(QObject):
         Called when synchronization of data via the API queue succeeds.
 
             * Set last sync flag
+            * Evict the least recently opened files if the decrypted files exceed the disk quota
+            * Delete files of sources and submissions that were deleted during the sync
             * Download new messages and replies
             * Update missing files so that they can be re-downloaded
             * Update authenticated user if name changed
             * Resume queues if they were paused because of a network error since syncing was
               successful
+            * Run database maintenance and prefetch files if nothing else is queued
         """
         with open(self.last_sync_filepath, "w") as f:
             f.write(arrow.now().format())
         self.show_last_sync()
 
+        self.evict_files()
+        self.disk_deleter.wake()
+
         missing_files = storage.update_missing_files(self.data_dir, self.session)
         for missed_file in missing_files:
             self.file_missing.emit(missed_file.source.uuid, missed_file.uuid, str(missed_file))
@@ -683,6 +751,10 @@ class Controller(QObject):
 
         self.resume_queues()
 
+        if self.api_job_queue.is_idle() and self.decryption_stage.is_idle():
+            self.database_maintenance.run_if_due()
+            self.prefetch_if_idle()
+
     def on_sync_failure(self, result: Exception) -> None:
         """
         Called when synchronization of data via the API fails after a background sync. If the reason
@@ -759,7 +831,7 @@ class Controller(QObject):
             if not files and not messages and not replies:
                 return
 
-            job = SeenJob(files, messages, replies)
+            job = SeenJob(files, messages, replies, source.uuid)
             job.success_signal.connect(self.on_seen_success)
             job.failure_signal.connect(self.on_seen_failure)
             self.add_job.emit(job)
@@ -778,7 +850,7 @@ class Controller(QObject):
     def on_update_star_failure(self, error: UpdateStarJobError | UpdateStarJobTimeoutError) -> None:
         if isinstance(error, UpdateStarJobError):
             self.gui.update_error_status(_("Failed to update star."))
-            source = self.session.query(db.Source).filter_by(uuid=error.source_uuid).one()
+            source = lookup_by_uuid(self.session, db.Source).params(uuid=error.source_uuid).one()
             self.star_update_failed.emit(error.source_uuid, source.is_starred)
 
     @login_required
@@ -825,25 +897,76 @@ class Controller(QObject):
 
     @login_required
     def _submit_download_job(
-        self, object_type: type[db.Reply] | type[db.Message] | type[db.File], uuid: str
+        self,
+        object_type: type[db.Reply] | type[db.Message] | type[db.File],
+        uuid: str,
+        source_uuid: str | None = None,
     ) -> None:
         if object_type == db.Reply:
             job: ReplyDownloadJob | MessageDownloadJob | FileDownloadJob = ReplyDownloadJob(
-                uuid, self.data_dir, self.gpg
+                uuid,
+                self.data_dir,
+                self.gpg,
+                self.database_writer,
+                self.decryption_stage,
+                source_uuid=source_uuid,
             )
             job.success_signal.connect(self.on_reply_download_success)
             job.failure_signal.connect(self.on_reply_download_failure)
         elif object_type == db.Message:
-            job = MessageDownloadJob(uuid, self.data_dir, self.gpg)
+            job = MessageDownloadJob(
+                uuid,
+                self.data_dir,
+                self.gpg,
+                self.database_writer,
+                self.decryption_stage,
+                source_uuid=source_uuid,
+            )
             job.success_signal.connect(self.on_message_download_success)
             job.failure_signal.connect(self.on_message_download_failure)
         elif object_type == db.File:
-            job = FileDownloadJob(uuid, self.data_dir, self.gpg)
+            # The size lets the file download queue schedule small files first
+            file = storage.get_file(self.session, uuid)
+            job = FileDownloadJob(
+                uuid,
+                self.data_dir,
+                self.gpg,
+                self.database_writer,
+                self.decryption_stage,
+                source_uuid=file.source.uuid if file else source_uuid,
+                size=file.size if file else None,
+            )
             job.success_signal.connect(self.on_file_download_success)
             job.failure_signal.connect(self.on_file_download_failure)
 
         self.add_job.emit(job)
 
+    def restore_queued_jobs(self) -> None:
+        """
+        Queue the downloads that were recorded in the job journal when the client last ran, so that
+        they resume straight away instead of after the first sync.
+        """
+        restored = 0
+        for queued_job in storage.get_queued_jobs(self.session):
+            object_type = JobJournal.OBJECT_TYPES.get(queued_job.job_type)
+            db_object = (
+                lookup_by_uuid(self.session, object_type).params(uuid=queued_job.uuid).one_or_none()
+                if object_type
+                else None
+            )
+            if object_type is None or db_object is None or db_object.is_decrypted:
+                # Deleted or already downloaded since it was queued
+                self.database_writer.submit(
+                    storage.delete_queued_job, queued_job.job_type, queued_job.uuid
+                )
+                continue
+
+            self._submit_download_job(object_type, db_object.uuid, db_object.source.uuid)
+            restored += 1
+
+        if restored:
+            logger.info(f"Restored {restored} queued jobs")
+
     def download_new_messages(self) -> None:
         new_messages = storage.find_new_messages(self.session)
 
@@ -853,7 +976,7 @@ class Controller(QObject):
                     f"Download of message {message.uuid} failed since client start; not retrying."
                 )
             else:
-                self._submit_download_job(type(message), message.uuid)
+                self._submit_download_job(type(message), message.uuid, message.source.uuid)
 
     def on_message_download_success(self, uuid: str) -> None:
         """
@@ -896,7 +1019,7 @@ class Controller(QObject):
                     f"Download of reply {reply.uuid} failed since client start; not retrying."
                 )
             else:
-                self._submit_download_job(type(reply), reply.uuid)
+                self._submit_download_job(type(reply), reply.uuid, reply.source.uuid)
 
     def on_reply_download_success(self, uuid: str) -> None:
         """
@@ -964,6 +1087,8 @@ class Controller(QObject):
         if not self.downloaded_file_exists(file):
             return
 
+        self.file_cache.record_open(file.uuid)
+
         if not self.qubes:
             return
 
@@ -972,6 +1097,14 @@ class Controller(QObject):
         process = QProcess(self)
         process.start(command, args)
 
+    @pyqtSlot()
+    def on_selected_conversation_changed(self) -> None:
+        """
+        Run the queued downloads of the selected conversation before other downloads.
+        """
+        selected = self._state.selected_conversation
+        self.api_job_queue.focus_source(str(selected) if selected is not None else None)
+
     @login_required
     def on_submission_download(
         self, submission_type: type[db.File] | type[db.Message], submission_uuid: str
@@ -993,12 +1126,116 @@ class Controller(QObject):
             logger.debug(f"File {uuid} downloaded but uuid missing from database")
             return
 
-        file_obj.download_error = None
-        storage.update_file_size(uuid, self.data_dir, self.session)
+        write = self.database_writer.submit(storage.update_file_size, uuid, self.data_dir)
+        self._when_written(write, functools.partial(self._on_file_size_updated, uuid))
+
+    def _on_file_size_updated(self, uuid: str, write: Future) -> None:
+        """
+        Called once the size of a downloaded file has been updated, to show the file as downloaded.
+        """
+        if write.exception() is not None:
+            logger.error("Could not update the size of a downloaded file")
+            logger.debug(f"Could not update the size of file {uuid}: {write.exception()}")
+        file_obj = storage.get_file(self.session, uuid)
+        if not file_obj:
+            return
+        self.session.refresh(file_obj)
         self._state.record_file_download(state.FileId(uuid))
 
         self.file_ready.emit(file_obj.source.uuid, uuid, file_obj.filename)
 
+        self.file_cache.record_open(uuid)
+        self.evict_files(keep={uuid})
+
+    def _when_written(self, write: Future, callback: Callable[[Future], None]) -> None:
+        """
+        Call callback with the database write on the GUI thread once the write has completed,
+        instead of blocking the GUI thread until the writer gets to it.
+        """
+        write.add_done_callback(lambda write: self._write_done.emit(write, callback))
+
+    @pyqtSlot(object, object)
+    def _on_write_done(self, write: Future, callback: Callable[[Future], None]) -> None:
+        callback(write)
+
+    def evict_files(self, keep: Container[str] = ()) -> None:
+        """
+        Evict the least recently opened files other than those in `keep` if the decrypted files
+        exceed the disk quota, and update the GUI to show them as not downloaded once they are
+        marked as such.
+        """
+        try:
+            eviction = self.file_cache.evict(self.session, keep)
+        except Exception as e:
+            logger.error("Could not evict files")
+            logger.debug(f"Could not evict files: {e}")
+            self.session.rollback()
+            return
+
+        self._when_written(eviction, self._on_files_evicted)
+
+    def _on_files_evicted(self, eviction: Future) -> None:
+        try:
+            evicted = eviction.result()
+        except Exception as e:
+            logger.error("Could not evict files")
+            logger.debug(f"Could not evict files: {e}")
+            self.session.rollback()
+            return
+
+        for file in evicted:
+            self.session.expire(file)
+            self._prefetch_skipped.add(file.uuid)
+            self.file_missing.emit(file.source.uuid, file.uuid, str(file))
+
+    def prefetch_if_idle(self) -> None:
+        """
+        If prefetching is enabled and no job is queued, running or decrypting, queue the download
+        of the next file chosen by the prefetch policy. Files are prefetched one at a time, and any
+        other job that is queued pre-empts the prefetch until the queues are idle again.
+        """
+        if self.prefetch_policy is None or not self.api:
+            return
+        if not (self.api_job_queue.is_idle() and self.decryption_stage.is_idle()):
+            return
+
+        file = self.prefetch_policy.next_file(self.session, skip=self._prefetch_skipped)
+        if file is None:
+            return
+
+        logger.debug(f"Prefetching file {file.uuid}")
+        job = FileDownloadJob(
+            file.uuid,
+            self.data_dir,
+            self.gpg,
+            self.database_writer,
+            self.decryption_stage,
+            source_uuid=file.source.uuid,
+            size=file.size,
+            prefetch=True,
+        )
+        job.success_signal.connect(self.on_prefetch_success)
+        job.failure_signal.connect(self.on_prefetch_failure)
+        self.add_job.emit(job)
+
+    def on_prefetch_success(self, uuid: str) -> None:
+        """
+        Called when a file has been prefetched. Update it as if the user had downloaded it, then
+        prefetch the next file.
+        """
+        self.on_file_download_success(uuid)
+        self.prefetch_if_idle()
+
+    def on_prefetch_failure(self, exception: Exception) -> None:
+        """
+        Called when a file fails to prefetch. The user did not ask for the file, so the failure is
+        only logged, and the file is left for the user to download.
+        """
+        logger.warning("Failed to prefetch file")
+        logger.debug(f"Failed to prefetch file: {exception}")
+        if isinstance(exception, DownloadException):
+            self._prefetch_skipped.add(exception.uuid)
+
     def on_file_download_failure(self, exception: Exception) -> None:
         """
         Called when a file fails to download.
@@ -1033,6 +1270,7 @@ class Controller(QObject):
 
         # Delete conversation locally to ensure that it does not remain on disk until next sync
         storage.delete_local_conversation_by_source_uuid(self.session, uuid, self.data_dir)
+        self.disk_deleter.wake()
         self.conversation_deletion_successful.emit(uuid, datetime.utcnow())
 
     def on_delete_conversation_failure(self, e: Exception) -> None:
@@ -1049,6 +1287,7 @@ class Controller(QObject):
         """
         logger.info("Source %s successfully scheduled for deletion at server", source_uuid)
         storage.delete_local_source_by_uuid(self.session, source_uuid, self.data_dir)
+        self.disk_deleter.wake()
         self.update_sources()
 
     def on_delete_source_failure(self, e: Exception) -> None:
@@ -1067,6 +1306,7 @@ class Controller(QObject):
         synchronize the server records with the local state. If not,
         the failure handler will display an error.
         """
+        deleted_source_uuids = set()
         for source in sources:
             try:
                 # Accessing source.uuid requires the source object to be
@@ -1077,13 +1317,18 @@ class Controller(QObject):
                 job = DeleteSourceJob(source.uuid)
             except sqlalchemy.orm.exc.ObjectDeletedError:
                 logger.warning("DeleteSourceJob requested but source already deleted")
-                return
+                break
 
             job.success_signal.connect(self.on_delete_source_success)
             job.failure_signal.connect(self.on_delete_source_failure)
 
             self.add_job.emit(job)
             self.source_deleted.emit(source.uuid)
+            deleted_source_uuids.add(source.uuid)
+
+        # Queued work for the deleted sources would only waste requests
+        if deleted_source_uuids:
+            self.api_job_queue.cancel_jobs_for_sources(deleted_source_uuids)
 
     @login_required
     def delete_conversation(self, source: db.Source) -> None:
@@ -1101,6 +1346,7 @@ class Controller(QObject):
 
         self.add_job.emit(job)
         self.conversation_deleted.emit(source.uuid)
+        self.api_job_queue.cancel_jobs_for_sources({source.uuid}, conversation_only=True)
 
     @login_required
     def download_conversation(self, id: state.ConversationId) -> None:
@@ -1110,10 +1356,7 @@ class Controller(QObject):
         for file in files:
             if not file.is_downloaded:
                 download_count += 1
-                job = FileDownloadJob(str(file.id), self.data_dir, self.gpg)
-                job.success_signal.connect(self.on_file_download_success)
-                job.failure_signal.connect(self.on_file_download_failure)
-                self.add_job.emit(job)
+                self._submit_download_job(db.File, str(file.id), str(id))
                 self.file_download_started.emit(file.id)
         logger.debug(
             f"Downloaded {download_count} files, {file_count - download_count} were already downloaded (total: {file_count} files)"  # noqa: E501
@@ -1129,7 +1372,7 @@ class Controller(QObject):
             logger.error(f"Sender of reply {reply_uuid} has been deleted")
             return
 
-        source = self.session.query(db.Source).filter_by(uuid=source_uuid).one_or_none()
+        source = lookup_by_uuid(self.session, db.Source).params(uuid=source_uuid).one_or_none()
         if not source:
             logger.error("Cannot send a reply to a source account that has been deleted")
             self.update_sources()  # Refresh source list to remove deleted source widget
@@ -1154,11 +1397,12 @@ class Controller(QObject):
         self.session.add(draft_reply)
         self.session.commit()
 
+        # The job is queued once the reply has been encrypted, see ReplyEncryptor
         job = SendReplyJob(source_uuid, reply_uuid, message, self.gpg)
         job.success_signal.connect(self.on_reply_success)
         job.failure_signal.connect(self.on_reply_failure)
 
-        self.add_job.emit(job)
+        self.reply_encryptor.submit(job)
 
     def on_reply_success(self, reply_uuid: str) -> None:
         logger.info(f"{reply_uuid} sent successfully")
@@ -1192,6 +1436,14 @@ class Controller(QObject):
         self.session.refresh(file)
         return file
 
+    def search_sources(self, text: str) -> list[str]:
+        """
+        Return the uuids of the sources with messages, replies or files that match the search
+        text, best match first.
+        """
+        results = storage.search(self.session, text)
+        return list(dict.fromkeys(source_uuid for source_uuid, _item_uuid in results))
+
     def on_logout_success(self, result: Exception) -> None:
         logging.info("Client logout successful")
 
@@ -0,0 +1,62 @@
+import logging
+from collections.abc import Container
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm.session import Session
+
+from securedrop_client import storage
+from securedrop_client.config import Config
+from securedrop_client.db import File
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefetchPolicy:
+    """
+    Choose the files to download and decrypt in the background while the client is idle, so that
+    opening a document does not have to wait for the download and decryption.
+
+    Only files of at most `max_file_size` bytes from sources with activity in the last
+    `recency_days` days are prefetched, the files of the most recently active sources first, and
+    only as long as the downloaded files take up at most `disk_budget` bytes in total. The budget
+    is capped at the quota of the file cache, so that prefetching never evicts files.
+    """
+
+    # Number of candidate files to consider each time a file is chosen
+    MAX_CANDIDATES = 100
+
+    max_file_size: int
+    disk_budget: int
+    recency_days: int
+
+    @classmethod
+    def from_config(cls, config: Config) -> "PrefetchPolicy | None":
+        """
+        Return the policy configured by `config`, or None if prefetching is disabled.
+        """
+        if config.prefetch_max_file_size <= 0:
+            return None
+        disk_budget = config.prefetch_disk_budget
+        if config.file_cache_quota > 0:
+            disk_budget = min(disk_budget, config.file_cache_quota)
+        return cls(config.prefetch_max_file_size, disk_budget, config.prefetch_recency_days)
+
+    def next_file(self, session: Session, skip: Container[str] = ()) -> File | None:
+        """
+        Return the next file to prefetch, or None if there is none within the policy's limits.
+        Files whose uuid is in `skip` are passed over.
+        """
+        remaining = self.disk_budget - storage.get_downloaded_files_size(session)
+        if remaining <= 0:
+            return None
+
+        active_since = datetime.utcnow() - timedelta(days=self.recency_days)
+        candidates = storage.get_files_to_prefetch(
+            session, min(self.max_file_size, remaining), active_since, self.MAX_CANDIDATES
+        )
+        for file in candidates:
+            if file.uuid not in skip:
+                return file
+        return None
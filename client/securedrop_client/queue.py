@@ -1,12 +1,19 @@
+import functools
+import heapq
 import itertools
 import logging
 import threading
-from queue import PriorityQueue
-from typing import Any
+import time
+from collections import Counter, defaultdict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from queue import Empty, PriorityQueue
+from typing import Any, TypeGuard
 
 from PyQt5.QtCore import QObject, QThread, pyqtBoundSignal, pyqtSignal, pyqtSlot
 from sqlalchemy.orm import scoped_session
 
+from securedrop_client import storage
 from securedrop_client.api_jobs.base import (
     DEFAULT_NUM_ATTEMPTS,
     ApiInaccessibleError,
@@ -14,8 +21,10 @@ from securedrop_client.api_jobs.base import (
     ClearQueueJob,
     PauseQueueJob,
     QueueJob,
+    RetryLaterError,
 )
 from securedrop_client.api_jobs.downloads import (
+    DownloadJob,
     FileDownloadJob,
     MessageDownloadJob,
     ReplyDownloadJob,
@@ -24,41 +33,466 @@ from securedrop_client.api_jobs.seen import SeenJob
 from securedrop_client.api_jobs.sources import DeleteConversationJob, DeleteSourceJob
 from securedrop_client.api_jobs.updatestar import UpdateStarJob
 from securedrop_client.api_jobs.uploads import SendReplyJob
+from securedrop_client.config import Config
+from securedrop_client.database import DatabaseWriter
+from securedrop_client.db import File, Message, Reply
 from securedrop_client.sdk import API, RequestTimeoutError, ServerConnectionError
+from securedrop_client.utils import backoff_delay
 
 logger = logging.getLogger(__name__)
 
 
 class RunnablePriorityQueue(PriorityQueue):
     """
-    Wrapper class around PriorityQueue that emits a signal when message or reply
-    download jobs are enqueued or dequeued.
+    Wrapper class around PriorityQueue that emits a signal when the number of queued message or
+    reply download jobs changes.
+
+    Queued jobs are kept in one heap per job type, so that the highest priority job of a type that
+    is allowed to run can be found without scanning jobs of other types, and counting jobs of a type
+    is cheap. They are also counted in a hash index, so that checking whether a job is already
+    queued does not have to scan the heaps. Jobs that can be merged with later jobs are indexed by
+    their coalesce key (see QueueJob.coalesce_key), so that the job to merge into is found without
+    scanning either, and prefetch jobs are counted, so that cancelling them when there are none is
+    free.
+
+    Jobs that are to be retried after a backoff delay (see put_delayed) wait in a separate heap,
+    ordered by the time they are due, and are moved to the heap of their type once they are due.
+    Until then they count as queued, but are not returned by get_eligible.
+
+    The signal is emitted at most once every UPDATE_INTERVAL_SECONDS, so that a burst of thousands
+    of jobs does not send thousands of updates to the GUI. Changes made in between are coalesced
+    into a single emission of the latest count at the end of the interval.
     """
 
+    # Minimum time between emissions of queue_updated_signal
+    UPDATE_INTERVAL_SECONDS = 0.25
+
     def __init__(
         self, *args: Any, queue_updated_signal: pyqtBoundSignal | None = None, **kwargs: Any
     ):
         self.queue_updated_signal = queue_updated_signal
+        self._last_update_time = float("-inf")
+        self._last_update_count: int | None = None
+        self._update_timer: threading.Timer | None = None
+        self._update_lock = threading.Lock()
         super().__init__(*args, **kwargs)
 
-    def get(self, *args: Any, **kwargs: Any) -> tuple[int, QueueJob]:
+    def __contains__(self, job: QueueJob) -> bool:
+        """
+        Return True if a job equal to the given job is queued. Jobs that are equal, such as
+        download jobs for the same item, share a hash (see `SingleObjectApiJob`).
+        """
+        return job in self.jobs
+
+    def _init(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.queues: defaultdict[type[QueueJob], list[tuple[float, QueueJob]]] = defaultdict(list)
+        self.jobs: Counter[QueueJob] = Counter()
+        self.delayed: list[tuple[float, tuple[float, QueueJob]]] = []
+        self.coalescable: dict[Hashable, QueueJob] = {}
+        self.num_prefetch_jobs = 0
+        self._size = 0
+
+    def _qsize(self) -> int:
+        return self._size
+
+    def _put(self, item: tuple[float, QueueJob]) -> None:
+        job = item[1]
+        heapq.heappush(self.queues[type(job)], item)
+        self._index(job)
+
+    def _index(self, job: QueueJob) -> None:
+        self.jobs[job] += 1
+        self._size += 1
+        if is_prefetch_job(job):
+            self.num_prefetch_jobs += 1
+        key = job.coalesce_key()
+        if key is not None:
+            self.coalescable.setdefault(key, job)
+
+    def _unindex(self, job: QueueJob) -> None:
+        self.jobs[job] -= 1
+        if not self.jobs[job]:
+            del self.jobs[job]
+        self._size -= 1
+        if is_prefetch_job(job):
+            self.num_prefetch_jobs -= 1
+        key = job.coalesce_key()
+        if key is not None and self.coalescable.get(key) is job:
+            del self.coalescable[key]
+
+    def _get(self) -> tuple[float, QueueJob]:
+        job_type = self._next_job_type()
+        if job_type is None:
+            if not self.delayed:
+                raise IndexError("get from empty queue")
+            # Only get_eligible waits for delayed jobs to be due
+            _, item = heapq.heappop(self.delayed)
+            heapq.heappush(self.queues[type(item[1])], item)
+            job_type = type(item[1])
+        return self._pop(job_type)
+
+    def _pop(self, job_type: type[QueueJob]) -> tuple[float, QueueJob]:
+        item = heapq.heappop(self.queues[job_type])
+        self._unindex(item[1])
+        return item
+
+    def _next_job_type(
+        self, is_eligible: Callable[[type[QueueJob]], bool] | None = None
+    ) -> type[QueueJob] | None:
+        """
+        Return the type of the highest priority queued job among the eligible types.
+
+        When called self.mutex should be held.
+        """
+        self._move_due_jobs()
+        job_types = [
+            job_type
+            for job_type, heap in self.queues.items()
+            if heap and (is_eligible is None or is_eligible(job_type))
+        ]
+        if not job_types:
+            return None
+        return min(job_types, key=lambda job_type: self.queues[job_type][0])
+
+    def _move_due_jobs(self) -> None:
+        """
+        Move the delayed jobs that are due to the heaps of their types.
+
+        When called self.mutex should be held.
+        """
+        if not self.delayed:
+            return
+        now = time.monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, item = heapq.heappop(self.delayed)
+            heapq.heappush(self.queues[type(item[1])], item)
+
+    def get(self, *args: Any, **kwargs: Any) -> tuple[float, QueueJob]:
         item = super().get(*args, **kwargs)
-        if self.queue_updated_signal:
-            self.queue_updated_signal.emit(self._get_num_message_or_reply_download_jobs())
+        self._update()
         return item
 
     def put(self, *args: Any, **kwargs: Any) -> None:
         item = super().put(*args, **kwargs)
-        if self.queue_updated_signal:
-            self.queue_updated_signal.emit(self._get_num_message_or_reply_download_jobs())
+        self._update()
         return item
 
+    def get_eligible(self, is_eligible: Callable[[type[QueueJob]], bool]) -> tuple[float, QueueJob]:
+        """
+        Remove and return the highest priority job of a type that is eligible to run. Does not
+        block, and raises Empty if there is no such job.
+        """
+        with self.mutex:
+            job_type = self._next_job_type(is_eligible)
+            if job_type is None:
+                raise Empty
+            item = self._pop(job_type)
+        self._update()
+        return item
+
+    def put_delayed(self, item: tuple[float, QueueJob], delay: float) -> None:
+        """
+        Queue the job once `delay` seconds have passed, e.g. to retry it after a timeout without
+        holding up the jobs behind it.
+        """
+        with self.mutex:
+            heapq.heappush(self.delayed, (time.monotonic() + delay, item))
+            self._index(item[1])
+        self._update()
+
+    def time_until_due(self) -> float | None:
+        """
+        Return the number of seconds until the next delayed job is due, or None if no job is
+        delayed.
+        """
+        with self.mutex:
+            if not self.delayed:
+                return None
+            return max(0.0, self.delayed[0][0] - time.monotonic())
+
+    def has_eligible(self, is_eligible: Callable[[type[QueueJob]], bool]) -> bool:
+        """
+        Return True if a job of a type that is eligible to run is queued.
+        """
+        with self.mutex:
+            return self._next_job_type(is_eligible) is not None
+
+    def reprioritize(self, priority_of: Callable[[QueueJob], float]) -> None:
+        """
+        Give every queued job the priority returned by priority_of. Jobs stay queued, so none are
+        lost or duplicated.
+        """
+        with self.mutex:
+            for job_type, heap in self.queues.items():
+                self.queues[job_type] = [(priority_of(job), job) for priority, job in heap]
+                heapq.heapify(self.queues[job_type])
+            self.delayed = [(due, (priority_of(job), job)) for due, (_, job) in self.delayed]
+            heapq.heapify(self.delayed)
+
+    def remove_if(self, should_remove: Callable[[QueueJob], bool]) -> list[QueueJob]:
+        """
+        Remove the queued jobs for which should_remove returns True, and return them.
+        """
+        removed = []
+        with self.mutex:
+            for job_type, heap in self.queues.items():
+                kept = []
+                for item in heap:
+                    if should_remove(item[1]):
+                        removed.append(item[1])
+                    else:
+                        kept.append(item)
+                if len(kept) < len(heap):
+                    heapq.heapify(kept)
+                    self.queues[job_type] = kept
+            kept_delayed = []
+            for delayed_item in self.delayed:
+                if should_remove(delayed_item[1][1]):
+                    removed.append(delayed_item[1][1])
+                else:
+                    kept_delayed.append(delayed_item)
+            if len(kept_delayed) < len(self.delayed):
+                heapq.heapify(kept_delayed)
+                self.delayed = kept_delayed
+            for job in removed:
+                self._unindex(job)
+        if removed:
+            self._update()
+        return removed
+
+    def has_prefetch_jobs(self) -> bool:
+        """
+        Return True if a prefetch job is queued.
+        """
+        with self.mutex:
+            return self.num_prefetch_jobs > 0
+
+    def get_coalescable(self, key: Hashable) -> QueueJob | None:
+        """
+        Return a queued job with the given coalesce key (see QueueJob.coalesce_key), if any.
+        """
+        with self.mutex:
+            return self.coalescable.get(key)
+
+    def get_queued(self, job_type: type[QueueJob]) -> list[QueueJob]:
+        """
+        Return the queued jobs of the given type, in no particular order.
+        """
+        with self.mutex:
+            return [job for _, job in self.queues.get(job_type, [])] + [
+                job for _, (_, job) in self.delayed if type(job) is job_type
+            ]
+
+    def count(self, job_type: type[QueueJob]) -> int:
+        """
+        Return the number of queued jobs of the given type.
+        """
+        with self.mutex:
+            return len(self.queues[job_type]) + sum(
+                type(job) is job_type for _, (_, job) in self.delayed
+            )
+
     def _get_num_message_or_reply_download_jobs(self) -> int:
-        message_and_reply_download_jobs = list(
-            # PriorityQueue items are a tuple of (priority, job)
-            filter(lambda job: type(job[1]) in (MessageDownloadJob, ReplyDownloadJob), self.queue)
-        )
-        return len(message_and_reply_download_jobs)
+        with self.mutex:
+            return (
+                len(self.queues[MessageDownloadJob])
+                + len(self.queues[ReplyDownloadJob])
+                + sum(
+                    isinstance(job, MessageDownloadJob | ReplyDownloadJob)
+                    for _, (_, job) in self.delayed
+                )
+            )
+
+    def _update(self) -> None:
+        """
+        Emit queue_updated_signal now if the last emission was long enough ago, otherwise make sure
+        an emission is scheduled for the end of the interval.
+        """
+        if not self.queue_updated_signal:
+            return
+
+        with self._update_lock:
+            if self._update_timer is not None:
+                return  # The scheduled emission will pick up this change
+            wait = self._last_update_time + self.UPDATE_INTERVAL_SECONDS - time.monotonic()
+            if wait > 0:
+                self._update_timer = threading.Timer(wait, self._emit_update)
+                self._update_timer.daemon = True
+                self._update_timer.start()
+                return
+        self._emit_update()
+
+    def _emit_update(self) -> None:
+        with self._update_lock:
+            self._update_timer = None
+            self._last_update_time = time.monotonic()
+            count = self._get_num_message_or_reply_download_jobs()
+            if count == self._last_update_count:
+                return
+            self._last_update_count = count
+        if self.queue_updated_signal:
+            self.queue_updated_signal.emit(count)
+
+
+def is_prefetch_job(job: QueueJob) -> bool:
+    """
+    Return True if the job downloads a file in the background that the user has not asked for.
+    """
+    return isinstance(job, FileDownloadJob) and job.prefetch
+
+
+class JobJournal:
+    """
+    Record queued jobs in the local database, so that the queue can be restored when the client
+    starts again instead of after the first sync.
+
+    Only download jobs are recorded, since they can be rebuilt from the uuid of the item they
+    download and running one twice is harmless. Prefetch jobs are not recorded, since the client
+    chooses them again when it is idle. Writes go through the database writer and are not waited
+    for, so that recording a job does not slow down the queue.
+    """
+
+    # The type of database object downloaded by each type of recorded job
+    OBJECT_TYPES: dict[str, type[Message] | type[Reply] | type[File]] = {
+        MessageDownloadJob.__name__: Message,
+        ReplyDownloadJob.__name__: Reply,
+        FileDownloadJob.__name__: File,
+    }
+
+    def __init__(self, writer: DatabaseWriter) -> None:
+        self.writer = writer
+
+    def record_queued(self, job: QueueJob) -> None:
+        if self._is_recorded(job):
+            self.writer.submit(storage.add_queued_job, type(job).__name__, job.uuid)
+
+    def record_started(self, job: QueueJob) -> None:
+        if self._is_recorded(job):
+            self.writer.submit(storage.mark_queued_job_as_started, type(job).__name__, job.uuid)
+
+    def record_finished(self, job: QueueJob) -> None:
+        if self._is_recorded(job):
+            self.writer.submit(storage.delete_queued_job, type(job).__name__, job.uuid)
+
+    def _is_recorded(self, job: QueueJob) -> TypeGuard[DownloadJob]:
+        return isinstance(job, DownloadJob) and not is_prefetch_job(job)
+
+
+@dataclass
+class JobTimes:
+    """
+    Queue wait and service times, in seconds, of the jobs of one type that a queue has run.
+    """
+
+    count: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+    total_service: float = 0.0
+    max_service: float = 0.0
+
+    def add(self, wait: float, service: float) -> None:
+        self.count += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.total_service += service
+        self.max_service = max(self.max_service, service)
+
+    @property
+    def mean_wait(self) -> float:
+        return self.total_wait / self.count if self.count else 0.0
+
+    @property
+    def mean_service(self) -> float:
+        return self.total_service / self.count if self.count else 0.0
+
+
+class CircuitBreaker(QObject):
+    """
+    Connection state shared by the queues, so that they stop sending requests while the server
+    cannot be reached and start again by themselves once it can.
+
+    The breaker is closed while requests go through. A request that times out or cannot reach the
+    server opens it. Once a backoff delay has passed, which doubles with every consecutive failure
+    up to MAX_DELAY_SECONDS and is jittered, the breaker is half-open and emits `probe` so that the
+    paused queues resume and run one job at a time. If a job gets a response the breaker closes and
+    emits `closed`; if it fails the breaker opens again for longer.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    # Bounds of the delay before probing the server again, see utils.backoff_delay
+    BASE_DELAY_SECONDS = 2.0
+    MAX_DELAY_SECONDS = 300.0
+
+    # Signal that is emitted when the backoff delay has passed and a request can be tried
+    probe = pyqtSignal()
+
+    # Signal that is emitted when a request goes through after the breaker was opened
+    closed = pyqtSignal()
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._timer: threading.Timer | None = None
+        self._lock = threading.Lock()
+
+    def is_closed(self) -> bool:
+        return self.state == self.CLOSED
+
+    def record_failure(self) -> None:
+        """
+        Open the breaker after a timeout or connection error, and schedule the next probe.
+        """
+        with self._lock:
+            delay = backoff_delay(
+                self.consecutive_failures, self.BASE_DELAY_SECONDS, self.MAX_DELAY_SECONDS
+            )
+            self.consecutive_failures += 1
+            self.state = self.OPEN
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(delay, self._on_delay_elapsed)
+            self._timer.daemon = True
+            self._timer.start()
+        logger.info(f"Server cannot be reached, trying again in {delay:.1f}s")
+
+    def record_success(self) -> None:
+        """
+        Close the breaker after a request went through, emitting `closed` if it was not closed.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            self._close()
+        logger.info("Server can be reached again")
+        self.closed.emit()
+
+    def reset(self) -> None:
+        """
+        Close the breaker without emitting `closed`, e.g. because a sync succeeded and the queues
+        are resumed anyway.
+        """
+        with self._lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+
+    def _on_delay_elapsed(self) -> None:
+        with self._lock:
+            if self.state != self.OPEN:
+                return
+            self.state = self.HALF_OPEN
+            self._timer = None
+        self.probe.emit()
 
 
 class RunnableQueue(QObject):
@@ -68,10 +502,24 @@ class RunnableQueue(QObject):
     job type. If multiple jobs of the same type are added to the queue then they are retrieved
     in FIFO order.
 
-    If a RequestTimeoutError or ServerConnectionError is encountered while processing a job, the
-    job will be added back to the queue, the processing loop will stop, and the paused signal will
-    be emitted. New jobs can still be added, but the processing function will need to be called
-    again in order to resume. The processing loop is resumed when the resume signal is emitted.
+    By default jobs are processed one at a time on the queue's thread. A queue created with more
+    than one worker instead runs up to `num_workers` jobs at a time, each on its own worker thread,
+    and starts the highest priority job whose type is below its limit in JOB_CONCURRENCY_LIMITS.
+    Pausing and clearing the queue wait for running jobs to finish, so that they take effect
+    between jobs as they do with a single worker.
+
+    The time each job waited in the queue and the time it took to run are recorded in job_times,
+    by job type, so that scheduling can be tuned.
+
+    If a job's request times out or cannot reach the server and the job has attempts left, it is
+    added back to the queue to be retried after a backoff delay, and the queue runs other jobs in
+    the meantime. Once the job has run out of attempts, the RequestTimeoutError or
+    ServerConnectionError is handled as follows: the job will be added back to the queue, the
+    processing loop will stop, and the paused signal will be emitted. New jobs can still be added,
+    but the processing function will need to be called again in order to resume. The processing
+    loop is resumed when the resume signal is emitted.
+    With a circuit breaker, the failure opens the breaker, and the queue runs one job at a time
+    until a job goes through and closes it again.
 
     If an ApiInaccessibleError is encountered while processing a job, api_client will be set to
     None and the processing loop will stop. If the queue is resumed before the queue manager
@@ -98,6 +546,24 @@ class RunnableQueue(QObject):
         SeenJob: 18,
     }
 
+    # Amount by which the priority of the downloads of the conversation the user has selected is
+    # raised (see focus_source), so that they run ahead of the other downloads of their type, but
+    # still after the jobs the user started, such as sending a reply or deleting a source
+    FOCUSED_JOB_PRIORITY_BOOST = 0.5
+
+    # Priority of prefetch jobs (see FileDownloadJob), so that they only run when nothing else is
+    # queued
+    PREFETCH_JOB_PRIORITY = 19
+
+    # The number of jobs of each type that can run at the same time when the queue has more than
+    # one worker. Jobs of other types run one at a time, e.g. so that replies are sent in order.
+    # None means that only the number of workers limits them.
+    JOB_CONCURRENCY_LIMITS: dict[type[QueueJob], int | None] = {
+        FileDownloadJob: None,  # File downloads processed in separate queue
+        MessageDownloadJob: 4,
+        ReplyDownloadJob: 4,
+    }
+
     # Signal that is emitted when processing is stopped and queued jobs are cleared
     cleared = pyqtSignal()
 
@@ -112,17 +578,37 @@ class RunnableQueue(QObject):
         api_client: API | None,
         session_maker: scoped_session,
         queue_updated_signal: pyqtBoundSignal | None = None,
+        num_workers: int = 1,
+        journal: JobJournal | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
     ) -> None:
         super().__init__()
         self.api_client = api_client
         self.session_maker = session_maker
-        self.queue = RunnablePriorityQueue(queue_updated_signal=queue_updated_signal)  # type: PriorityQueue[tuple[int, QueueJob]]
+        self.journal = journal
+        self.circuit_breaker = circuit_breaker
+        self.queue = RunnablePriorityQueue(queue_updated_signal=queue_updated_signal)
         # `order_number` ensures jobs with equal priority are retrieved in FIFO order. This is
         # needed because PriorityQueue is implemented using heapq which does not have sort
         # stability. For more info, see : https://bugs.python.org/issue17794
         self.order_number = itertools.count()
         self.current_job: QueueJob | None = None
 
+        # Jobs running on worker threads, if the queue has more than one worker
+        self.num_workers = num_workers
+        self.running_jobs: Counter[QueueJob] = Counter()
+        self._running_job_types: Counter[type[QueueJob]] = Counter()
+        self._api_inaccessible = False
+
+        # Whether processing stopped at a PauseQueueJob and is waiting to be resumed
+        self.is_paused = False
+
+        # Source whose downloads run first, see focus_source
+        self.focused_source_uuid: str | None = None
+
+        # Queue wait and service times of the jobs run so far, by job type
+        self.job_times: defaultdict[type[QueueJob], JobTimes] = defaultdict(JobTimes)
+
         # Hold when reading/writing self.current_job or mutating queue state
         self.condition_add_or_remove_job = threading.Condition()
 
@@ -130,25 +616,35 @@ class RunnableQueue(QObject):
 
     def _check_for_duplicate_jobs(self, job: QueueJob) -> bool:
         """
-        Queued jobs are stored on self.queue.queue. The currently executing job is
-        stored on self.current_job. We check that the job to be added is not among them.
+        Queued jobs are indexed by self.queue. The currently executing job is
+        stored on self.current_job, or on self.running_jobs if the queue has more
+        than one worker. We check that the job to be added is not among them.
         """
-        in_progress_jobs = [in_progress_job for priority, in_progress_job in self.queue.queue]
-        if self.current_job is not None:
-            in_progress_jobs.append(self.current_job)
-        if job in in_progress_jobs:
+        if (
+            job in self.queue
+            or (self.current_job is not None and job == self.current_job)
+            or job in self.running_jobs
+        ):
             logger.debug(f"Duplicate job {job}, skipping")
             return True
         return False
 
+    def is_idle(self) -> bool:
+        """
+        Return True if no job is being processed or waiting to be processed.
+        """
+        with self.condition_add_or_remove_job:
+            return self.current_job is None and not self.running_jobs and self.queue.empty()
+
     def _clear(self) -> None:
         """
         Reinstantiate the PriorityQueue, rather than trying to clear it via undocumented methods.[1]
+        This also resets the index of queued jobs.
 
         [1]: https://stackoverflow.com/a/38560911
         """
         with self.condition_add_or_remove_job:
-            self.queue = PriorityQueue()
+            self.queue = RunnablePriorityQueue(queue_updated_signal=self.queue.queue_updated_signal)
         self.cleared.emit()
 
     def add_job(self, job: QueueJob) -> None:
@@ -158,15 +654,32 @@ class RunnableQueue(QObject):
         Can block while waiting to acquire condition_add_or_remove_job.
         """
         with self.condition_add_or_remove_job:
+            if self._coalesce(job):
+                return
+
+            if self._upgrade_prefetch_job(job):
+                return
+
             if self._check_for_duplicate_jobs(job):
                 return
 
-            logger.debug(f"Added {job} to queue")
-            current_order_number = next(self.order_number)
-            job.order_number = current_order_number
-            priority = self.JOB_PRIORITIES[type(job)]
-            self.queue.put_nowait((priority, job))
-            self.condition_add_or_remove_job.notify()
+            self._add_new_job(job)
+
+    def _add_new_job(self, job: QueueJob) -> None:
+        """
+        Put the job into the queue after assigning it the next order_number.
+
+        When called condition_add_or_remove_job should be held.
+        """
+        logger.debug(f"Added {job} to queue")
+        current_order_number = next(self.order_number)
+        job.order_number = current_order_number
+        job.enqueued_at = time.monotonic()
+        priority = self._get_priority(job)
+        self.queue.put_nowait((priority, job))
+        if self.journal is not None:
+            self.journal.record_queued(job)
+        self.condition_add_or_remove_job.notify()
 
     def _re_add_job(self, job: QueueJob) -> None:
         """
@@ -180,10 +693,146 @@ class RunnableQueue(QObject):
 
         logger.debug(f"Added {job} to queue")
         job.remaining_attempts = DEFAULT_NUM_ATTEMPTS
-        priority = self.JOB_PRIORITIES[type(job)]
+        priority = self._get_priority(job)
         self.queue.put_nowait((priority, job))
+        if self.journal is not None:
+            self.journal.record_queued(job)
         self.condition_add_or_remove_job.notify()
 
+    def _coalesce(self, job: QueueJob) -> bool:
+        """
+        Merge the job into the queued job with the same coalesce key, if it accepts it (see
+        QueueJob.coalesce), so that bursts of small jobs are sent as one request. Returns True if
+        the job was merged.
+
+        When called condition_add_or_remove_job should be held.
+        """
+        key = job.coalesce_key()
+        if key is None:
+            return False
+        queued_job = self.queue.get_coalescable(key)
+        if queued_job is None or not queued_job.coalesce(job):
+            return False
+        logger.debug(f"Coalesced {job} into {queued_job}")
+        return True
+
+    def _get_priority(self, job: QueueJob) -> float:
+        """
+        Return the priority of the job's type, PREFETCH_JOB_PRIORITY for prefetch jobs, or a
+        priority raised by FOCUSED_JOB_PRIORITY_BOOST for downloads of the focused source.
+        """
+        if is_prefetch_job(job):
+            return self.PREFETCH_JOB_PRIORITY
+        if (
+            isinstance(job, DownloadJob)
+            and job.source_uuid is not None
+            and job.source_uuid == self.focused_source_uuid
+        ):
+            return self.JOB_PRIORITIES[type(job)] - self.FOCUSED_JOB_PRIORITY_BOOST
+        return self.JOB_PRIORITIES[type(job)]
+
+    def focus_source(self, source_uuid: str | None) -> None:
+        """
+        Move the queued downloads of the given source ahead of other downloads, and the downloads of
+        the previously focused source back to their usual place. Downloads of the source that are
+        added later are also run first. Jobs the user started, such as sending a reply, still run
+        before them.
+        """
+        with self.condition_add_or_remove_job:
+            if source_uuid == self.focused_source_uuid:
+                return
+            self.focused_source_uuid = source_uuid
+            self.queue.reprioritize(self._get_priority)
+            logger.debug(f"Focused queue on source {source_uuid}")
+
+    def cancel_jobs_for_sources(
+        self, source_uuids: set[str], conversation_only: bool = False
+    ) -> int:
+        """
+        Remove the queued work for the given sources, which are being deleted, or only for their
+        conversations if `conversation_only` is True (see QueueJob.cancel_for_sources). Jobs that
+        are already running are left to finish. Returns the number of jobs removed.
+        """
+        with self.condition_add_or_remove_job:
+            cancelled = self.queue.remove_if(
+                lambda job: job.cancel_for_sources(source_uuids, conversation_only)
+            )
+            if self.journal is not None:
+                for job in cancelled:
+                    self.journal.record_finished(job)
+        if cancelled:
+            logger.debug(f"Cancelled {len(cancelled)} queued jobs for deleted sources")
+        return len(cancelled)
+
+    def cancel_prefetch_jobs(self) -> int:
+        """
+        Remove the queued prefetch jobs. A prefetch job that is already running is left to finish.
+        Returns the number of jobs removed.
+        """
+        with self.condition_add_or_remove_job:
+            if not self.queue.has_prefetch_jobs():
+                return 0
+            cancelled = self.queue.remove_if(is_prefetch_job)
+        if cancelled:
+            logger.debug(f"Cancelled {len(cancelled)} queued prefetch jobs")
+        return len(cancelled)
+
+    def _upgrade_prefetch_job(self, job: QueueJob) -> bool:
+        """
+        If the job is a download that the user asked for while a prefetch of the same file is
+        running, upgrade the prefetch job to download the file for the user (see
+        FileDownloadJob.upgrade_prefetch) instead of skipping the job as a duplicate, and record it
+        in the journal. If the prefetch has just finished, queue the job anyway so that it reports
+        the result to the user. Returns True if the job was handled.
+
+        When called condition_add_or_remove_job should be held.
+        """
+        if not isinstance(job, FileDownloadJob) or job.prefetch:
+            return False
+        for running_job in [self.current_job, *self.running_jobs]:
+            if not (
+                isinstance(running_job, FileDownloadJob)
+                and running_job.prefetch
+                and running_job == job
+            ):
+                continue
+            if running_job.upgrade_prefetch(job):
+                logger.debug(f"Upgraded prefetch of {job} to a download")
+                if self.journal is not None:
+                    self.journal.record_queued(running_job)
+            else:
+                self._add_new_job(job)
+            return True
+        return False
+
+    def _can_start(self, job_type: type[QueueJob]) -> bool:
+        """
+        Return True if a job of the given type can start without exceeding its concurrency limit.
+
+        When called condition_add_or_remove_job should be held.
+        """
+        limit = self.JOB_CONCURRENCY_LIMITS.get(job_type, 1)
+        return limit is None or self._running_job_types[job_type] < limit
+
+    def _can_dispatch(self) -> bool:
+        """
+        Return True if the processing loop has something to do.
+
+        When called condition_add_or_remove_job should be held.
+        """
+        if self._api_inaccessible:
+            return True
+        if sum(self.running_jobs.values()) >= self.num_workers:
+            return False
+        # While the server cannot be reached, probe it with one job at a time
+        if (
+            self.circuit_breaker is not None
+            and not self.circuit_breaker.is_closed()
+            and self.running_jobs
+        ):
+            return False
+        return self.queue.has_eligible(self._can_start)
+
     @pyqtSlot()
     def process(self) -> None:
         """
@@ -205,48 +854,147 @@ class RunnableQueue(QObject):
         (2) Return from the processing loop since a valid token will be needed in order to process
         jobs.
 
-        Note: Generic exceptions are handled in _do_call_api.
+        Note: Generic exceptions are handled in _try_call_api.
         """
+        self.is_paused = False
         while True:
             with self.condition_add_or_remove_job:
-                self.condition_add_or_remove_job.wait_for(lambda: not self.queue.empty())
-                priority, self.current_job = self.queue.get(block=False)
+                while not self._can_dispatch():
+                    # Wake up when a job that is waiting to be retried is due
+                    self.condition_add_or_remove_job.wait(self.queue.time_until_due())
+                if self._api_inaccessible:
+                    self._api_inaccessible = False
+                    return
+                priority, job = self.queue.get_eligible(self._can_start)
+                self.current_job = job
+
+            if isinstance(job, ClearQueueJob | PauseQueueJob):
+                # Let running jobs finish (or be re-added) first
+                with self.condition_add_or_remove_job:
+                    self.condition_add_or_remove_job.wait_for(lambda: not self.running_jobs)
 
-            if isinstance(self.current_job, ClearQueueJob):
+            if isinstance(job, ClearQueueJob):
                 with self.condition_add_or_remove_job:
                     self.current_job = None
                 self._clear()
                 return
 
-            if isinstance(self.current_job, PauseQueueJob):
+            if isinstance(job, PauseQueueJob):
+                self.is_paused = True
                 self.paused.emit()
                 with self.condition_add_or_remove_job:
                     self.current_job = None
                 return
 
-            try:
-                if isinstance(self.current_job, ApiJob):
-                    session = self.session_maker()
-                    self.current_job._do_call_api(self.api_client, session)
-            except ApiInaccessibleError as e:
-                logger.debug(f"{type(e).__name__}: {e}")
-                self.api_client = None
+            if self.num_workers > 1:
                 with self.condition_add_or_remove_job:
                     self.current_job = None
+                    self.running_jobs[job] += 1
+                    self._running_job_types[type(job)] += 1
+                threading.Thread(
+                    target=self._run_job_on_worker, args=(job,), name="QueueWorker", daemon=True
+                ).start()
+                continue
+
+            error = self._run_job(job)
+            with self.condition_add_or_remove_job:
+                self.current_job = None
+                self._handle_error(job, error)
+            if isinstance(error, ApiInaccessibleError):
                 return
-            except (RequestTimeoutError, ServerConnectionError) as e:
-                logger.debug(f"{type(e).__name__}: {e}")
+
+    def _run_job_on_worker(self, job: QueueJob) -> None:
+        error = self._run_job(job)
+        with self.condition_add_or_remove_job:
+            self.running_jobs[job] -= 1
+            if not self.running_jobs[job]:
+                del self.running_jobs[job]
+            self._running_job_types[type(job)] -= 1
+            self._handle_error(job, error)
+            if isinstance(error, ApiInaccessibleError):
+                # Wake the processing loop so that it stops
+                self._api_inaccessible = True
+            self.condition_add_or_remove_job.notify_all()
+
+    def _run_job(self, job: QueueJob) -> Exception | None:
+        """
+        Make one attempt at running the job, returning the ApiInaccessibleError,
+        RequestTimeoutError, ServerConnectionError or RetryLaterError it raised, if any. Other
+        exceptions are logged and the job is skipped.
+        """
+        started_at = time.monotonic()
+        if self.journal is not None:
+            self.journal.record_started(job)
+        if self.journal is not None and isinstance(job, DownloadJob):
+            # A download that is handed to the decryption stage stays in the journal until its file
+            # has been decrypted, so that it is restored if the client stops in the meantime
+            job.decryption_finished_callback = functools.partial(self.journal.record_finished, job)
+        made_request = False
+        session = self.session_maker()
+        try:
+            if isinstance(job, ApiJob):
+                made_request = job._try_call_api(self.api_client, session)
+        except (
+            ApiInaccessibleError,
+            RequestTimeoutError,
+            ServerConnectionError,
+            RetryLaterError,
+        ) as e:
+            # The job stays in the journal, to be retried or restored
+            logger.debug(f"{type(e).__name__}: {e}")
+            return e
+        except Exception as e:
+            logger.error("Skipping job")
+            logger.debug(f"Skipping job: {type(e).__name__}: {e}")
+        finally:
+            session.close()
+            self._record_times(job, started_at)
+        if self.journal is not None and not (
+            isinstance(job, DownloadJob) and job.decryption_pending
+        ):
+            self.journal.record_finished(job)
+        # Only a request that went through shows that the server can be reached
+        if made_request and self.circuit_breaker is not None:
+            self.circuit_breaker.record_success()
+        return None
+
+    def _record_times(self, job: QueueJob, started_at: float) -> None:
+        """
+        Record how long the job waited in the queue before it started, and how long it ran.
+
+        The wait of a job that was added back to the queue after a timeout includes its earlier
+        attempts, since it keeps its place in the queue.
+        """
+        finished_at = time.monotonic()
+        wait = started_at - job.enqueued_at if job.enqueued_at is not None else 0.0
+        service = finished_at - started_at
+        with self.condition_add_or_remove_job:
+            self.job_times[type(job)].add(wait, service)
+        logger.debug(f"{job} waited {wait:.3f}s in the queue and ran for {service:.3f}s")
+
+    def _handle_error(self, job: QueueJob, error: Exception | None) -> None:
+        """
+        Stop processing if the API is inaccessible, add the job back to the queue to be retried
+        after its backoff delay, or pause the queue and add the job back to it if the request timed
+        out or the server could not be reached and the job has no attempts left.
+
+        When called condition_add_or_remove_job should be held.
+        """
+        if isinstance(error, ApiInaccessibleError):
+            self.api_client = None
+        elif isinstance(error, RetryLaterError):
+            logger.debug(f"Retrying {job} in {error.delay:.1f}s")
+            self.queue.put_delayed((self._get_priority(job), job), error.delay)
+            self.condition_add_or_remove_job.notify()
+        elif isinstance(error, RequestTimeoutError | ServerConnectionError):
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record_failure()
+            # Concurrent jobs that time out together only need to pause the queue once
+            if not isinstance(self.current_job, PauseQueueJob) and not self.queue.count(
+                PauseQueueJob
+            ):
                 self.add_job(PauseQueueJob())
-                with self.condition_add_or_remove_job:
-                    job, self.current_job = self.current_job, None
-                    self._re_add_job(job)
-            except Exception as e:
-                logger.error("Skipping job")
-                logger.debug(f"Skipping job: {type(e).__name__}: {e}")
-            finally:
-                with self.condition_add_or_remove_job:
-                    self.current_job = None
-                session.close()
+            self._re_add_job(job)
 
 
 class ApiJobQueue(QObject):
@@ -258,6 +1006,10 @@ class ApiJobQueue(QObject):
     make their requests. It stops the queues whenever a MetadataSyncJob, which runs in a continuous
     loop outside of the queue manager, encounters an ApiInaccessibleError and forces a logout
     from the Controller.
+
+    The queues share a CircuitBreaker, so that a queue that was paused because the server could not
+    be reached is resumed when the other queue gets through to it, or when a probe is due, rather
+    than only after the next successful sync.
     """
 
     # Signal that is emitted after a queue is cleared.
@@ -266,6 +1018,9 @@ class ApiJobQueue(QObject):
     # Signal that is emitted after a queue is paused.
     paused = pyqtSignal()
 
+    # Signal that is emitted after the queues resume because the server can be reached again.
+    resumed = pyqtSignal()
+
     # Signal emitted when an item is added or removed from the main queue
     main_queue_updated = pyqtSignal(int)
 
@@ -275,16 +1030,30 @@ class ApiJobQueue(QObject):
         session_maker: scoped_session,
         main_thread: QThread,
         download_file_thread: QThread,
+        journal: JobJournal | None = None,
     ) -> None:
         super().__init__(None)
 
         self.main_thread = main_thread
         self.download_file_thread = download_file_thread
 
+        config = Config.load()
+        self.circuit_breaker = CircuitBreaker()
         self.main_queue = RunnableQueue(
-            api_client, session_maker, queue_updated_signal=self.main_queue_updated
+            api_client,
+            session_maker,
+            queue_updated_signal=self.main_queue_updated,
+            num_workers=config.main_queue_workers,
+            journal=journal,
+            circuit_breaker=self.circuit_breaker,
+        )
+        self.download_file_queue = RunnableQueue(
+            api_client,
+            session_maker,
+            num_workers=config.file_download_workers,
+            journal=journal,
+            circuit_breaker=self.circuit_breaker,
         )
-        self.download_file_queue = RunnableQueue(api_client, session_maker)
 
         self.main_queue.moveToThread(self.main_thread)
         self.download_file_queue.moveToThread(self.download_file_thread)
@@ -298,6 +1067,9 @@ class ApiJobQueue(QObject):
         self.main_queue.cleared.connect(self.on_main_queue_cleared)
         self.download_file_queue.cleared.connect(self.on_file_download_queue_cleared)
 
+        self.circuit_breaker.probe.connect(self.on_circuit_breaker_probe)
+        self.circuit_breaker.closed.connect(self.on_circuit_breaker_closed)
+
     def start(self, api_client: API) -> None:
         """
         Start the queues whenever a new api token is provided.
@@ -329,6 +1101,31 @@ class ApiJobQueue(QObject):
             self.download_file_thread.quit()
             logger.debug("Asked file-download queue thread to quit")
 
+    def focus_source(self, source_uuid: str | None) -> None:
+        """
+        Run the queued downloads of the given source before other downloads, e.g. because the user
+        has selected its conversation. Pass None to go back to the usual order.
+        """
+        self.main_queue.focus_source(source_uuid)
+        self.download_file_queue.focus_source(source_uuid)
+
+    def cancel_jobs_for_sources(
+        self, source_uuids: set[str], conversation_only: bool = False
+    ) -> None:
+        """
+        Remove the queued downloads, seen and star updates of the given sources from both queues,
+        since they would only fetch or update data that is being deleted. If `conversation_only` is
+        True, the sources themselves are kept, so their star updates are kept too.
+        """
+        self.main_queue.cancel_jobs_for_sources(source_uuids, conversation_only)
+        self.download_file_queue.cancel_jobs_for_sources(source_uuids, conversation_only)
+
+    def is_idle(self) -> bool:
+        """
+        Return True if neither queue has a job in progress or waiting.
+        """
+        return self.main_queue.is_idle() and self.download_file_queue.is_idle()
+
     @pyqtSlot()
     def on_main_queue_paused(self) -> None:
         """
@@ -361,10 +1158,36 @@ class ApiJobQueue(QObject):
         logger.debug("Cleared file download queue")
         self.cleared.emit()
 
+    @pyqtSlot()
+    def on_circuit_breaker_probe(self) -> None:
+        """
+        Resume the paused queues to find out whether the server can be reached again.
+        """
+        logger.debug("Probing server")
+        self._resume_paused_queues()
+
+    @pyqtSlot()
+    def on_circuit_breaker_closed(self) -> None:
+        """
+        Resume the queues that are still paused and emit the resumed signal, since the server can
+        be reached again.
+        """
+        self._resume_paused_queues()
+        self.resumed.emit()
+
+    def _resume_paused_queues(self) -> None:
+        if self.main_thread.isRunning() and self.main_queue.is_paused:
+            logger.debug("Resuming main queue")
+            self.main_queue.resume.emit()
+        if self.download_file_thread.isRunning() and self.download_file_queue.is_paused:
+            logger.debug("Resuming download queue")
+            self.download_file_queue.resume.emit()
+
     def resume_queues(self) -> None:
         """
         Emit the resume signal to the queues if they are running.
         """
+        self.circuit_breaker.reset()
         if self.main_thread.isRunning():
             logger.debug("Resuming main queue")
             self.main_queue.resume.emit()
@@ -381,6 +1204,13 @@ class ApiJobQueue(QObject):
             logger.debug("Not adding job before queues have been started.")
             return
 
+        if not is_prefetch_job(job):
+            # Any other job pre-empts the queued prefetch jobs, which the client chooses again the
+            # next time it is idle. This also lets a download that the user asks for replace a
+            # queued prefetch of the same file instead of being skipped as a duplicate. A running
+            # prefetch of the file is upgraded instead (see RunnableQueue.add_job).
+            self.download_file_queue.cancel_prefetch_jobs()
+
         if isinstance(job, FileDownloadJob):
             self.download_file_queue.add_job(job)
         else:
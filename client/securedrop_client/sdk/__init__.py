@@ -12,6 +12,7 @@ from typing import Any
 from securedrop_client import utils
 from securedrop_client.config import Config
 
+from .ratelimit import RateLimiter
 from .sdlocalobjects import (
     AuthError,
     BaseError,
@@ -116,6 +117,11 @@ class API:
         config = Config.load()
         self.proxy_vm_name = config.proxy_vm_name
         self.download_retry_limit = config.download_retry_limit
+        self.rate_limiter = RateLimiter(
+            config.api_requests_per_second,
+            config.api_bytes_per_second,
+            config.sync_requests_per_second,
+        )
 
     def _rpc_target(self) -> list:
         """In `development_mode`, check `cargo` for a locally-built proxy binary.
@@ -151,6 +157,8 @@ class API:
 
                 # Serialize the data to send
                 data_bytes = json.dumps(data).encode()
+                self.rate_limiter.acquire_request()
+                self.rate_limiter.acquire_bytes(len(data_bytes))
 
                 # Open the process
                 logger.debug(f"Retry {retry}, opening process")
@@ -182,6 +190,7 @@ class API:
                             download_finished = True
                             break
 
+                    self.rate_limiter.acquire_bytes(len(chunk))
                     fobj.write(chunk)
                     bytes_written += len(chunk)
                     logger.debug(f"Retry {retry}, bytes written: {bytes_written:,}")
@@ -337,6 +346,8 @@ class API:
 
         # Not streaming
         data_str = json.dumps(data).encode()
+        self.rate_limiter.acquire_request()
+        self.rate_limiter.acquire_bytes(len(data_str))
         try:
             response = subprocess.run(
                 self._rpc_target(),
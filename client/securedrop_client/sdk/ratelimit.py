@@ -0,0 +1,134 @@
+import logging
+import threading
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket that refills at `rate` tokens per second up to `capacity` tokens.
+
+    Taking more tokens than the bucket holds puts it into debt rather than failing, and the caller
+    waits until the debt would have been paid off. A request for more than the capacity, such as a
+    large chunk of a download, therefore still goes through at the configured rate. A rate of 0
+    means the bucket is unlimited.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Take `amount` tokens and return how many seconds the caller has to wait before using them.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+@dataclass
+class WaitTimes:
+    """
+    Time spent waiting for a token bucket.
+    """
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, wait: float) -> None:
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class RateLimiter:
+    """
+    Limit the rate of requests and the bandwidth that the client uses through the proxy, so that a
+    backlog of jobs cannot saturate the connection.
+
+    Every request takes a token from the request bucket, and the bytes sent and streamed take tokens
+    from the byte bucket. Requests made within `reserved()`, i.e. by the metadata sync, take tokens
+    from a separate bucket instead, so that the sync does not time out behind the backlog.
+
+    The time spent waiting for each bucket is recorded in wait_times, so that the limits can be
+    tuned.
+    """
+
+    # Seconds of traffic that can be sent in a burst after an idle period
+    BURST_SECONDS = 2
+
+    def __init__(
+        self,
+        requests_per_second: float,
+        bytes_per_second: float,
+        reserved_requests_per_second: float,
+    ) -> None:
+        self.requests = TokenBucket(
+            requests_per_second, max(1, requests_per_second * self.BURST_SECONDS)
+        )
+        self.reserved_requests = TokenBucket(
+            reserved_requests_per_second, max(1, reserved_requests_per_second * self.BURST_SECONDS)
+        )
+        self.bytes = TokenBucket(bytes_per_second, bytes_per_second * self.BURST_SECONDS)
+        self.wait_times = {"requests": WaitTimes(), "reserved": WaitTimes(), "bytes": WaitTimes()}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def reserved(self) -> Generator:
+        """
+        Make the requests of the current thread use the reserved budget and skip the byte limit.
+        """
+        self._local.reserved = True
+        try:
+            yield
+        finally:
+            self._local.reserved = False
+
+    def _is_reserved(self) -> bool:
+        return getattr(self._local, "reserved", False)
+
+    def acquire_request(self) -> None:
+        """
+        Wait until a request can be sent.
+        """
+        if self._is_reserved():
+            self._wait("reserved", self.reserved_requests.reserve(1))
+        else:
+            self._wait("requests", self.requests.reserve(1))
+
+    def acquire_bytes(self, num_bytes: int) -> None:
+        """
+        Wait until `num_bytes` more bytes can be transferred.
+        """
+        if self._is_reserved():
+            return
+        self._wait("bytes", self.bytes.reserve(num_bytes))
+
+    def _wait(self, bucket: str, wait: float) -> None:
+        with self._lock:
+            self.wait_times[bucket].add(wait)
+        if wait > 0:
+            logger.debug(f"Rate limited, waiting {wait:.3f}s for {bucket}")
+            time.sleep(wait)
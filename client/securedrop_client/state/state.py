@@ -20,6 +20,7 @@ class State(QObject):
     """
 
     selected_conversation_files_changed = pyqtSignal()
+    selected_conversation_changed = pyqtSignal()
 
     def __init__(self, database: Database | None = None) -> None:
         super().__init__()
@@ -84,8 +85,11 @@ class State(QObject):
 
     @selected_conversation.setter
     def selected_conversation(self, id: ConversationId | None) -> None:
+        changed = id != self._selected_conversation
         self._selected_conversation = id
         self.selected_conversation_files_changed.emit()
+        if changed:
+            self.selected_conversation_changed.emit()
 
     @property
     def selected_conversation_has_downloadable_files(self) -> bool:
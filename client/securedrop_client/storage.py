@@ -29,7 +29,7 @@ from pathlib import Path
 from typing import Any, TypeVar
 
 from dateutil.parser import parse
-from sqlalchemy import and_, desc, or_
+from sqlalchemy import and_, desc, func, or_
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.session import Session
@@ -38,9 +38,13 @@ from securedrop_client.db import (
     DeletedConversation,
     DeletedSource,
     DeletedUser,
+    DownloadError,
+    DownloadErrorCodes,
     DraftReply,
     File,
     Message,
+    PendingDeletion,
+    QueuedJob,
     Reply,
     ReplySendStatus,
     ReplySendStatusCodes,
@@ -49,12 +53,13 @@ from securedrop_client.db import (
     SeenReply,
     Source,
     User,
+    search_index_rowid,
 )
 from securedrop_client.sdk import API
 from securedrop_client.sdk import Reply as SDKReply
 from securedrop_client.sdk import Source as SDKSource
 from securedrop_client.sdk import Submission as SDKSubmission
-from securedrop_client.utils import SourceCache, chronometer
+from securedrop_client.utils import SourceCache, chronometer, lookup_by_uuid
 
 logger = logging.getLogger(__name__)
 
@@ -76,13 +81,13 @@ def get_local_sources(session: Session) -> list[Source]:
 def delete_local_source_by_uuid(session: Session, uuid: str, data_dir: str) -> None:
     """
     Delete the source with the referenced UUID and add the source to the
-    DeletedSource table.
+    DeletedSource table. The source's files on disk are scheduled for deletion.
     This method is used only during local delete actions.
     """
-    source = session.query(Source).filter_by(uuid=uuid).one_or_none()
+    source = lookup_by_uuid(session, Source).params(uuid=uuid).one_or_none()
     if source:
         logger.debug(f"Delete source {uuid} from local database.")
-        delete_source_collection(source.journalist_filename, data_dir)
+        schedule_source_collection_deletion(session, source.journalist_filename, data_dir)
         session.delete(source)
         session.add(DeletedSource(uuid=uuid))
         session.commit()
@@ -102,6 +107,53 @@ def get_local_files(session: Session) -> list[File]:
     return session.query(File).all()
 
 
+def get_downloaded_files_size(session: Session) -> int:
+    """
+    Return the total size in bytes of the files that have been downloaded.
+    """
+    return (
+        session.query(func.coalesce(func.sum(File.size), 0))
+        .filter(File.is_downloaded == True)  # noqa: E712
+        .scalar()
+    )
+
+
+def get_files_to_prefetch(
+    session: Session, max_size: int, active_since: datetime, limit: int
+) -> list[File]:
+    """
+    Return up to `limit` files that have not been downloaded or failed to download, of at most
+    `max_size` bytes, from sources with activity since `active_since`. The files of the most
+    recently active sources come first, newest first.
+    """
+    return (
+        session.query(File)
+        .join(Source)
+        .filter(
+            File.is_downloaded == False,  # noqa: E712
+            File.download_error_id == None,  # noqa: E711
+            File.size <= max_size,
+            Source.last_updated >= active_since,
+        )
+        .order_by(desc(Source.last_updated), desc(File.file_counter))
+        .limit(limit)
+        .all()
+    )
+
+
+def get_least_recently_opened_files(session: Session) -> list[File]:
+    """
+    Return the files that have been downloaded and decrypted, least recently opened first. Files
+    that have never been opened come first.
+    """
+    return (
+        session.query(File)
+        .filter(File.is_downloaded == True, File.is_decrypted == True)  # noqa: E712
+        .order_by(File.last_opened_at, File.id)
+        .all()
+    )
+
+
 def get_local_replies(session: Session) -> list[Reply]:
     """
     Return all reply objects from the local database that are successful.
@@ -314,7 +366,7 @@ def update_sources(
     * Items that have been flagged to skip are not re-created in the local database
       (prevent re-downloading data that has just been locally deleted)
     * Local items not returned in the remote sources are deleted from the
-      local database.
+      local database, and their files on disk are scheduled for deletion.
     """
     local_sources_by_uuid = {s.uuid: s for s in local_sources}
     for source in remote_sources:
@@ -373,7 +425,7 @@ def update_sources(
     # delete the related records.
     for deleted_source in local_sources_by_uuid.values():
         logger.debug(f"Delete source {deleted_source.uuid}")
-        delete_source_collection(deleted_source.journalist_filename, data_dir)
+        schedule_source_collection_deletion(session, deleted_source.journalist_filename, data_dir)
         session.delete(deleted_source)
 
     session.commit()
@@ -435,7 +487,7 @@ def __update_submissions(
         * Submissions belonging to flagged source UUIDs are skipped (this is in order to avoid
           re-downloading locally-deleted submissions during a network race condition).
     * Local submissions not returned in the remote submissions are deleted
-      from the local database.
+      from the local database, and their files on disk are scheduled for deletion.
     """
     local_submissions_by_uuid = {s.uuid: s for s in local_submissions}
     source_cache = SourceCache(session)
@@ -489,15 +541,10 @@ def __update_submissions(
 
     # The uuids remaining in local_uuids do not exist on the remote server, so
     # delete the related records.
-    # We will also collect the journalist designations of deleted submissions to
-    # check if we have left empty directories behind after deletion.
-    deleted_submission_directory_names = set()
     for deleted_submission in local_submissions_by_uuid.values():
-        deleted_submission_directory_names.add(deleted_submission.source.journalist_filename)
-
         # The local method could have deleted these files and submissions already
         try:
-            delete_single_submission_or_reply_on_disk(deleted_submission, data_dir)
+            schedule_submission_or_reply_deletion(session, deleted_submission, data_dir)
             session.delete(deleted_submission)
             logger.debug(f"Deleted {model.__name__} {deleted_submission.uuid}")
         except NoResultFound:
@@ -507,22 +554,13 @@ def __update_submissions(
             )
     session.commit()
 
-    # Check if we left any empty directories when deleting file submissions
-    if model.__name__ == File.__name__:
-        for directory_name in deleted_submission_directory_names:
-            try:
-                logger.debug(f"Cleanup {os.path.join(data_dir, directory_name)} if empty")
-                _cleanup_directory_if_empty(os.path.join(data_dir, directory_name))
-            except OSError:
-                logger.error(f"Could not check {directory_name}")
-
 
 def add_seen_file_records(file_id: int, journalist_uuids: list[str], session: Session) -> None:
     """
     Add a seen record for each journalist that saw the file.
     """
     for journalist_uuid in journalist_uuids:
-        journalist = session.query(User).filter_by(uuid=journalist_uuid).one_or_none()
+        journalist = lookup_by_uuid(session, User).params(uuid=journalist_uuid).one_or_none()
 
         # Do not add seen record if journalist is missing from the local db. If the
         # journalist account needs to be created or deleted, wait until the server says so.
@@ -544,7 +582,7 @@ def add_seen_message_records(msg_id: int, journalist_uuids: list[str], session:
     Add a seen record for each journalist that saw the message.
     """
     for journalist_uuid in journalist_uuids:
-        journalist = session.query(User).filter_by(uuid=journalist_uuid).one_or_none()
+        journalist = lookup_by_uuid(session, User).params(uuid=journalist_uuid).one_or_none()
 
         # Do not add seen record if journalist is missing from the local db. If the
         # journalist account needs to be created or deleted, wait until the server says so.
@@ -566,7 +604,7 @@ def add_seen_reply_records(reply_id: int, journalist_uuids: list[str], session:
     Add a seen record for each journalist that saw the reply.
     """
     for journalist_uuid in journalist_uuids:
-        journalist = session.query(User).filter_by(uuid=journalist_uuid).one_or_none()
+        journalist = lookup_by_uuid(session, User).params(uuid=journalist_uuid).one_or_none()
 
         # Do not add seen record if journalist is missing from the local db. If the
         # journalist account needs to be created or deleted, wait until the server says so.
@@ -614,7 +652,7 @@ def update_replies(
 
         user = user_cache.get(reply.journalist_uuid)
         if not user:
-            user = session.query(User).filter_by(uuid=reply.journalist_uuid).one_or_none()
+            user = lookup_by_uuid(session, User).params(uuid=reply.journalist_uuid).one_or_none()
 
             # If the account for the sender does not exist, then replies will need to be associated
             # to a local "deleted" user account.
@@ -674,7 +712,9 @@ def update_replies(
             # All replies fetched from the server have succeeded in being sent,
             # so we should delete the corresponding draft locally if it exists.
             try:
-                draft_reply_db_object = session.query(DraftReply).filter_by(uuid=reply.uuid).one()
+                draft_reply_db_object = (
+                    lookup_by_uuid(session, DraftReply).params(uuid=reply.uuid).one()
+                )
 
                 update_draft_replies(
                     session,
@@ -695,7 +735,7 @@ def update_replies(
     # delete the related records.
     for deleted_reply in local_replies_by_uuid.values():
         try:
-            delete_single_submission_or_reply_on_disk(deleted_reply, data_dir)
+            schedule_submission_or_reply_deletion(session, deleted_reply, data_dir)
             session.delete(deleted_reply)
             logger.debug(f"Deleted reply {deleted_reply.uuid}")
         except NoResultFound:
@@ -714,7 +754,7 @@ def create_or_update_user(
     If the user does not already exist in the data, a new instance is created.
     If the user exists but user fields have changed, the db is updated.
     """
-    user = session.query(User).filter_by(uuid=uuid).one_or_none()
+    user = lookup_by_uuid(session, User).params(uuid=uuid).one_or_none()
 
     if not user:
         new_user = User(username=username, firstname=firstname, lastname=lastname)
@@ -854,38 +894,57 @@ def find_new_replies(session: Session) -> list[Reply]:
     return q.all()
 
 
-def mark_as_not_downloaded(uuid: str, session: Session) -> None:
+def mark_as_not_downloaded(uuid: str, session: Session, commit: bool = True) -> None:
     """
     Mark File as not downloaded in the database.
     """
-    db_obj = session.query(File).filter_by(uuid=uuid).one()
+    db_obj = lookup_by_uuid(session, File).params(uuid=uuid).one()
     db_obj.is_downloaded = False
     db_obj.is_decrypted = None
     session.add(db_obj)
-    session.commit()
+    update_search_index(session, db_obj)
+    if commit:
+        session.commit()
+
+
+def mark_file_as_opened(uuid: str, session: Session, commit: bool = True) -> None:
+    """
+    Record that the File has just been opened or downloaded.
+    """
+    db_obj = lookup_by_uuid(session, File).params(uuid=uuid).one()
+    db_obj.last_opened_at = datetime.utcnow()
+    session.add(db_obj)
+    if commit:
+        session.commit()
 
 
 def mark_as_downloaded(
-    model_type: type[File] | type[Message] | type[Reply], uuid: str, session: Session
+    model_type: type[File] | type[Message] | type[Reply],
+    uuid: str,
+    session: Session,
+    commit: bool = True,
 ) -> None:
     """
-    Mark object as downloaded in the database.
+    Mark object as downloaded in the database and clear any previous download error.
     """
-    db_obj = session.query(model_type).filter_by(uuid=uuid).one()
+    db_obj = lookup_by_uuid(session, model_type).params(uuid=uuid).one()
     db_obj.is_downloaded = True
+    db_obj.download_error = None
     session.add(db_obj)
-    session.commit()
+    if commit:
+        session.commit()
 
 
-def update_file_size(uuid: str, path: str, session: Session) -> None:
+def update_file_size(uuid: str, path: str, session: Session, commit: bool = True) -> None:
     """
     Updates file size to the decrypted size
     """
-    db_obj = session.query(File).filter_by(uuid=uuid).one()
+    db_obj = lookup_by_uuid(session, File).params(uuid=uuid).one()
     stat = Path(db_obj.location(path)).stat()
     db_obj.size = stat.st_size
     session.add(db_obj)
-    session.commit()
+    if commit:
+        session.commit()
 
 
 def mark_as_decrypted(
@@ -894,60 +953,191 @@ def mark_as_decrypted(
     session: Session,
     is_decrypted: bool = True,
     original_filename: str | None = None,
+    commit: bool = True,
 ) -> None:
     """
-    Mark object as downloaded in the database.
+    Mark object as decrypted in the database. A successful decryption also clears any previous
+    download error.
     """
-    db_obj = session.query(model_type).filter_by(uuid=uuid).one()
+    db_obj = lookup_by_uuid(session, model_type).params(uuid=uuid).one()
     db_obj.is_decrypted = is_decrypted
 
+    if is_decrypted:
+        db_obj.download_error = None
+
     if model_type == File and original_filename:
         db_obj.filename = original_filename
 
     session.add(db_obj)
-    session.commit()
+    update_search_index(session, db_obj)
+    if commit:
+        session.commit()
+
+
+def set_download_error(
+    model_type: type[File] | type[Message] | type[Reply],
+    uuid: str,
+    error_code: DownloadErrorCodes,
+    session: Session,
+    commit: bool = True,
+) -> None:
+    """
+    Record the download error with the given code on the object.
+    """
+    db_obj = lookup_by_uuid(session, model_type).params(uuid=uuid).one()
+    db_obj.download_error = session.query(DownloadError).filter_by(name=error_code.name).one()
+    session.add(db_obj)
+    if commit:
+        session.commit()
 
 
 def set_message_or_reply_content(
-    model_type: type[Message] | type[Reply], uuid: str, content: str, session: Session
+    model_type: type[Message] | type[Reply],
+    uuid: str,
+    content: str,
+    session: Session,
+    commit: bool = True,
 ) -> None:
     """
     Mark whether or not the object is decrypted. If it's not decrypted, do not set content. If the
     object is a File, do not set content (filesystem storage is used instead).
     """
-    db_obj = session.query(model_type).filter_by(uuid=uuid).one_or_none()
+    db_obj = lookup_by_uuid(session, model_type).params(uuid=uuid).one_or_none()
     db_obj.content = content
     session.add(db_obj)
-    session.commit()
+    update_search_index(session, db_obj)
+    if commit:
+        session.commit()
 
 
-def delete_source_collection(journalist_filename: str, data_dir: str) -> None:
-    source_folder = os.path.join(data_dir, journalist_filename)
-    try:
-        shutil.rmtree(source_folder)
-        logging.info(f"Source documents for {journalist_filename} deleted")
-    except FileNotFoundError:
-        logging.info(f"No source documents for {journalist_filename} to delete")
+def update_search_index(session: Session, db_obj: File | Message | Reply) -> None:
+    """
+    Replace the search index entry for the object with its current plaintext: the content of a
+    message or reply, or the original filename of a decrypted file. If there is no plaintext, the
+    object is removed from the index.
 
+    Entries for deleted objects are removed by database triggers, see db.py.
+    """
+    rowid = search_index_rowid(db_obj)
+    session.execute("DELETE FROM search_index WHERE rowid = :rowid", {"rowid": rowid})
+
+    if isinstance(db_obj, File):
+        plaintext = db_obj.filename if db_obj.is_decrypted else None
+    else:
+        plaintext = db_obj.content
+    if not plaintext:
+        return
+
+    session.execute(
+        """
+        INSERT INTO search_index (rowid, source_uuid, item_uuid, content)
+        VALUES (:rowid, :source_uuid, :item_uuid, :content)
+        """,
+        {
+            "rowid": rowid,
+            "source_uuid": db_obj.source.uuid,
+            "item_uuid": db_obj.uuid,
+            "content": plaintext,
+        },
+    )
+
+
+def search(session: Session, query: str, limit: int = 1000) -> list[tuple[str, str]]:
+    """
+    Search the plaintext of messages, replies and file names for items that contain every word in
+    the query, either in full or as the start of a longer word.
+
+    Returns the `limit` best matches as (source uuid, item uuid) pairs, best matches first. The
+    query is treated as plain text rather than FTS5 query syntax, so quotes and operators typed by
+    the user are just words.
+    """
+    words = query.split()
+    if not words:
+        return []
 
-def delete_single_submission_or_reply_on_disk(
-    obj_db: File | Message | Reply, data_dir: str
+    # Quote each word so that it is taken literally, and match it as a prefix so that results
+    # appear as the user types.
+    match = " ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+    results = session.execute(
+        """
+        SELECT source_uuid, item_uuid FROM search_index
+        WHERE search_index MATCH :match
+        ORDER BY rank
+        LIMIT :limit
+        """,
+        {"match": match, "limit": limit},
+    )
+    return [(source_uuid, item_uuid) for source_uuid, item_uuid in results]
+
+
+def schedule_deletion_on_disk(session: Session, path: str) -> None:
+    """
+    Add a tombstone for a file or directory to be deleted from disk by the `DiskDeleter` once the
+    current transaction has been committed.
+    """
+    session.add(PendingDeletion(path=path))
+
+
+def schedule_source_collection_deletion(
+    session: Session, journalist_filename: str, data_dir: str
 ) -> None:
     """
-    Delete on disk any files associated with a single submission or reply.
+    Schedule deletion on disk of all files belonging to a source.
     """
+    schedule_deletion_on_disk(session, os.path.join(data_dir, journalist_filename))
 
-    try:
-        os.remove(obj_db.location(data_dir))
-    except FileNotFoundError:
-        logging.info("Object %s already deleted, skipping", obj_db.location(data_dir))
 
+def schedule_submission_or_reply_deletion(
+    session: Session, obj_db: File | Message | Reply, data_dir: str
+) -> None:
+    """
+    Schedule deletion on disk of any files associated with a single submission or reply.
+    """
     if isinstance(obj_db, File):
-        # Also delete the file's enclosing folder.
+        # Delete the file's enclosing folder, which also contains the encrypted download
+        schedule_deletion_on_disk(session, os.path.dirname(obj_db.location(data_dir)))
+    else:
+        schedule_deletion_on_disk(session, obj_db.location(data_dir))
+
+
+def get_pending_deletions(session: Session) -> list[PendingDeletion]:
+    """
+    Return all tombstones for files and directories still to be deleted, oldest first.
+    """
+    return session.query(PendingDeletion).order_by(PendingDeletion.id).all()
+
+
+def delete_pending_deletion_on_disk(
+    session: Session, pending_deletion: PendingDeletion, data_dir: str
+) -> None:
+    """
+    Delete the file or directory referenced by a tombstone, along with its parent directory if
+    that is left empty, and then remove the tombstone.
+
+    Paths outside of the data directory are never deleted. If deletion fails with an error other
+    than the path already being gone, the tombstone is kept so that deletion is retried later.
+    """
+    path = os.path.realpath(pending_deletion.path)
+    data_dir = os.path.realpath(data_dir)
+    if path == data_dir or os.path.commonpath([path, data_dir]) != data_dir:
+        logger.error("Refusing to delete path outside of the data directory")
+        logger.debug(f"Refusing to delete {path} outside of {data_dir}")
+    else:
         try:
-            shutil.rmtree(os.path.dirname(obj_db.location(data_dir)))
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            logger.info(f"{path} deleted")
         except FileNotFoundError:
-            pass
+            logger.info(f"{path} already deleted, skipping")
+
+        parent_dir = os.path.dirname(path)
+        if parent_dir != data_dir and os.path.isdir(parent_dir):
+            _cleanup_directory_if_empty(parent_dir)
+
+    session.delete(pending_deletion)
+    session.commit()
 
 
 def _cleanup_directory_if_empty(target_dir: str) -> None:
@@ -972,19 +1162,19 @@ def delete_local_conversation_by_source_uuid(session: Session, uuid: str, data_d
     """
     Delete local conversation for a source with a given UUID.
 
-    Deletes database records for files, messages, replies and drafts, as well as
-    downloaded files. Does not delete the source record.
+    Deletes database records for files, messages, replies and drafts, and schedules
+    deletion of downloaded files. Does not delete the source record.
 
     To prevent a network race condition from re-adding deleted records to the database,
     when a source conversation is deleted locally, the source's UUID is added to the
     DeletedConversation table, which tracks local deletion-related database changes and
     is purged after every sync.
     """
-    source = session.query(Source).filter_by(uuid=uuid).one_or_none()
+    source = lookup_by_uuid(session, Source).params(uuid=uuid).one_or_none()
     if source:
         # Delete all source files on disk
-        logger.debug(f"Delete files on disk for source {uuid} from local database.")
-        delete_source_collection(source.journalist_filename, data_dir)
+        logger.debug(f"Schedule deletion of files on disk for source {uuid}.")
+        schedule_source_collection_deletion(session, source.journalist_filename, data_dir)
 
         # Find all associated replies and messages and delete them. Add
         # a record to the DeletedConversation table, which flags the
@@ -1031,7 +1221,11 @@ def _delete_source_collection_from_db(session: Session, source: Source) -> None:
     if is_local_db_modified:
         flagged_conversation = DeletedConversation(uuid=source.uuid)
         try:
-            if not session.query(DeletedConversation).filter_by(uuid=source.uuid).one_or_none():
+            if (
+                not lookup_by_uuid(session, DeletedConversation)
+                .params(uuid=source.uuid)
+                .one_or_none()
+            ):
                 logger.debug(f"Add source {source.uuid} to deletedconversation table")
                 session.add(flagged_conversation)
         except SQLAlchemyError as e:
@@ -1055,25 +1249,84 @@ def source_exists(session: Session, source_uuid: str) -> bool:
         return False
 
 
+def add_queued_job(job_type: str, uuid: str, session: Session, commit: bool = True) -> None:
+    """
+    Record in the job journal that a job was queued, or queued again after it timed out.
+    """
+    queued_job = session.query(QueuedJob).filter_by(job_type=job_type, uuid=uuid).one_or_none()
+    if queued_job is None:
+        session.add(QueuedJob(job_type=job_type, uuid=uuid))
+    else:
+        queued_job.is_started = False
+    if commit:
+        session.commit()
+
+
+def mark_queued_job_as_started(
+    job_type: str, uuid: str, session: Session, commit: bool = True
+) -> None:
+    """
+    Record in the job journal that a queued job started running.
+    """
+    session.query(QueuedJob).filter_by(job_type=job_type, uuid=uuid).update(
+        {QueuedJob.is_started: True}, synchronize_session=False
+    )
+    if commit:
+        session.commit()
+
+
+def delete_queued_job(job_type: str, uuid: str, session: Session, commit: bool = True) -> None:
+    """
+    Remove a job that has finished from the job journal.
+    """
+    session.query(QueuedJob).filter_by(job_type=job_type, uuid=uuid).delete(
+        synchronize_session=False
+    )
+    if commit:
+        session.commit()
+
+
+def get_queued_jobs(session: Session) -> list[QueuedJob]:
+    """
+    Return the jobs in the job journal in the order in which they were first queued.
+    """
+    return session.query(QueuedJob).order_by(QueuedJob.id).all()
+
+
 def get_file(session: Session, uuid: str) -> File | None:
     """
     Get File object by uuid.
     """
-    return session.query(File).filter_by(uuid=uuid).one_or_none()
+    return lookup_by_uuid(session, File).params(uuid=uuid).one_or_none()
 
 
 def get_message(session: Session, uuid: str) -> Message | None:
     """
     Get Message object by uuid.
     """
-    return session.query(Message).filter_by(uuid=uuid).one_or_none()
+    return lookup_by_uuid(session, Message).params(uuid=uuid).one_or_none()
 
 
 def get_reply(session: Session, uuid: str) -> Reply | None:
     """
     Get Reply object by uuid.
     """
-    return session.query(Reply).filter_by(uuid=uuid).one_or_none()
+    return lookup_by_uuid(session, Reply).params(uuid=uuid).one_or_none()
+
+
+def set_draft_reply_ciphertext(
+    uuid: str, ciphertext: str, session: Session, commit: bool = True
+) -> None:
+    """
+    Store the ciphertext of the draft reply with the given uuid, unless the draft has been deleted.
+    """
+    draft_reply = lookup_by_uuid(session, DraftReply).params(uuid=uuid).one_or_none()
+    if draft_reply is None:
+        return
+    draft_reply.ciphertext = ciphertext
+    session.add(draft_reply)
+    if commit:
+        session.commit()
 
 
 def mark_all_pending_drafts_as_failed(session: Session) -> list[DraftReply]:
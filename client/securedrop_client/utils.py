@@ -2,13 +2,18 @@ import gzip
 import logging
 import math
 import os
+import random
 import shutil
 import time
-from collections.abc import Generator
+import zlib
+from collections.abc import Generator, Iterable
 from contextlib import contextmanager
 from pathlib import Path
-from typing import BinaryIO
+from typing import Any, BinaryIO
 
+from sqlalchemy import bindparam
+from sqlalchemy.ext import baked
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.session import Session
 
 from securedrop_client import db
@@ -76,6 +81,46 @@ def safe_gzip_extract(
         safe_copyfileobj(src_file, dest_file, base_path)
 
 
+def safe_gzip_decompress(
+    chunks: Iterable[bytes], dest_path: str, original_filename: str, base_path: str
+) -> Path:
+    """
+    Safely decompress the gzipped data in chunks to dest_path, replacing filename with
+    original_filename, as the chunks arrive. Returns the path of the decompressed file.
+    """
+    dest_dir = Path(dest_path).parent
+    safe_mkdir(base_path, str(dest_dir))
+
+    dest_path_with_original_filename = dest_dir.joinpath(original_filename)
+    check_path_traversal(dest_path_with_original_filename)
+    # Ensure directories of the destination are created safely if they don't exist
+    safe_mkdir(base_path, dest_path_with_original_filename.parent)
+
+    # Like gzip.open, decompress every gzip member that follows the first one
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    is_member_started = False
+    try:
+        with open(dest_path_with_original_filename, "wb") as dest_file:
+            dest_path_with_original_filename.chmod(0o600)
+            for chunk in chunks:
+                while chunk:
+                    is_member_started = True
+                    dest_file.write(decompressor.decompress(chunk))
+                    chunk = b""
+                    if decompressor.eof:
+                        chunk = decompressor.unused_data
+                        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                        is_member_started = False
+            if is_member_started:
+                raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+    except Exception:
+        # Do not leave a partially decompressed file behind
+        dest_path_with_original_filename.unlink(missing_ok=True)
+        raise
+
+    return dest_path_with_original_filename
+
+
 def safe_move(src_path: str, dest_path: str, dest_base_path: str) -> None:
     """
     Safely move src_path to dest_path.
@@ -194,6 +239,16 @@ def humanize_filesize(filesize: int) -> str:
         return f"{math.floor(filesize / 1024**2)}MB"
 
 
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """
+    Return the delay in seconds before retry number `attempt`, counting from 0. The delay doubles
+    with every attempt up to `maximum`, and a random half of it is jitter so that clients that
+    failed at the same time do not all retry at the same time.
+    """
+    delay = min(maximum, base * 2**attempt)
+    return delay / 2 + random.uniform(0, delay / 2)  # noqa: S311
+
+
 @contextmanager
 def chronometer(logger: logging.Logger, description: str) -> Generator:
     """
@@ -207,6 +262,34 @@ def chronometer(logger: logging.Logger, description: str) -> Generator:
         logger.info(f"{description} duration: {elapsed:.4f}s")
 
 
+# Cache of compiled statements for lookups by uuid. The baked queries are keyed by model type so
+# that each model's SELECT is only built and compiled once per process.
+_bakery = baked.bakery()
+_uuid_queries: dict[type, baked.BakedQuery] = {}
+
+
+def lookup_by_uuid(session: Session | scoped_session, model_type: type[Any]) -> baked.Result:
+    """
+    Return a cached query for the object of `model_type` with the uuid given by the `uuid` bound
+    parameter, e.g.:
+
+        lookup_by_uuid(session, db.File).params(uuid=uuid).one_or_none()
+
+    Unlike `session.query(model_type).filter_by(uuid=uuid)`, the SQL for the query is not rebuilt
+    and recompiled on every call.
+    """
+    query = _uuid_queries.get(model_type)
+    if query is None:
+        # model_type is passed to the bakery so that it becomes part of the cache key
+        query = _bakery(lambda s: s.query(model_type), model_type)
+        query += lambda q: q.filter(model_type.uuid == bindparam("uuid"))
+        _uuid_queries[model_type] = query
+    if isinstance(session, scoped_session):
+        # Baked queries need the underlying session rather than the thread-local proxy
+        session = session()
+    return query(session)
+
+
 class SourceCache:
     """
     Caches Sources by UUID.
@@ -219,6 +302,6 @@ class SourceCache:
 
     def get(self, source_uuid: str) -> db.Source | None:
         if source_uuid not in self.cache:
-            source = self.session.query(db.Source).filter_by(uuid=source_uuid).first()
+            source = lookup_by_uuid(self.session, db.Source).params(uuid=source_uuid).first()
             self.cache[source_uuid] = source
         return self.cache.get(source_uuid)
@@ -1,6 +1,13 @@
+from unittest.mock import call
+
 import pytest
 
-from securedrop_client.api_jobs.base import ApiInaccessibleError, ApiJob, SingleObjectApiJob
+from securedrop_client.api_jobs.base import (
+    ApiInaccessibleError,
+    ApiJob,
+    RetryLaterError,
+    SingleObjectApiJob,
+)
 from securedrop_client.sdk import AuthError, RequestTimeoutError, ServerConnectionError
 from tests.factory import dummy_job_factory
 
@@ -71,6 +78,7 @@ def test_ApiJob_auth_error(mocker):
 def test_ApiJob_timeout_error(mocker, exception):
     """If the server times out or is unreachable, the corresponding
     exception should be raised"""
+    mocker.patch("securedrop_client.api_jobs.base.time.sleep")
     return_value = exception()
     api_job_cls = dummy_job_factory(mocker, return_value)
     api_job = api_job_cls()
@@ -103,6 +111,7 @@ def test_ApiJob_other_error(mocker):
 @pytest.mark.parametrize("exception", [RequestTimeoutError, ServerConnectionError])
 def test_ApiJob_retry_succeeds_after_failed_attempt(mocker, exception):
     """Retry logic: after failed attempt should succeed"""
+    mocker.patch("securedrop_client.api_jobs.base.time.sleep")
 
     number_of_attempts = 5
     success_return_value = "now works"
@@ -124,6 +133,7 @@ def test_ApiJob_retry_succeeds_after_failed_attempt(mocker, exception):
 @pytest.mark.parametrize("exception", [RequestTimeoutError, ServerConnectionError])
 def test_ApiJob_retry_exactly_n_attempts_times(mocker, exception):
     """Retry logic: boundary value case - 5th attempt should succeed"""
+    mocker.patch("securedrop_client.api_jobs.base.time.sleep")
 
     number_of_attempts = 5
     success_return_value = "now works"
@@ -145,6 +155,7 @@ def test_ApiJob_retry_exactly_n_attempts_times(mocker, exception):
 @pytest.mark.parametrize("exception", [RequestTimeoutError, ServerConnectionError])
 def test_ApiJob_retry_timeout(mocker, exception):
     """Retry logic: If we exceed the number of attempts, the job will still fail"""
+    mocker.patch("securedrop_client.api_jobs.base.time.sleep")
 
     number_of_attempts = 5
     return_values = [exception()] * (number_of_attempts + 1)
@@ -163,6 +174,49 @@ def test_ApiJob_retry_timeout(mocker, exception):
     assert api_job.failure_signal.emit.called
 
 
+def test_ApiJob_retry_backs_off(mocker):
+    """
+    Retries after a timeout are delayed by a growing backoff, and there is no delay after the last
+    attempt.
+    """
+    sleep = mocker.patch("securedrop_client.api_jobs.base.time.sleep")
+    backoff_delay = mocker.patch(
+        "securedrop_client.api_jobs.base.backoff_delay", side_effect=lambda attempt, *_: attempt
+    )
+    api_job_cls = dummy_job_factory(mocker, [RequestTimeoutError()] * 3)
+    api_job = api_job_cls(remaining_attempts=3)
+
+    with pytest.raises(RequestTimeoutError):
+        api_job._do_call_api(mocker.MagicMock(), mocker.MagicMock())
+
+    assert sleep.call_args_list == [call(0), call(1)]
+    assert backoff_delay.call_count == 2
+
+
+def test_ApiJob_try_call_api_raises_RetryLaterError(mocker):
+    """
+    An attempt that times out with attempts left raises RetryLaterError with a growing backoff delay
+    instead of sleeping, and the job's signals are only emitted once it is done.
+    """
+    sleep = mocker.patch("securedrop_client.api_jobs.base.time.sleep")
+    mocker.patch(
+        "securedrop_client.api_jobs.base.backoff_delay", side_effect=lambda attempt, *_: attempt + 1
+    )
+    api_job_cls = dummy_job_factory(mocker, [RequestTimeoutError(), ServerConnectionError(), "ok"])
+    api_job = api_job_cls()
+
+    for delay in [1, 2]:
+        with pytest.raises(RetryLaterError) as e:
+            api_job._try_call_api(mocker.MagicMock(), mocker.MagicMock())
+        assert e.value.delay == delay
+
+    assert not api_job.failure_signal.emit.called
+    assert api_job._try_call_api(mocker.MagicMock(), mocker.MagicMock())
+    api_job.success_signal.emit.assert_called_once_with("ok")
+    assert api_job.retries == 0
+    sleep.assert_not_called()
+
+
 def test_ApiJob_comparison(mocker):
     return_value = "wat"
     api_job_cls = dummy_job_factory(mocker, return_value)
@@ -197,3 +251,12 @@ def test_SingleObjectApiJob_comparison_obj_with_uuid_attr(mocker):
     test_job_with_uuid_2 = SingleObjectApiJob("uuid1")
 
     assert test_job_with_uuid == test_job_with_uuid_2
+
+
+def test_SingleObjectApiJob_hash(mocker):
+    """
+    Equal jobs hash equally, so that queues can index them.
+    """
+    assert hash(SingleObjectApiJob("uuid1")) == hash(SingleObjectApiJob("uuid1"))
+    assert len({SingleObjectApiJob("uuid1"), SingleObjectApiJob("uuid1")}) == 1
+    assert len({SingleObjectApiJob("uuid1"), SingleObjectApiJob("uuid2")}) == 2
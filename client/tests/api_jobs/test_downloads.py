@@ -1,9 +1,13 @@
 import math
 import os
+import threading
+import time
 
 import pytest
+from PyQt5.QtTest import QSignalSpy
 
 from securedrop_client.api_jobs.downloads import (
+    DecryptionStage,
     DownloadChecksumMismatchException,
     DownloadDecryptionException,
     DownloadJob,
@@ -12,6 +16,7 @@ from securedrop_client.api_jobs.downloads import (
     ReplyDownloadJob,
 )
 from securedrop_client.crypto import CryptoError, GpgHelper
+from securedrop_client.database import DatabaseWriter
 from securedrop_client.sdk import BaseError
 from securedrop_client.sdk import Submission as SdkSubmission
 from tests import factory
@@ -56,8 +61,8 @@ def test_ReplyDownloadJob_no_download_or_decrypt(mocker, homedir, session, sessi
     gpg = GpgHelper(homedir, session_maker, is_qubes=False)
     job_1 = ReplyDownloadJob(reply_is_decrypted_false.uuid, homedir, gpg)
     job_2 = ReplyDownloadJob(reply_is_decrypted_none.uuid, homedir, gpg)
-    mocker.patch.object(job_1.gpg, "decrypt_submission_or_reply")
-    mocker.patch.object(job_2.gpg, "decrypt_submission_or_reply")
+    mocker.patch.object(job_1.gpg, "decrypt_message_or_reply", return_value="")
+    mocker.patch.object(job_2.gpg, "decrypt_message_or_reply", return_value="")
     api_client = mocker.MagicMock()
     api_client.default_request_timeout = mocker.MagicMock()
     path = os.path.join(homedir, "data")
@@ -83,7 +88,7 @@ def test_ReplyDownloadJob_message_already_decrypted(mocker, homedir, session, se
     session.commit()
     gpg = GpgHelper(homedir, session_maker, is_qubes=False)
     job = ReplyDownloadJob(reply.uuid, homedir, gpg)
-    decrypt_fn = mocker.patch.object(job.gpg, "decrypt_submission_or_reply")
+    decrypt_fn = mocker.patch.object(job.gpg, "decrypt_message_or_reply")
     api_client = mocker.MagicMock()
     download_fn = mocker.patch.object(api_client, "download_reply")
 
@@ -103,7 +108,7 @@ def test_ReplyDownloadJob_message_already_downloaded(mocker, homedir, session, s
     session.commit()
     gpg = GpgHelper(homedir, session_maker, is_qubes=False)
     job = ReplyDownloadJob(reply.uuid, homedir, gpg)
-    mocker.patch.object(job.gpg, "decrypt_submission_or_reply")
+    mocker.patch.object(job.gpg, "decrypt_message_or_reply", return_value="")
     api_client = mocker.MagicMock()
     api_client.default_request_timeout = mocker.MagicMock()
     download_fn = mocker.patch.object(api_client, "download_reply")
@@ -127,7 +132,7 @@ def test_ReplyDownloadJob_happiest_path(mocker, homedir, session, session_maker)
     session.commit()
     gpg = GpgHelper(homedir, session_maker, is_qubes=False)
     job = ReplyDownloadJob(reply.uuid, homedir, gpg)
-    mocker.patch.object(job.gpg, "decrypt_submission_or_reply")
+    mocker.patch.object(job.gpg, "decrypt_message_or_reply", return_value="")
     api_client = mocker.MagicMock()
     api_client.default_request_timeout = mocker.MagicMock()
     data_dir = os.path.join(homedir, "data")
@@ -157,8 +162,8 @@ def test_MessageDownloadJob_no_download_or_decrypt(mocker, homedir, session, ses
     gpg = GpgHelper(homedir, session_maker, is_qubes=False)
     job_1 = MessageDownloadJob(message_is_decrypted_false.uuid, homedir, gpg)
     job_2 = MessageDownloadJob(message_is_decrypted_none.uuid, homedir, gpg)
-    mocker.patch.object(job_1.gpg, "decrypt_submission_or_reply")
-    mocker.patch.object(job_2.gpg, "decrypt_submission_or_reply")
+    mocker.patch.object(job_1.gpg, "decrypt_message_or_reply", return_value="")
+    mocker.patch.object(job_2.gpg, "decrypt_message_or_reply", return_value="")
     api_client = mocker.MagicMock()
     api_client.default_request_timeout = mocker.MagicMock()
     path = os.path.join(homedir, "data")
@@ -186,7 +191,7 @@ def test_MessageDownloadJob_message_already_decrypted(
     session.commit()
     gpg = GpgHelper(homedir, session_maker, is_qubes=False)
     job = MessageDownloadJob(message.uuid, homedir, gpg)
-    decrypt_fn = mocker.patch.object(job.gpg, "decrypt_submission_or_reply")
+    decrypt_fn = mocker.patch.object(job.gpg, "decrypt_message_or_reply")
     api_client = mocker.MagicMock()
     api_client.default_request_timeout = mocker.MagicMock()
     download_fn = mocker.patch.object(api_client, "download_submission")
@@ -209,7 +214,7 @@ def test_MessageDownloadJob_message_already_downloaded(
     session.commit()
     gpg = GpgHelper(homedir, session_maker, is_qubes=False)
     job = MessageDownloadJob(message.uuid, homedir, gpg)
-    mocker.patch.object(job.gpg, "decrypt_submission_or_reply")
+    mocker.patch.object(job.gpg, "decrypt_message_or_reply", return_value="")
     api_client = mocker.MagicMock()
     api_client.default_request_timeout = mocker.MagicMock()
     download_fn = mocker.patch.object(api_client, "download_submission")
@@ -233,14 +238,44 @@ def test_MessageDownloadJob_happiest_path(mocker, homedir, session, session_make
     session.commit()
     gpg = GpgHelper(homedir, session_maker, is_qubes=False)
     job = MessageDownloadJob(message.uuid, homedir, gpg)
-    mocker.patch.object(job.gpg, "decrypt_submission_or_reply")
+    mocker.patch.object(job.gpg, "decrypt_message_or_reply", return_value="")
+    api_client = mocker.MagicMock()
+    api_client.default_request_timeout = mocker.MagicMock()
+    data_dir = os.path.join(homedir, "data")
+    api_client.download_submission = mocker.MagicMock(return_value=("", data_dir))
+
+    job.call_api(api_client, session)
+
+    assert message.content is not None
+    assert message.is_downloaded is True
+    assert message.is_decrypted is True
+
+
+def test_MessageDownloadJob_happiest_path_with_database_writer(
+    mocker, homedir, session, session_maker
+):
+    """
+    Test that status writes go through the database writer when the job has one.
+    """
+    message = factory.Message(
+        source=factory.Source(), is_downloaded=False, is_decrypted=None, content=None
+    )
+    session.add(message)
+    session.commit()
+    gpg = GpgHelper(homedir, session_maker, is_qubes=False)
+    writer = DatabaseWriter(session_maker)
+    submit = mocker.spy(writer, "submit")
+    job = MessageDownloadJob(message.uuid, homedir, gpg, writer)
+    mocker.patch.object(job.gpg, "decrypt_message_or_reply", return_value="")
     api_client = mocker.MagicMock()
     api_client.default_request_timeout = mocker.MagicMock()
     data_dir = os.path.join(homedir, "data")
     api_client.download_submission = mocker.MagicMock(return_value=("", data_dir))
 
     job.call_api(api_client, session)
+    writer.stop()
 
+    assert submit.call_count == 3
     assert message.content is not None
     assert message.is_downloaded is True
     assert message.is_decrypted is True
@@ -260,7 +295,7 @@ def test_MessageDownloadJob_with_base_error(mocker, homedir, session, session_ma
     api_client = mocker.MagicMock()
     api_client.default_request_timeout = mocker.MagicMock()
     mocker.patch.object(api_client, "download_submission", side_effect=BaseError)
-    decrypt_fn = mocker.patch.object(job.gpg, "decrypt_submission_or_reply")
+    decrypt_fn = mocker.patch.object(job.gpg, "decrypt_message_or_reply")
 
     with pytest.raises(DownloadDecryptionException):
         job.call_api(api_client, session)
@@ -285,7 +320,7 @@ def test_MessageDownloadJob_with_crypto_error(
     session.commit()
     gpg = GpgHelper(homedir, session_maker, is_qubes=False)
     job = MessageDownloadJob(message.uuid, homedir, gpg)
-    mocker.patch.object(job.gpg, "decrypt_submission_or_reply", side_effect=CryptoError)
+    mocker.patch.object(job.gpg, "decrypt_message_or_reply", side_effect=CryptoError)
     api_client = mocker.MagicMock()
     api_client.default_request_timeout = mocker.MagicMock()
     path = os.path.join(homedir, "data")
@@ -299,6 +334,302 @@ def test_MessageDownloadJob_with_crypto_error(
     assert message.is_decrypted is False
 
 
+def test_MessageDownloadJob_with_decryption_stage(mocker, qtbot, homedir, session, session_maker):
+    """
+    Test that a job with a decryption stage returns once the message is downloaded, and emits
+    success_signal only once the stage has decrypted it.
+    """
+    message = factory.Message(
+        source=factory.Source(), is_downloaded=False, is_decrypted=None, content=None
+    )
+    session.add(message)
+    session.commit()
+    gpg = GpgHelper(homedir, session_maker, is_qubes=False)
+    stage = DecryptionStage(session_maker)
+    job = MessageDownloadJob(message.uuid, homedir, gpg, decryption_stage=stage)
+    release = threading.Event()
+    mocker.patch.object(
+        job.gpg, "decrypt_message_or_reply", side_effect=lambda filepath: release.wait() and ""
+    )
+    api_client = mocker.MagicMock()
+    api_client.default_request_timeout = mocker.MagicMock()
+    data_dir = os.path.join(homedir, "data")
+    api_client.download_submission = mocker.MagicMock(return_value=("", data_dir))
+    success_spy = QSignalSpy(job.success_signal)
+    failure_spy = QSignalSpy(job.failure_signal)
+
+    job._do_call_api(api_client, session)
+
+    assert message.is_downloaded is True
+    assert len(success_spy) == 0
+    assert not stage.is_idle()
+
+    release.set()
+    qtbot.waitUntil(stage.is_idle)
+    stage.stop()
+
+    assert list(success_spy) == [[message.uuid]]
+    assert len(failure_spy) == 0
+    session.refresh(message)
+    assert message.is_decrypted is True
+
+
+def test_MessageDownloadJob_with_decryption_stage_crypto_error(
+    mocker, qtbot, homedir, session, session_maker, download_error_codes
+):
+    """
+    Test that failure_signal is emitted by the decryption stage when decryption fails.
+    """
+    message = factory.Message(
+        source=factory.Source(), is_downloaded=True, is_decrypted=None, content=None
+    )
+    session.add(message)
+    session.commit()
+    gpg = GpgHelper(homedir, session_maker, is_qubes=False)
+    stage = DecryptionStage(session_maker)
+    job = MessageDownloadJob(message.uuid, homedir, gpg, decryption_stage=stage)
+    mocker.patch.object(job.gpg, "decrypt_message_or_reply", side_effect=CryptoError)
+    success_spy = QSignalSpy(job.success_signal)
+    failure_spy = QSignalSpy(job.failure_signal)
+
+    job._do_call_api(mocker.MagicMock(), session)
+    qtbot.waitUntil(lambda: len(failure_spy) == 1)
+    stage.stop()
+
+    assert len(success_spy) == 0
+    assert isinstance(failure_spy[0][0], DownloadDecryptionException)
+    session.refresh(message)
+    assert message.is_decrypted is False
+
+
+def test_DecryptionStage_batches_waiting_messages(
+    mocker, qtbot, homedir, session, session_maker, download_error_codes
+):
+    """
+    Test that messages that are waiting to be decrypted are decrypted together, and that a message
+    that fails to decrypt does not fail the rest of its batch.
+    """
+    source = factory.Source()
+    messages = [
+        factory.Message(source=source, is_downloaded=True, is_decrypted=None, content=None)
+        for _ in range(3)
+    ]
+    session.add_all(messages)
+    session.commit()
+    gpg = GpgHelper(homedir, session_maker, is_qubes=False)
+    release = threading.Event()
+    mocker.patch.object(
+        gpg, "decrypt_message_or_reply", side_effect=lambda filepath: release.wait() and ""
+    )
+    decrypt_batch = mocker.patch.object(
+        gpg, "decrypt_messages_or_replies", return_value=["second", CryptoError("bad")]
+    )
+    stage = DecryptionStage(session_maker, num_workers=1, batch_window=0)
+    jobs = [
+        MessageDownloadJob(message.uuid, homedir, gpg, decryption_stage=stage)
+        for message in messages
+    ]
+    success_spy = QSignalSpy(jobs[1].success_signal)
+    failure_spy = QSignalSpy(jobs[2].failure_signal)
+
+    stage.submit(jobs[0], "first")  # decrypted on its own
+    qtbot.waitUntil(lambda: stage._pending.empty())
+    stage.submit(jobs[1], "second")
+    stage.submit(jobs[2], "third")
+    release.set()
+    qtbot.waitUntil(stage.is_idle)
+    stage.stop()
+
+    decrypt_batch.assert_called_once_with(["second", "third"])
+    assert list(success_spy) == [[messages[1].uuid]]
+    assert len(failure_spy) == 1
+    assert isinstance(failure_spy[0][0], DownloadDecryptionException)
+    session.refresh(messages[1])
+    session.refresh(messages[2])
+    assert messages[1].content == "second"
+    assert messages[1].is_decrypted is True
+    assert messages[2].is_decrypted is False
+
+
+def test_DecryptionStage_batches_messages_arriving_to_idle_workers(
+    mocker, qtbot, homedir, session, session_maker
+):
+    """
+    Test that messages that arrive one after the other while several workers are idle are
+    decrypted in one batch rather than one by each worker.
+    """
+    source = factory.Source()
+    messages = [
+        factory.Message(source=source, is_downloaded=True, is_decrypted=None, content=None)
+        for _ in range(3)
+    ]
+    session.add_all(messages)
+    session.commit()
+    gpg = GpgHelper(homedir, session_maker, is_qubes=False)
+    decrypt = mocker.patch.object(gpg, "decrypt_message_or_reply", return_value="")
+    decrypt_batch = mocker.patch.object(
+        gpg, "decrypt_messages_or_replies", side_effect=lambda filepaths: list(filepaths)
+    )
+    stage = DecryptionStage(session_maker, num_workers=4, batch_window=1)
+    jobs = [
+        MessageDownloadJob(message.uuid, homedir, gpg, decryption_stage=stage)
+        for message in messages
+    ]
+
+    for i, job in enumerate(jobs):
+        stage.submit(job, f"message-{i}")
+        time.sleep(0.01)
+    qtbot.waitUntil(stage.is_idle, timeout=5000)
+    stage.stop()
+
+    decrypt.assert_not_called()
+    decrypt_batch.assert_called_once_with(["message-0", "message-1", "message-2"])
+    for message in messages:
+        session.refresh(message)
+    assert [message.content for message in messages] == ["message-0", "message-1", "message-2"]
+
+
+def test_DecryptionStage_backpressure(mocker, qtbot):
+    """
+    Test that submit blocks once MAX_PENDING files are waiting, and that a job that is already
+    waiting or being decrypted is not decrypted again but emits its signal with the equal job.
+    """
+    release = threading.Event()
+    decrypted = []
+
+    def finish_decryption(job, filepath, session):
+        release.wait()
+        decrypted.append(filepath)
+
+    mocker.patch.object(
+        DownloadJob, "finish_decryption", autospec=True, side_effect=finish_decryption
+    )
+    stage = DecryptionStage(mocker.MagicMock(), num_workers=1, max_pending=1)
+    jobs = [DownloadJob("data", f"uuid-{i}") for i in range(3)]
+
+    stage.submit(jobs[0], "first")  # taken by the worker
+    qtbot.waitUntil(lambda: stage._pending.empty())
+    stage.submit(jobs[1], "second")  # waits
+    duplicate = DownloadJob("data", "uuid-1")
+    duplicate_spy = QSignalSpy(duplicate.success_signal)
+    stage.submit(duplicate, "duplicate")  # not decrypted again
+    submitting = threading.Thread(target=stage.submit, args=(jobs[2], "third"))
+    submitting.start()
+    submitting.join(0.1)
+    assert submitting.is_alive()
+
+    release.set()
+    submitting.join()
+    qtbot.waitUntil(stage.is_idle)
+    stage.stop()
+
+    assert decrypted == ["first", "second", "third"]
+    qtbot.waitUntil(lambda: len(duplicate_spy) == 1)
+    assert list(duplicate_spy) == [["uuid-1"]]
+
+
+def test_DecryptionStage_emits_in_submission_order_per_source(mocker, qtbot):
+    """
+    Test that a job whose file is decrypted before the file of an earlier job of the same source
+    emits its signal after the earlier job, while jobs of other sources are not held back.
+    """
+    release = threading.Event()
+
+    def finish_decryption(job, filepath, session, plaintext=None):
+        if filepath == "slow":
+            release.wait()
+
+    mocker.patch.object(
+        DownloadJob, "finish_decryption", autospec=True, side_effect=finish_decryption
+    )
+    stage = DecryptionStage(mocker.MagicMock(), num_workers=2)
+    first = DownloadJob("data", "uuid-1", source_uuid="source-1")
+    second = DownloadJob("data", "uuid-2", source_uuid="source-1")
+    other = DownloadJob("data", "uuid-3", source_uuid="source-2")
+    emitted = []
+    for job in (first, second, other):
+        job.success_signal.connect(emitted.append)
+
+    stage.submit(first, "slow")
+    stage.submit(second, "fast")
+    stage.submit(other, "fast")
+    qtbot.waitUntil(lambda: emitted == ["uuid-3"])
+    assert not stage.is_idle()
+
+    release.set()
+    qtbot.waitUntil(stage.is_idle)
+    stage.stop()
+
+    qtbot.waitUntil(lambda: len(emitted) == 3)
+    assert emitted == ["uuid-3", "uuid-1", "uuid-2"]
+
+
+def test_DecryptionStage_does_not_hold_messages_behind_slow_file(mocker, qtbot):
+    """
+    Test that a message whose file is decrypted while an earlier, slow file download of the same
+    source is still being decrypted emits its signal without waiting for the file.
+    """
+    release = threading.Event()
+
+    def finish_decryption(job, filepath, session, plaintext=None):
+        if filepath == "slow":
+            release.wait()
+
+    mocker.patch.object(
+        DownloadJob, "finish_decryption", autospec=True, side_effect=finish_decryption
+    )
+    stage = DecryptionStage(mocker.MagicMock(), num_workers=2)
+    document = FileDownloadJob("uuid-1", "data", mocker.MagicMock(), source_uuid="source-1")
+    message = MessageDownloadJob("uuid-2", "data", mocker.MagicMock(), source_uuid="source-1")
+    mocker.patch.object(message, "batch_decryption_gpg", return_value=None)
+    emitted = []
+    for job in (document, message):
+        job.success_signal.connect(emitted.append)
+
+    stage.submit(document, "slow")
+    stage.submit(message, "fast")
+    qtbot.waitUntil(lambda: emitted == ["uuid-2"])
+    assert not stage.is_idle()
+
+    release.set()
+    qtbot.waitUntil(stage.is_idle)
+    stage.stop()
+
+    qtbot.waitUntil(lambda: len(emitted) == 2)
+    assert emitted == ["uuid-2", "uuid-1"]
+
+
+def test_DecryptionStage_fails_jobs_on_unexpected_error(mocker, qtbot):
+    """
+    Test that a job whose decryption raises an unexpected error emits failure_signal and is
+    released, and that the worker goes on to decrypt the next file.
+    """
+    error = RuntimeError("unexpected")
+
+    def finish_decryption(job, filepath, session, plaintext=None):
+        if filepath == "broken":
+            raise error
+
+    mocker.patch.object(
+        DownloadJob, "finish_decryption", autospec=True, side_effect=finish_decryption
+    )
+    stage = DecryptionStage(mocker.MagicMock(), num_workers=1)
+    broken = DownloadJob("data", "uuid-1")
+    fine = DownloadJob("data", "uuid-2")
+    failures = []
+    successes = []
+    broken.failure_signal.connect(failures.append)
+    fine.success_signal.connect(successes.append)
+
+    stage.submit(broken, "broken")
+    stage.submit(fine, "fine")
+    qtbot.waitUntil(stage.is_idle)
+    stage.stop()
+
+    assert failures == [error]
+    assert successes == ["uuid-2"]
+
+
 def test_FileDownloadJob_message_already_decrypted(mocker, homedir, session, session_maker):
     """
     Test that call_api just returns uuid if already decrypted.
@@ -64,3 +64,20 @@ def test_seen_with_reply_only(homedir, mocker, session, source):
     job.call_api(api_client, session)
 
     api_client.seen.assert_called_once_with([], [], [reply.uuid])
+
+
+def test_seen_cancel_for_sources():
+    """
+    Check that the items of deleted sources are dropped, and that the job is cancelled once no
+    items are left.
+    """
+    job = SeenJob(["file-1"], ["message-1"], [], "source-1")
+    job.coalesce(SeenJob([], ["message-2"], ["reply-2"], "source-2"))
+
+    assert not job.cancel_for_sources({"source-3"})
+    assert not job.cancel_for_sources({"source-1"})
+    assert job.files == []
+    assert job.messages == ["message-2"]
+    assert job.replies == ["reply-2"]
+
+    assert job.cancel_for_sources({"source-2"}, conversation_only=True)
@@ -326,6 +326,8 @@ def test_MetadataSyncJob_success(mocker, homedir, session, session_maker):
     job.call_api(api_client, session)
 
     assert mock_get_remote_data.call_count == 1
+    # The sync uses the rate limiter's reserved budget
+    api_client.rate_limiter.reserved.assert_called_once_with()
 
 
 def test_MetadataSyncJob_success_current_user_name_change(mocker, homedir, session, session_maker):
@@ -4,11 +4,13 @@ import pytest
 
 from securedrop_client import db, sdk
 from securedrop_client.api_jobs.uploads import (
+    ReplyEncryptor,
     SendReplyJob,
     SendReplyJobError,
     SendReplyJobTimeoutError,
 )
 from securedrop_client.crypto import CryptoError, GpgHelper
+from securedrop_client.storage import search
 from tests import factory
 
 
@@ -60,6 +62,9 @@ def test_send_reply_success(homedir, mocker, session, session_maker, reply_statu
     reply = session.query(db.Reply).filter_by(uuid=msg_uuid).one()
     assert reply.journalist_id == user.id
 
+    # assert reply content is searchable
+    assert search(session, msg) == [(source.uuid, msg_uuid)]
+
 
 def test_send_reply_fails_when_no_user(homedir, mocker, session, session_maker, reply_status_codes):
     """
@@ -439,3 +444,86 @@ def test_source_deleted_locally(homedir, mocker, session, session_maker, reply_s
     )
     with pytest.raises(SendReplyJobError, match=error):
         job.call_api(mocker.MagicMock(), session)
+
+
+def test_send_reply_uploads_ciphertext_of_draft(
+    homedir, mocker, session, session_maker, reply_status_codes
+):
+    """
+    Check that a reply which the ReplyEncryptor has already encrypted is uploaded without being
+    encrypted again.
+    """
+    source = factory.Source()
+    session.add(source)
+    draft_reply = factory.DraftReply(uuid="mock_reply_uuid", ciphertext="s3kr1t m3ss1dg3")
+    session.add(draft_reply)
+    user = factory.User(uuid="journalist ID sending the reply")
+    session.add(user)
+    session.commit()
+
+    api_client = mocker.MagicMock()
+    api_client.token_journalist_uuid = "journalist ID sending the reply"
+    api_client.reply_source.return_value = sdk.Reply(
+        uuid="mock_reply_uuid", filename="5-dummy-reply.gpg"
+    )
+    mocker.patch("securedrop_client.sdk.Source", return_value=mocker.Mock())
+
+    gpg = GpgHelper(homedir, session_maker, is_qubes=False)
+    mock_encrypt = mocker.patch.object(gpg, "encrypt_to_source")
+
+    job = SendReplyJob(source.uuid, "mock_reply_uuid", "wat", gpg)
+    job.call_api(api_client, session)
+
+    mock_encrypt.assert_not_called()
+    assert api_client.reply_source.call_args[0][1] == "s3kr1t m3ss1dg3"
+
+
+def test_ReplyEncryptor_stores_ciphertext(homedir, mocker, qtbot, session, session_maker):
+    source = factory.Source()
+    session.add(source)
+    draft_reply = factory.DraftReply(uuid="mock_reply_uuid")
+    session.add(draft_reply)
+    session.commit()
+
+    gpg = GpgHelper(homedir, session_maker, is_qubes=False)
+    mock_encrypt = mocker.patch.object(gpg, "encrypt_to_source", return_value="s3kr1t m3ss1dg3")
+    encryptor = ReplyEncryptor(session_maker, gpg)
+    encrypted = []
+    encryptor.encrypted.connect(encrypted.append)
+
+    job = SendReplyJob(source.uuid, "mock_reply_uuid", "wat", gpg)
+    encryptor.submit(job)
+    qtbot.waitUntil(lambda: encrypted == [job])
+    encryptor.stop()
+
+    mock_encrypt.assert_called_once_with(source.uuid, "wat")
+    session.refresh(draft_reply)
+    assert draft_reply.ciphertext == "s3kr1t m3ss1dg3"
+
+
+def test_ReplyEncryptor_queues_job_when_encryption_fails(
+    homedir, mocker, qtbot, session, session_maker
+):
+    """
+    Check that a reply which cannot be encrypted is still queued, so that its job reports the
+    failure.
+    """
+    source = factory.Source()
+    session.add(source)
+    draft_reply = factory.DraftReply(uuid="mock_reply_uuid")
+    session.add(draft_reply)
+    session.commit()
+
+    gpg = GpgHelper(homedir, session_maker, is_qubes=False)
+    mocker.patch.object(gpg, "encrypt_to_source", side_effect=CryptoError("mock_error"))
+    encryptor = ReplyEncryptor(session_maker, gpg)
+    encrypted = []
+    encryptor.encrypted.connect(encrypted.append)
+
+    job = SendReplyJob(source.uuid, "mock_reply_uuid", "wat", gpg)
+    encryptor.submit(job)
+    qtbot.waitUntil(lambda: encrypted == [job])
+    encryptor.stop()
+
+    session.refresh(draft_reply)
+    assert draft_reply.ciphertext is None
@@ -527,6 +527,74 @@ def test_MainView_setup(mocker):
     mv.source_list.setup.assert_called_once_with(controller)
 
 
+def test_MainView_search(mocker):
+    """
+    Ensure the source list is filtered by the sources matching the text in the search box.
+    """
+    mv = MainView(None)
+    mv.source_list = mocker.MagicMock()
+    mv.controller = mocker.MagicMock()
+    mv.controller.search_sources.return_value = ["source-uuid"]
+
+    mv.top_pane.search_box.setText("landing")
+    assert mv.search_timer.isActive()
+    mv.search()
+
+    mv.controller.search_sources.assert_called_once_with("landing")
+    mv.source_list.filter_sources.assert_called_once_with("landing", ["source-uuid"])
+
+
+def test_MainView_search_cleared(mocker):
+    """
+    Ensure an empty search shows every source without querying the index.
+    """
+    mv = MainView(None)
+    mv.source_list = mocker.MagicMock()
+    mv.controller = mocker.MagicMock()
+
+    mv.top_pane.search_box.setText("  ")
+    mv.search()
+
+    mv.controller.search_sources.assert_not_called()
+    mv.source_list.filter_sources.assert_called_once_with("  ", [])
+
+
+def test_MainView_refresh_search(mocker):
+    """
+    Ensure an active search is re-applied when the search index changes, and that nothing is
+    searched when the search box is empty.
+    """
+    mv = MainView(None)
+    mv.source_list = mocker.MagicMock()
+    mv.controller = mocker.MagicMock()
+
+    mv.refresh_search()
+    assert not mv.search_timer.isActive()
+
+    mv.top_pane.search_box.setText("landing")
+    mv.search_timer.stop()
+    mv.refresh_search()
+    assert mv.search_timer.isActive()
+
+
+def test_MainView_refresh_search_on_index_update(mocker):
+    """
+    Ensure the search is refreshed when a sync or a decryption updates the search index.
+    """
+    mv = MainView(None)
+    mv.source_list = mocker.MagicMock()
+    mv.refresh_search = mocker.MagicMock()
+    controller = mocker.MagicMock()
+
+    mv.setup(controller)
+    controller.message_ready.connect.assert_called_once_with(mv.refresh_search)
+    controller.reply_ready.connect.assert_called_once_with(mv.refresh_search)
+    controller.file_ready.connect.assert_called_once_with(mv.refresh_search)
+
+    mv.show_sources([])
+    mv.refresh_search.assert_called_once_with()
+
+
 def test_MainView_show_sources_with_none_selected(mocker):
     """
     Ensure the sources list is passed to the source list widget to be updated.
@@ -1120,6 +1188,42 @@ def test_SourceList_initial_update_adds_new_sources(mocker):
     sl.add_source.assert_called_once_with(sources)
 
 
+def test_SourceList_filter_sources(mocker):
+    """
+    Only sources matching the search, by content or by designation, are shown, including sources
+    added while the filter is active.
+    """
+    sl = SourceList()
+    sl.controller = mocker.MagicMock()
+    sl.update_sources(
+        [
+            factory.Source(uuid="content-match", journalist_designation="alpha bravo"),
+            factory.Source(uuid="name-match", journalist_designation="landing craft"),
+            factory.Source(uuid="no-match", journalist_designation="charlie delta"),
+        ]
+    )
+
+    sl.filter_sources("Landing", ["content-match"])
+
+    assert not sl.source_items["content-match"].isHidden()
+    assert not sl.source_items["name-match"].isHidden()
+    assert sl.source_items["no-match"].isHidden()
+
+    sl.update_sources(
+        [
+            factory.Source(uuid="content-match"),
+            factory.Source(uuid="name-match"),
+            factory.Source(uuid="no-match"),
+            factory.Source(uuid="new-source", journalist_designation="echo foxtrot"),
+        ]
+    )
+    assert sl.source_items["new-source"].isHidden()
+
+    sl.filter_sources("", [])
+
+    assert not any(item.isHidden() for item in sl.source_items.values())
+
+
 def test_SourceList_update_when_source_deleted(mocker, session, session_maker, homedir):
     """
     Test that SourceWidget.update gracefully continues when source is deleted during an update.
@@ -0,0 +1,46 @@
+import os
+import subprocess
+
+from sqlalchemy import text
+from sqlalchemy.orm import scoped_session
+
+AUTO_VACUUM_NONE = 0
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class UpgradeTester:
+    """The database uses incremental auto-vacuum and keeps its data."""
+
+    def __init__(self, homedir: str, session: scoped_session) -> None:
+        subprocess.check_call(["sqlite3", os.path.join(homedir, "svs.sqlite"), ".databases"])
+        self.session = session
+
+    def load_data(self):
+        self.session.execute(
+            text(
+                """
+                INSERT INTO sources (uuid, journalist_designation, document_count,
+                    interaction_count)
+                VALUES ('source-uuid', 'benign pineapple', 0, 0)
+                """
+            )
+        )
+        self.session.commit()
+
+    def check_upgrade(self):
+        assert self.session.execute(text("PRAGMA auto_vacuum")).scalar() == AUTO_VACUUM_INCREMENTAL
+        assert self.session.execute(text("SELECT uuid FROM sources")).scalar() == "source-uuid"
+
+
+class DowngradeTester:
+    """The database no longer uses auto-vacuum."""
+
+    def __init__(self, homedir: str, session: scoped_session) -> None:
+        subprocess.check_call(["sqlite3", os.path.join(homedir, "svs.sqlite"), ".databases"])
+        self.session = session
+
+    def load_data(self):
+        pass
+
+    def check_downgrade(self):
+        assert self.session.execute(text("PRAGMA auto_vacuum")).scalar() == AUTO_VACUUM_NONE
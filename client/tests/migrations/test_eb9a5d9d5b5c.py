@@ -0,0 +1,108 @@
+import os
+import subprocess
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import scoped_session
+
+
+def add_source(session: scoped_session) -> None:
+    session.execute(
+        text(
+            """
+            INSERT INTO sources (id, uuid, journalist_designation, document_count,
+                interaction_count)
+            VALUES (1, 'source-uuid', 'benign pineapple', 3, 3)
+            """
+        )
+    )
+
+
+def add_items(session: scoped_session) -> None:
+    for uuid, file_counter, content in [
+        ("message-uuid", 1, "'the eagle has landed'"),
+        ("undecrypted-message-uuid", 2, "NULL"),
+    ]:
+        session.execute(
+            text(
+                f"""
+                INSERT INTO messages (uuid, source_id, filename, file_counter, size, download_url,
+                    content, is_downloaded, last_updated)
+                VALUES ('{uuid}', 1, '{file_counter}-msg.gpg', {file_counter}, 123,
+                    'http://localhost/', {content}, 1, CURRENT_TIMESTAMP)
+                """  # noqa: S608
+            )
+        )
+    session.execute(
+        text(
+            """
+            INSERT INTO replies (uuid, source_id, filename, file_counter, size, content,
+                is_downloaded, last_updated)
+            VALUES ('reply-uuid', 1, '3-reply.gpg', 3, 123, 'thanks for the landing report', 1,
+                CURRENT_TIMESTAMP)
+            """
+        )
+    )
+    session.execute(
+        text(
+            """
+            INSERT INTO files (uuid, source_id, filename, file_counter, size, download_url,
+                is_downloaded, is_decrypted, last_updated)
+            VALUES ('file-uuid', 1, 'landing-site.pdf', 4, 123, 'http://localhost/', 1, 1,
+                CURRENT_TIMESTAMP)
+            """
+        )
+    )
+
+
+class UpgradeTester:
+    """Existing plaintext is indexed and deleted items are removed from the index."""
+
+    def __init__(self, homedir: str, session: scoped_session) -> None:
+        subprocess.check_call(["sqlite3", os.path.join(homedir, "svs.sqlite"), ".databases"])
+        self.session = session
+
+    def load_data(self):
+        add_source(self.session)
+        add_items(self.session)
+        self.session.commit()
+
+    def check_upgrade(self):
+        results = self.session.execute(
+            text("SELECT item_uuid FROM search_index WHERE search_index MATCH 'landing*'")
+        ).fetchall()
+        assert sorted(row[0] for row in results) == ["file-uuid", "reply-uuid"]
+
+        results = self.session.execute(
+            text("SELECT item_uuid FROM search_index WHERE search_index MATCH 'eagle'")
+        ).fetchall()
+        assert [row[0] for row in results] == ["message-uuid"]
+
+        self.session.execute(text("DELETE FROM messages WHERE uuid = 'message-uuid'"))
+        self.session.commit()
+        results = self.session.execute(
+            text("SELECT item_uuid FROM search_index WHERE search_index MATCH 'eagle'")
+        ).fetchall()
+        assert results == []
+
+
+class DowngradeTester:
+    """The search index and its triggers are removed."""
+
+    def __init__(self, homedir: str, session: scoped_session) -> None:
+        subprocess.check_call(["sqlite3", os.path.join(homedir, "svs.sqlite"), ".databases"])
+        self.session = session
+
+    def load_data(self):
+        add_source(self.session)
+        add_items(self.session)
+        self.session.commit()
+
+    def check_downgrade(self):
+        with pytest.raises(OperationalError):
+            self.session.execute(text("SELECT * FROM search_index"))
+
+        # Deleting items no longer touches the index
+        self.session.execute(text("DELETE FROM messages"))
+        self.session.commit()
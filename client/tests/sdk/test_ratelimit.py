@@ -0,0 +1,63 @@
+import pytest
+
+from securedrop_client.sdk.ratelimit import RateLimiter, TokenBucket
+
+
+def test_TokenBucket_waits_for_debt(mocker):
+    monotonic = mocker.patch("securedrop_client.sdk.ratelimit.time.monotonic", return_value=0.0)
+    bucket = TokenBucket(rate=2, capacity=2)
+
+    assert bucket.reserve(2) == 0.0
+    assert bucket.reserve(1) == 0.5
+    assert bucket.reserve(3) == 2.0
+
+    # The bucket refills, but not beyond its capacity
+    monotonic.return_value = 100.0
+    assert bucket.reserve(2) == 0.0
+    assert bucket.reserve(1) == 0.5
+
+
+def test_TokenBucket_unlimited():
+    bucket = TokenBucket(rate=0, capacity=0)
+    assert bucket.reserve(1_000_000) == 0.0
+
+
+def test_RateLimiter_records_wait_times(mocker):
+    mocker.patch("securedrop_client.sdk.ratelimit.time.monotonic", return_value=0.0)
+    sleep = mocker.patch("securedrop_client.sdk.ratelimit.time.sleep")
+    limiter = RateLimiter(requests_per_second=1, bytes_per_second=0, reserved_requests_per_second=1)
+
+    limiter.acquire_request()
+    limiter.acquire_request()
+    limiter.acquire_request()
+    limiter.acquire_bytes(1_000_000)
+
+    assert sleep.call_count == 1
+    assert limiter.wait_times["requests"].count == 3
+    assert limiter.wait_times["requests"].max == 1.0
+    assert limiter.wait_times["requests"].mean == pytest.approx(1 / 3)
+    assert limiter.wait_times["bytes"].max == 0.0
+
+
+def test_RateLimiter_reserved_budget(mocker):
+    """
+    Requests made within reserved() do not wait behind other requests, and are not limited by the
+    byte budget.
+    """
+    mocker.patch("securedrop_client.sdk.ratelimit.time.monotonic", return_value=0.0)
+    sleep = mocker.patch("securedrop_client.sdk.ratelimit.time.sleep")
+    limiter = RateLimiter(requests_per_second=1, bytes_per_second=1, reserved_requests_per_second=1)
+    for _ in range(5):
+        limiter.acquire_request()
+    sleep.reset_mock()
+
+    with limiter.reserved():
+        limiter.acquire_request()
+        limiter.acquire_bytes(1_000_000)
+
+    sleep.assert_not_called()
+    assert limiter.wait_times["reserved"].count == 1
+    assert limiter.wait_times["bytes"].count == 0
+
+    limiter.acquire_bytes(10)
+    sleep.assert_called_once_with(8.0)
@@ -33,6 +33,15 @@ class TestState(unittest.TestCase):
         self.state.clear_selected_conversation()
         assert self.state.selected_conversation is None
 
+    def test_selected_conversation_changed_is_emitted_when_selection_changes(self):
+        selected_conversation_changed_emissions = QSignalSpy(
+            self.state.selected_conversation_changed
+        )
+        self.state.selected_conversation = "0"
+        self.state.selected_conversation = "0"
+        self.state.clear_selected_conversation()
+        assert len(selected_conversation_changed_emissions) == 2
+
     def test_add_file_does_not_duplicate_information(self):
         self.state.add_file(5, 1)
         self.state.add_file(5, 7)
@@ -19,7 +19,7 @@ ALL_MIGRATIONS = [
     x.split(".")[0].split("_")[0] for x in os.listdir(MIGRATION_PATH) if x.endswith(".py")
 ]
 
-DATA_MIGRATIONS = ["d7c8af95bc8e"]
+DATA_MIGRATIONS = ["d7c8af95bc8e", "eb9a5d9d5b5c", "6c8e6ac19d2b"]
 
 WHITESPACE_REGEX = re.compile(r"\s+")
 
@@ -12,13 +12,33 @@ def test_config_from_env():
 
     assert config.journalist_key_fingerprint == "foobar"
     assert config.gpg_domain is None
+    assert config.main_queue_workers == 4
+    assert config.file_download_workers == 3
+    assert config.api_requests_per_second == 8
+    assert config.api_bytes_per_second == 0
+    assert config.crypto_backend == "gpg"
 
 
 def test_config_from_qubesdb():
     qubesdb = MagicMock()
     QubesDB = MagicMock()
     QubesDB.read = MagicMock()
-    QubesDB.read.side_effect = ["foobar", "foobar", "10", "foobar"]
+    QubesDB.read.side_effect = [
+        "foobar",
+        "foobar",
+        "10",
+        "foobar",
+        "2",
+        "5",
+        "4",
+        "100000",
+        "1",
+        "openpgp",
+        "10000000",
+        "500000000",
+        "3",
+        "2000000000",
+    ]
     qubesdb.QubesDB = MagicMock(return_value=QubesDB)
 
     with patch.dict("sys.modules", qubesdb=qubesdb):
@@ -27,6 +47,16 @@ def test_config_from_qubesdb():
     assert config.journalist_key_fingerprint == "foobar"
     # asserts that it was casted from a str to an int
     assert config.download_retry_limit == 10
+    assert config.main_queue_workers == 2
+    assert config.file_download_workers == 5
+    assert config.api_requests_per_second == 4
+    assert config.api_bytes_per_second == 100000
+    assert config.sync_requests_per_second == 1
+    assert config.crypto_backend == "openpgp"
+    assert config.prefetch_max_file_size == 10000000
+    assert config.prefetch_disk_budget == 500000000
+    assert config.prefetch_recency_days == 3
+    assert config.file_cache_quota == 2000000000
 
 
 def test_config_from_qubesdb_key_missing():
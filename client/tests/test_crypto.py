@@ -1,3 +1,5 @@
+import gzip
+import io
 import os
 import struct
 import subprocess
@@ -5,7 +7,13 @@ import tempfile
 
 import pytest
 
-from securedrop_client.crypto import CryptoError, GpgHelper, read_gzip_header_filename
+from securedrop_client.crypto import (
+    CryptoError,
+    GpgBackend,
+    GpgHelper,
+    OpenPGPBackend,
+    read_gzip_header_filename,
+)
 from tests import factory
 
 with open(os.path.join(os.path.dirname(__file__), "files", "test-key.gpg.pub.asc")) as f:
@@ -25,7 +33,10 @@ def test_message_logic(homedir, config, mocker, session_maker):
     test_msg = "tests/files/test-msg.gpg"
     expected_output_filepath = os.path.join(homedir, "data", "test-msg")
 
-    mock_gpg = mocker.patch("subprocess.call", return_value=0)
+    mock_gpg = mocker.patch(
+        "subprocess.run",
+        return_value=subprocess.CompletedProcess([], 0, stdout=b"the eagle has landed"),
+    )
     mocker.patch("os.unlink")
 
     original_filename = gpg.decrypt_submission_or_reply(
@@ -34,6 +45,8 @@ def test_message_logic(homedir, config, mocker, session_maker):
 
     assert mock_gpg.call_count == 1
     assert original_filename == "test-msg"
+    with open(expected_output_filepath) as f:
+        assert f.read() == "the eagle has landed"
 
 
 def test_gunzip_logic(homedir, config, mocker, session_maker):
@@ -57,8 +70,8 @@ def test_gunzip_logic(homedir, config, mocker, session_maker):
 
     assert original_filename == "test-doc.txt"
 
-    # We should remove two files in the success scenario: err, filepath
-    assert mock_unlink.call_count == 2
+    # We should only remove one file in the success scenario: filepath
+    assert mock_unlink.call_count == 1
     mock_unlink.stop()
     os.remove(expected_output_filepath)
 
@@ -75,10 +88,10 @@ def test_gzip_header_without_filename(homedir, config, mocker, session_maker):
     mocker.patch("os.unlink")
 
     # pretend the gzipped file header lacked the original filename
-    mock_read_gzip_header_filename = mocker.patch(
-        "securedrop_client.crypto.read_gzip_header_filename"
+    mock_parse_gzip_header_filename = mocker.patch(
+        "securedrop_client.crypto.parse_gzip_header_filename"
     )
-    mock_read_gzip_header_filename.return_value = ""
+    mock_parse_gzip_header_filename.return_value = ""
 
     test_gzip = "tests/files/test-doc.gz.gpg"
     output_filename = "test-doc"
@@ -89,6 +102,154 @@ def test_gzip_header_without_filename(homedir, config, mocker, session_maker):
     os.remove(expected_output_filename)
 
 
+def encrypt_to_journalist(helper, filepath, plaintext):
+    subprocess.run(
+        helper.backend._gpg_cmd_base()
+        + ["--encrypt", "--output", filepath, "--recipient", helper.journalist_key_fingerprint],
+        input=plaintext.encode(),
+        check=True,
+    )
+
+
+def test_decrypt_message_or_reply(homedir, config, mocker, session_maker):
+    """
+    Check that a message is decrypted through gpg's stdout, without creating temporary files.
+    Using the `config` fixture to ensure the config is written to disk.
+    """
+    helper = GpgHelper(homedir, session_maker, is_qubes=False)
+    helper._import(JOURNO_KEY)
+    filepath = os.path.join(homedir, "data", "1-msg.gpg")
+    encrypt_to_journalist(helper, filepath, "the eagle has landed")
+    temporary_file = mocker.spy(tempfile, "NamedTemporaryFile")
+
+    assert helper.decrypt_message_or_reply(filepath) == "the eagle has landed"
+
+    temporary_file.assert_not_called()
+    assert not os.path.exists(filepath)
+
+
+def test_decrypt_message_or_reply_failure(homedir, config, session_maker):
+    """
+    Check that a `CryptoError` with gpg's error output is raised if decryption fails, and that
+    the file is kept.
+    Using the `config` fixture to ensure the config is written to disk.
+    """
+    helper = GpgHelper(homedir, session_maker, is_qubes=False)
+    filepath = os.path.join(homedir, "data", "1-msg.gpg")
+    with open(filepath, "w") as f:
+        f.write("not a message")
+
+    with pytest.raises(CryptoError, match="no valid OpenPGP data found"):
+        helper.decrypt_message_or_reply(filepath)
+
+    assert os.path.exists(filepath)
+
+
+def test_decrypt_messages_or_replies(homedir, config, mocker, session_maker):
+    """
+    Check that the messages in a batch are decrypted with one gpg process, in a private directory in
+    the client's home, and that a file that cannot be decrypted fails without failing the rest of
+    the batch.
+    Using the `config` fixture to ensure the config is written to disk.
+    """
+    helper = GpgHelper(homedir, session_maker, is_qubes=False)
+    helper._import(JOURNO_KEY)
+    filepaths = []
+    for i, plaintext in enumerate(["first message", "bad", "second message"]):
+        filepath = os.path.join(homedir, "data", f"{i}-msg.gpg")
+        if plaintext == "bad":
+            with open(filepath, "w") as f:
+                f.write("not a message")
+        else:
+            encrypt_to_journalist(helper, filepath, plaintext)
+        filepaths.append(filepath)
+    gpg_run = mocker.spy(subprocess, "run")
+
+    results = helper.decrypt_messages_or_replies(filepaths)
+
+    assert gpg_run.call_count == 1
+    decryption_dir = os.path.join(homedir, "decryption")
+    assert os.path.dirname(gpg_run.call_args.kwargs["cwd"]) == decryption_dir
+    assert os.stat(decryption_dir).st_mode & 0o777 == 0o700
+    assert os.listdir(decryption_dir) == []
+    assert results[0] == "first message"
+    assert isinstance(results[1], CryptoError)
+    assert results[2] == "second message"
+    assert not os.path.exists(filepaths[0])
+    assert os.path.exists(filepaths[1])
+    assert not os.path.exists(filepaths[2])
+
+
+def test_decrypt_messages_or_replies_undecodable_plaintext(homedir, config, mocker, session_maker):
+    """
+    Check that a plaintext that cannot be decoded fails only its own item, and that no file of the
+    batch is deleted before every result is known.
+    Using the `config` fixture to ensure the config is written to disk.
+    """
+    helper = GpgHelper(homedir, session_maker, is_qubes=False)
+    filepaths = []
+    for i in range(3):
+        filepath = os.path.join(homedir, "data", f"{i}-msg.gpg")
+        with open(filepath, "w") as f:
+            f.write("ciphertext")
+        filepaths.append(filepath)
+    mocker.patch.object(
+        helper.backend, "decrypt_files", return_value=[b"first", b"\xff\xfe", b"third"]
+    )
+    unlink = mocker.spy(os, "unlink")
+
+    results = helper.decrypt_messages_or_replies(filepaths)
+
+    assert results[0] == "first"
+    assert isinstance(results[1], CryptoError)
+    assert results[2] == "third"
+    assert [call.args[0] for call in unlink.call_args_list] == [filepaths[0], filepaths[2]]
+    assert os.path.exists(filepaths[1])
+
+    # A batch whose results cannot be matched up with its files leaves every file in place
+    with open(filepaths[2], "w") as f:
+        f.write("ciphertext")
+    mocker.patch.object(helper.backend, "decrypt_files", return_value=[b"first"])
+    with pytest.raises(ValueError):
+        helper.decrypt_messages_or_replies(filepaths[1:])
+    assert os.path.exists(filepaths[1])
+    assert os.path.exists(filepaths[2])
+
+
+def test_num_decryption_workers(homedir, config, mocker, session_maker):
+    """
+    Check that the number of concurrent decryptions is sized to the number of CPUs.
+    Using the `config` fixture to ensure the config is written to disk.
+    """
+    mocker.patch("os.cpu_count", return_value=8)
+    assert GpgHelper(homedir, session_maker, is_qubes=False).num_decryption_workers == 8
+
+    mocker.patch("os.cpu_count", return_value=None)
+    assert GpgHelper(homedir, session_maker, is_qubes=False).num_decryption_workers == 1
+
+
+def test_backend_from_config(homedir, config, mocker, session_maker):
+    """
+    Check that the in-process backend is only used outside of Qubes, when it is configured.
+    """
+    assert isinstance(GpgHelper(homedir, session_maker, is_qubes=False).backend, GpgBackend)
+
+    mocker.patch.dict(os.environ, {"SD_CRYPTO_BACKEND": "openpgp"})
+    openpgp_backend = mocker.patch("securedrop_client.crypto.OpenPGPBackend")
+    helper = GpgHelper(homedir, session_maker, is_qubes=False)
+    assert helper.backend == openpgp_backend.return_value
+    openpgp_backend.assert_called_once_with(homedir)
+
+    assert isinstance(GpgHelper(homedir, session_maker, is_qubes=True).backend, GpgBackend)
+
+
+def test_openpgp_backend_without_pgpy(homedir, mocker):
+    mocker.patch.dict("sys.modules", {"pgpy": None})
+
+    with pytest.raises(CryptoError, match="requires PGPy"):
+        OpenPGPBackend(homedir)
+
+
 def test_read_gzip_header_filename_with_bad_file(homedir):
     with tempfile.NamedTemporaryFile() as tf:
         tf.write(b"test")
@@ -125,15 +286,36 @@ def test_subprocess_raises_exception(homedir, config, mocker, session_maker):
     test_gzip = "tests/files/test-doc.gz.gpg"
     output_filename = "test-doc"
 
-    mock_gpg = mocker.patch("subprocess.call", return_value=1)
+    # The journalist key is not imported, so gpg fails without writing any output
     mock_unlink = mocker.patch("os.unlink")
 
-    with pytest.raises(CryptoError):
+    with pytest.raises(CryptoError, match="decryption failed: No secret key"):
         gpg.decrypt_submission_or_reply(test_gzip, output_filename, is_doc=True)
 
-    assert mock_gpg.call_count == 1
-    # We should only remove one file in the failure scenario: err
-    assert mock_unlink.call_count == 1
+    # We should not remove any file in the failure scenario
+    assert mock_unlink.call_count == 0
+    assert not os.path.exists("tests/files/test-doc.txt")
+
+
+def test_document_deleted_if_gpg_fails_after_writing(homedir, config, mocker, session_maker):
+    """
+    Ensure that a document that was extracted from gpg's output is deleted if gpg only fails once
+    it has written all of its output, e.g. because of a failed integrity check.
+    Using the `config` fixture to ensure the config is written to disk.
+    """
+    gpg = GpgHelper(homedir, session_maker, is_qubes=False)
+    filepath = os.path.join(homedir, "data", "1-doc.gz.gpg")
+    with open(filepath, "wb") as f:
+        f.write(b"ciphertext")
+    proc = mocker.MagicMock()
+    proc.stdout = io.BytesIO(gzip.compress(b"tampered"))
+    proc.wait.return_value = 2
+    mocker.patch("subprocess.Popen", return_value=proc)
+
+    with pytest.raises(CryptoError):
+        gpg.decrypt_submission_or_reply(filepath, "1-doc", is_doc=True)
+
+    assert os.listdir(os.path.join(homedir, "data")) == ["1-doc.gz.gpg"]
 
 
 def test_import_key(homedir, config, session_maker):
@@ -207,6 +389,62 @@ def test_encrypt(homedir, source, config, mocker, session_maker):
     assert decrypted == plaintext
 
 
+def test_encrypt_imports_source_key_once(homedir, source, config, mocker, session_maker):
+    """
+    Check that the source's key is only imported for the first reply, so that later replies cost
+    a single gpg process.
+    Using the `config` fixture to ensure the config is written to disk.
+    """
+    helper = GpgHelper(homedir, session_maker, is_qubes=False)
+    helper._import(JOURNO_KEY)
+    import_fn = mocker.spy(helper, "_import")
+
+    assert helper.encrypt_to_source(source["uuid"], "first")
+    assert import_fn.call_count == 1
+
+    gpg_run = mocker.spy(subprocess, "run")
+    assert helper.encrypt_to_source(source["uuid"], "second")
+    assert import_fn.call_count == 1
+    assert gpg_run.call_count == 1
+
+
+def test_import_key_seeds_fingerprints_from_keyring(homedir, source, config, mocker, session_maker):
+    """
+    Check that a key that is already in the keyring when the helper is created is not imported.
+    Using the `config` fixture to ensure the config is written to disk.
+    """
+    GpgHelper(homedir, session_maker, is_qubes=False)._import(PUB_KEY)
+    helper = GpgHelper(homedir, session_maker, is_qubes=False)
+    import_fn = mocker.spy(helper, "_import")
+
+    helper.import_key(source["source"])
+
+    import_fn.assert_not_called()
+
+
+def test_import_key_after_fingerprint_change(homedir, source, config, mocker, session_maker):
+    """
+    Check that the key of a source whose fingerprint has changed is imported again, and that a
+    key is imported again after encrypting to it failed.
+    Using the `config` fixture to ensure the config is written to disk.
+    """
+    helper = GpgHelper(homedir, session_maker, is_qubes=False)
+    helper.import_key(source["source"])
+    import_fn = mocker.patch.object(helper, "_import")
+
+    source["source"].fingerprint = "0" * 40
+    helper.import_key(source["source"])
+    assert import_fn.call_count == 1
+
+    source["source"].fingerprint = source["fingerprint"]
+    helper.import_key(source["source"])
+    assert import_fn.call_count == 1
+
+    helper._forget_key(source["fingerprint"])
+    helper.import_key(source["source"])
+    assert import_fn.call_count == 2
+
+
 def test_encrypt_fail(homedir, config, mocker, session_maker, session):
     """
     Check that a `CryptoError` is raised if the call to `gpg` fails.
@@ -239,14 +477,14 @@ def test_encrypt_fail_if_source_key_missing(homedir, config, mocker, session_mak
     session.add(source)
     session.commit()
 
-    check_call_fn = mocker.patch("securedrop_client.crypto.subprocess.check_call")
+    gpg_run_fn = mocker.patch("securedrop_client.crypto.subprocess.run")
 
     with pytest.raises(
         CryptoError, match=f"Could not encrypt reply: no key for source {source.uuid}"
     ):
         helper.encrypt_to_source(source.uuid, "mock")
 
-    check_call_fn.assert_not_called()
+    gpg_run_fn.assert_not_called()
 
 
 def test_encrypt_fail_if_journo_fingerprint_missing(homedir, source, config, mocker, session_maker):
@@ -256,14 +494,14 @@ def test_encrypt_fail_if_journo_fingerprint_missing(homedir, source, config, moc
     """
     helper = GpgHelper(homedir, session_maker, is_qubes=False)
     helper.journalist_key_fingerprint = None
-    check_call_fn = mocker.patch("securedrop_client.crypto.subprocess.check_call")
+    gpg_run_fn = mocker.patch("securedrop_client.crypto.subprocess.run")
 
     with pytest.raises(
         CryptoError, match=r"Could not encrypt reply due to missing fingerprint for journalist"
     ):
         helper.encrypt_to_source(source["uuid"], "mock")
 
-    check_call_fn.assert_not_called()
+    gpg_run_fn.assert_not_called()
 
 
 def test_import_key_failure_in_encrypt_to_source(homedir, config, mocker, session_maker, session):
@@ -0,0 +1,121 @@
+"""
+Conformance tests that every CryptoBackend has to pass.
+"""
+
+import gzip
+import os
+
+import pytest
+
+from securedrop_client.crypto import CryptoError, GpgBackend, OpenPGPBackend
+
+with open(os.path.join(os.path.dirname(__file__), "files", "test-key.gpg.pub.asc")) as f:
+    PUB_KEY = f.read()
+
+with open(os.path.join(os.path.dirname(__file__), "files", "securedrop.gpg.asc")) as f:
+    JOURNO_KEY = f.read()
+
+SOURCE_FINGERPRINT = "B2FF7FB28EED8CABEBC5FB6C6179D97BCFA52E5F"
+JOURNO_FINGERPRINT = "65A1B5FF195B56353CC63DFFCC40EF1228271441"
+
+
+@pytest.fixture(params=["gpg", "openpgp"])
+def backend(request, homedir):
+    if request.param == "openpgp":
+        return OpenPGPBackend(homedir)
+    return GpgBackend(homedir, is_qubes=False)
+
+
+@pytest.fixture
+def keyring(backend):
+    backend.import_key(PUB_KEY)
+    backend.import_key(JOURNO_KEY)
+    return backend
+
+
+def write_ciphertext(homedir, name, ciphertext):
+    filepath = os.path.join(homedir, "data", name)
+    with open(filepath, "w") as f:
+        f.write(ciphertext)
+    return filepath
+
+
+def test_import_key(backend):
+    backend.import_key(PUB_KEY)
+
+    assert SOURCE_FINGERPRINT in backend.list_fingerprints()
+    assert JOURNO_FINGERPRINT not in backend.list_fingerprints()
+
+
+def test_import_key_with_invalid_key(backend):
+    with pytest.raises(CryptoError):
+        backend.import_key("iwillbreakyou")
+
+
+def test_encrypt_and_decrypt(homedir, keyring):
+    ciphertext = keyring.encrypt("bueller?", [SOURCE_FINGERPRINT, JOURNO_FINGERPRINT])
+
+    assert ciphertext.startswith("-----BEGIN PGP MESSAGE-----")
+    filepath = write_ciphertext(homedir, "1-reply.gpg", ciphertext)
+    assert keyring.decrypt(filepath) == b"bueller?"
+
+
+def test_encrypt_to_unknown_key(keyring):
+    with pytest.raises(CryptoError):
+        keyring.encrypt("bueller?", ["0" * 40])
+
+
+def test_decrypt_without_secret_key(homedir, keyring):
+    filepath = write_ciphertext(
+        homedir, "1-reply.gpg", keyring.encrypt("bueller?", [SOURCE_FINGERPRINT])
+    )
+
+    with pytest.raises(CryptoError):
+        keyring.decrypt(filepath)
+
+
+def test_decrypt_invalid_file(homedir, keyring):
+    filepath = write_ciphertext(homedir, "1-msg.gpg", "not a message")
+
+    with pytest.raises(CryptoError):
+        keyring.decrypt(filepath)
+
+
+def test_decrypt_files(homedir, keyring):
+    filepaths = [
+        write_ciphertext(homedir, "1-msg.gpg", keyring.encrypt("first", [JOURNO_FINGERPRINT])),
+        write_ciphertext(homedir, "2-msg.gpg", "not a message"),
+        write_ciphertext(homedir, "3-msg.gpg", keyring.encrypt("third", [JOURNO_FINGERPRINT])),
+    ]
+
+    results = keyring.decrypt_files(filepaths)
+
+    assert results[0] == b"first"
+    assert isinstance(results[1], CryptoError)
+    assert results[2] == b"third"
+
+
+def test_open_decrypted(homedir, keyring):
+    filepath = write_ciphertext(
+        homedir, "1-msg.gpg", keyring.encrypt("x" * 100000, [JOURNO_FINGERPRINT])
+    )
+
+    with keyring.open_decrypted(filepath) as plaintext:
+        assert plaintext.read(10) == b"x" * 10
+        assert plaintext.read() == b"x" * 99990
+
+
+def test_open_decrypted_invalid_file(homedir, keyring):
+    filepath = write_ciphertext(homedir, "1-msg.gpg", "not a message")
+
+    with pytest.raises(CryptoError), keyring.open_decrypted(filepath) as plaintext:
+        plaintext.read()
+
+
+def test_decrypt_document_encrypted_by_gpg(keyring):
+    """
+    Documents are encrypted by the server, so every backend has to decrypt gpg's ciphertext.
+    """
+    plaintext = keyring.decrypt("tests/files/test-doc.gz.gpg")
+
+    assert gzip.decompress(plaintext)
@@ -0,0 +1,208 @@
+"""
+Tests for the database interface and the background database and disk workers.
+"""
+
+import os
+import threading
+
+import pytest
+
+from securedrop_client import db
+from securedrop_client.database import DatabaseMaintenance, DatabaseWriter, DiskDeleter
+from securedrop_client.storage import (
+    get_pending_deletions,
+    mark_as_decrypted,
+    mark_as_downloaded,
+    schedule_deletion_on_disk,
+    set_message_or_reply_content,
+)
+from tests import factory
+
+
+def test_DatabaseWriter_commits_submitted_writes(session, session_maker, source):
+    message = factory.Message(
+        source=source["source"], is_downloaded=False, is_decrypted=None, content=None
+    )
+    session.add(message)
+    session.commit()
+    writer = DatabaseWriter(session_maker)
+
+    writer.submit(mark_as_downloaded, db.Message, message.uuid)
+    writer.submit(
+        set_message_or_reply_content, model_type=db.Message, uuid=message.uuid, content="hello"
+    )
+    writer.submit(mark_as_decrypted, db.Message, message.uuid).result(timeout=5)
+    writer.stop()
+
+    session.expire_all()
+    message = session.query(db.Message).filter_by(uuid=message.uuid).one()
+    assert message.is_downloaded is True
+    assert message.is_decrypted is True
+    assert message.content == "hello"
+
+
+def test_DatabaseWriter_batches_queued_writes_into_one_transaction(mocker, session_maker):
+    """
+    A write is committed without waiting for more writes, and the writes queued in the meantime
+    are committed together.
+    """
+    writer = DatabaseWriter(session_maker)
+    mock_session = mocker.MagicMock()
+    mocker.patch.object(writer, "session_maker", return_value=mock_session)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block(**kwargs):
+        started.set()
+        release.wait(5)
+
+    blocking_command = mocker.MagicMock(__name__="blocking_command", side_effect=block)
+    command = mocker.MagicMock(__name__="command")
+
+    first_future = writer.submit(blocking_command)
+    started.wait(5)
+    futures = [writer.submit(command, i) for i in range(10)]
+    release.set()
+    first_future.result(timeout=5)
+    for future in futures:
+        future.result(timeout=5)
+    writer.stop()
+
+    assert command.call_count == 10
+    command.assert_any_call(3, session=mock_session, commit=False)
+    assert mock_session.commit.call_count == 2
+
+
+def test_DatabaseWriter_failed_write_does_not_fail_batch(mocker, session_maker):
+    writer = DatabaseWriter(session_maker)
+    mock_session = mocker.MagicMock()
+    mocker.patch.object(writer, "session_maker", return_value=mock_session)
+    good_command = mocker.MagicMock(__name__="good_command", return_value="ok")
+    bad_command = mocker.MagicMock(__name__="bad_command", side_effect=ValueError("bad"))
+
+    good_future = writer.submit(good_command)
+    bad_future = writer.submit(bad_command)
+    writer.stop()
+
+    assert good_future.result(timeout=5) == "ok"
+    with pytest.raises(ValueError):
+        bad_future.result(timeout=5)
+    mock_session.rollback.assert_called()
+
+
+def test_DatabaseWriter_accepts_writes_from_many_threads(mocker, session_maker):
+    writer = DatabaseWriter(session_maker)
+    mocker.patch.object(writer, "session_maker", return_value=mocker.MagicMock())
+    results = []
+    lock = threading.Lock()
+
+    def command(i, session, commit):
+        with lock:
+            results.append(i)
+
+    threads = [threading.Thread(target=writer.submit, args=(command, i)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.stop()
+
+    assert sorted(results) == list(range(20))
+
+
+def test_DatabaseWriter_stop_without_start(session_maker):
+    writer = DatabaseWriter(session_maker)
+    writer.stop()  # does not block
+
+
+def test_DatabaseMaintenance_run_releases_free_pages(mocker, session, session_maker, source):
+    session.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    session.execute("VACUUM")
+    for _ in range(200):
+        session.add(factory.Message(source=source["source"], content="x" * 4096))
+    session.commit()
+    session.query(db.Message).delete()
+    session.commit()
+    assert session.execute("PRAGMA freelist_count").scalar() > 0
+    info_logger = mocker.patch("securedrop_client.database.logger.info")
+
+    DatabaseMaintenance(session_maker).run()
+
+    assert session.execute("PRAGMA freelist_count").scalar() == 0
+    assert "Database maintenance starting" in info_logger.call_args_list[0][0][0]
+    assert "0 of" in info_logger.call_args_list[1][0][0]
+
+
+def test_DatabaseMaintenance_run_stops_vacuuming_after_time_budget(mocker, session_maker):
+    maintenance = DatabaseMaintenance(session_maker)
+    maintenance.TIME_BUDGET_SECONDS = 0
+    mocker.patch.object(maintenance, "_get_freelist_count", return_value=10)
+    mocker.patch.object(maintenance, "_get_stats", return_value="")
+
+    maintenance.run()  # returns even though pages remain free
+
+    maintenance._get_freelist_count.assert_not_called()
+
+
+def test_DatabaseMaintenance_run_logs_errors(mocker, session_maker):
+    maintenance = DatabaseMaintenance(session_maker)
+    mocker.patch.object(maintenance, "_get_stats", side_effect=Exception("disk I/O error"))
+    error_logger = mocker.patch("securedrop_client.database.logger.error")
+
+    maintenance.run()
+
+    error_logger.assert_called_once_with("Database maintenance failed")
+
+
+def test_DatabaseMaintenance_run_if_due_runs_at_most_once_per_interval(mocker, session_maker):
+    maintenance = DatabaseMaintenance(session_maker)
+    run = mocker.patch.object(maintenance, "run")
+
+    assert maintenance.run_if_due()
+    maintenance._thread.join()
+    assert not maintenance.run_if_due()
+    run.assert_called_once_with()
+
+    maintenance._last_run -= maintenance.INTERVAL_SECONDS
+    assert maintenance.run_if_due()
+    maintenance._thread.join()
+    assert run.call_count == 2
+
+
+def test_DiskDeleter_deletes_pending_deletions(qtbot, homedir, session, session_maker):
+    data_dir = os.path.join(homedir, "data")
+    source_directory = os.path.join(data_dir, "dissolved_steak")
+    os.makedirs(os.path.join(source_directory, "1-dissolved_steak-doc"))
+    schedule_deletion_on_disk(session, source_directory)
+    session.commit()
+    deleter = DiskDeleter(session_maker, data_dir)
+
+    deleter.wake()
+
+    qtbot.waitUntil(lambda: get_pending_deletions(session) == [])
+    assert not os.path.exists(source_directory)
+    deleter.stop()
+    deleter._thread.join()
+
+
+def test_DiskDeleter_keeps_tombstone_on_error(mocker, homedir, session, session_maker):
+    data_dir = os.path.join(homedir, "data")
+    schedule_deletion_on_disk(session, os.path.join(data_dir, "dissolved_steak"))
+    session.commit()
+    mocker.patch("securedrop_client.storage.os.remove", side_effect=PermissionError)
+    error_logger = mocker.patch("securedrop_client.database.logger.error")
+    deleter = DiskDeleter(session_maker, data_dir)
+
+    deleter._delete_pending(session)
+
+    error_logger.assert_called_once_with("Could not delete files on disk")
+    assert len(get_pending_deletions(session)) == 1
+
+
+def test_DiskDeleter_does_not_start_after_stop(session_maker, homedir):
+    deleter = DiskDeleter(session_maker, homedir)
+    deleter.stop()
+
+    deleter.wake()
+
+    assert deleter._thread is None
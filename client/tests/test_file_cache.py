@@ -0,0 +1,113 @@
+import os
+from datetime import datetime, timedelta
+
+from securedrop_client import db
+from securedrop_client.database import DatabaseWriter
+from securedrop_client.file_cache import FileCache
+from tests import factory
+
+
+def make_file(session, homedir, source, filename, size, opened_days_ago=None, **attrs):
+    last_opened_at = None
+    if opened_days_ago is not None:
+        last_opened_at = datetime.utcnow() - timedelta(days=opened_days_ago)
+    file = factory.File(
+        source=source, filename=filename, size=size, last_opened_at=last_opened_at, **attrs
+    )
+    session.add(file)
+    session.flush()
+    filepath = file.location(os.path.join(homedir, "data"))
+    os.makedirs(os.path.dirname(filepath))
+    with open(filepath, "w") as f:
+        f.write("x" * size)
+    return file
+
+
+def test_FileCache_record_open(homedir, session, session_maker):
+    source = factory.Source()
+    session.add(source)
+    file = factory.File(source=source)
+    session.add(file)
+    session.commit()
+    writer = DatabaseWriter(session_maker)
+
+    FileCache(homedir, 0, writer).record_open(file.uuid)
+    writer.stop()
+
+    session.refresh(file)
+    assert file.last_opened_at is not None
+
+
+def test_FileCache_evict_least_recently_opened(homedir, session, session_maker):
+    data_dir = os.path.join(homedir, "data")
+    source = factory.Source()
+    session.add(source)
+    never_opened = make_file(session, homedir, source, "1-doc.gz.gpg", 100)
+    kept = make_file(session, homedir, source, "2-doc.gz.gpg", 100)
+    opened_long_ago = make_file(session, homedir, source, "3-doc.gz.gpg", 100, opened_days_ago=10)
+    opened_recently = make_file(session, homedir, source, "4-doc.gz.gpg", 100, opened_days_ago=1)
+    opened_yesterday = make_file(session, homedir, source, "5-doc.gz.gpg", 100, opened_days_ago=2)
+    session.commit()
+    writer = DatabaseWriter(session_maker)
+
+    evicted = FileCache(data_dir, 250, writer).evict(session, keep={kept.uuid}).result(timeout=5)
+    writer.stop()
+
+    assert evicted == [never_opened, opened_long_ago, opened_yesterday]
+    for file in evicted:
+        session.refresh(file)
+        assert not file.is_downloaded
+        assert file.is_decrypted is None
+        # Deleted straight away, so that a new download of the file is not deleted later
+        assert not os.path.exists(os.path.dirname(file.location(data_dir)))
+    for file in [kept, opened_recently]:
+        assert file.is_downloaded
+        assert os.path.exists(file.location(data_dir))
+    assert session.query(db.PendingDeletion).count() == 0
+
+
+def test_FileCache_evict_only_counts_decrypted_files(homedir, session, session_maker):
+    """
+    Files that could not be decrypted cannot be evicted, so they do not count towards the quota.
+    """
+    data_dir = os.path.join(homedir, "data")
+    source = factory.Source()
+    session.add(source)
+    make_file(session, homedir, source, "1-doc.gz.gpg", 1000, is_decrypted=False)
+    make_file(session, homedir, source, "2-doc.gz.gpg", 100)
+    make_file(session, homedir, source, "3-doc.gz.gpg", 100)
+    session.commit()
+
+    assert FileCache(data_dir, 200, DatabaseWriter(session_maker)).evict(session).result() == []
+
+
+def test_FileCache_evict_within_quota(homedir, session, session_maker):
+    data_dir = os.path.join(homedir, "data")
+    source = factory.Source()
+    session.add(source)
+    make_file(session, homedir, source, "1-doc.gz.gpg", 100)
+    make_file(session, homedir, source, "2-doc.gz.gpg", 100)
+    session.commit()
+    writer = DatabaseWriter(session_maker)
+
+    assert FileCache(data_dir, 200, writer).evict(session).result() == []
+    # A quota of 0 is unlimited
+    assert FileCache(data_dir, 0, writer).evict(session).result() == []
+
+
+def test_FileCache_evict_keeps_files_that_cannot_be_deleted(
+    homedir, mocker, session, session_maker
+):
+    data_dir = os.path.join(homedir, "data")
+    source = factory.Source()
+    session.add(source)
+    file = make_file(session, homedir, source, "1-doc.gz.gpg", 100)
+    session.commit()
+    mocker.patch("securedrop_client.file_cache.shutil.rmtree", side_effect=PermissionError)
+    writer = DatabaseWriter(session_maker)
+
+    assert FileCache(data_dir, 50, writer).evict(session).result() == []
+    writer.stop()
+
+    session.refresh(file)
+    assert file.is_downloaded
@@ -6,6 +6,8 @@ expected.
 import datetime
 import logging
 import os
+import threading
+from concurrent.futures import Future
 from gettext import gettext as _
 from unittest.mock import Mock, call
 
@@ -15,12 +17,13 @@ import sqlalchemy.orm.exc
 from PyQt5.QtTest import QSignalSpy
 from sqlalchemy.orm import attributes
 
-from securedrop_client import db, state
+from securedrop_client import db, state, storage
 from securedrop_client.api_jobs.base import ApiInaccessibleError
 from securedrop_client.api_jobs.downloads import (
     DownloadChecksumMismatchException,
     DownloadDecryptionException,
     DownloadException,
+    FileDownloadJob,
 )
 from securedrop_client.api_jobs.sources import (
     DeleteConversationJobException,
@@ -33,6 +36,13 @@ from securedrop_client.logic import APICallRunner, Controller
 from securedrop_client.sdk import AuthError, RequestTimeoutError, ServerConnectionError
 from tests import factory
 
+
+def completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
 MAX_SIGNAL_WAITING_TIME = 50
 
 
@@ -124,10 +134,12 @@ def test_Controller_setup(homedir, config, mocker, session_maker, session):
         co.api_job_queue.main_queue.moveToThread = mocker.MagicMock()
         co.api_job_queue = mocker.MagicMock()
         co.update_sources = mocker.MagicMock()
+        co.disk_deleter = mocker.MagicMock()
 
         co.setup()
 
         co.gui.setup.assert_called_once_with(co)
+        co.disk_deleter.wake.assert_called_once_with()
 
 
 def test_Controller_call_api(homedir, config, mocker, session_maker):
@@ -250,6 +262,7 @@ def test_Controller_on_authenticate_success(homedir, config, mocker, session_mak
     co.authenticated_user = factory.User()
     co.api_sync.start = mocker.MagicMock()
     co.api_job_queue.start = mocker.MagicMock()
+    co.restore_queued_jobs = mocker.MagicMock()
     co.update_sources = mocker.MagicMock()
     co.session.add(co.authenticated_user)
     co.session.commit()
@@ -266,6 +279,7 @@ def test_Controller_on_authenticate_success(homedir, config, mocker, session_mak
     co.gui.assert_has_calls([call.clear_clipboard(), call.show_main_window(co.authenticated_user)])
     co.api_sync.start.assert_called_once_with(co.api)
     co.api_job_queue.start.assert_called_once_with(co.api)
+    co.restore_queued_jobs.assert_called_once_with()
     assert co.is_authenticated
     assert len(update_authenticated_user_emissions) == 1
     assert update_authenticated_user_emissions[0] == [co.authenticated_user]
@@ -527,6 +541,7 @@ def test_Controller_on_sync_success(homedir, config, mocker):
     co.download_new_replies = mocker.MagicMock()
     co.gpg = mocker.MagicMock()
     co.resume_queues = mocker.MagicMock()
+    co.disk_deleter = mocker.MagicMock()
     file_missing_emissions = QSignalSpy(co.file_missing)
     mock_storage = mocker.patch("securedrop_client.logic.storage")
     source = factory.Source()
@@ -535,6 +550,7 @@ def test_Controller_on_sync_success(homedir, config, mocker):
 
     co.on_sync_success()
 
+    co.disk_deleter.wake.assert_called_once_with()
     mock_storage.update_missing_files.assert_called_once_with(co.data_dir, co.session)
     co.update_sources.assert_called_once_with()
     co.download_new_messages.assert_called_once_with()
@@ -544,6 +560,194 @@ def test_Controller_on_sync_success(homedir, config, mocker):
     assert file_missing_emissions[0] == [missing.source.uuid, missing.uuid, str(missing)]
 
 
+def test_Controller_restore_queued_jobs(homedir, config, mocker, session_maker, session):
+    """
+    Downloads recorded in the job journal are queued again, unless their item was deleted or has
+    been downloaded since.
+    """
+    co = Controller("http://localhost", mocker.MagicMock(), session_maker, homedir, None)
+    co.api = "journalist is authenticated"
+    co._submit_download_job = mocker.MagicMock()
+    co.database_writer = mocker.MagicMock()
+    source = factory.Source()
+    message = factory.Message(source=source, is_downloaded=True, is_decrypted=None)
+    file_ = factory.File(source=source, is_downloaded=False, is_decrypted=None)
+    reply = factory.Reply(source=source, is_downloaded=True, is_decrypted=True)
+    session.add_all([source, message, file_, reply])
+    session.commit()
+    for job_type, uuid in [
+        ("MessageDownloadJob", message.uuid),
+        ("FileDownloadJob", file_.uuid),
+        ("ReplyDownloadJob", reply.uuid),
+        ("MessageDownloadJob", "deleted-uuid"),
+    ]:
+        storage.add_queued_job(job_type, uuid, session)
+
+    co.restore_queued_jobs()
+
+    assert co._submit_download_job.call_args_list == [
+        call(db.Message, message.uuid, source.uuid),
+        call(db.File, file_.uuid, source.uuid),
+    ]
+    assert co.database_writer.submit.call_args_list == [
+        call(storage.delete_queued_job, "ReplyDownloadJob", reply.uuid),
+        call(storage.delete_queued_job, "MessageDownloadJob", "deleted-uuid"),
+    ]
+
+
+def test_Controller_focuses_queue_on_selected_conversation(homedir, config, mocker, session_maker):
+    """
+    The downloads of the selected conversation are run first.
+    """
+    app_state = state.State()
+    co = Controller("http://localhost", mocker.MagicMock(), session_maker, homedir, app_state)
+    co.api_job_queue = mocker.MagicMock()
+
+    app_state.set_selected_conversation_for_source(state.SourceId("source-uuid"))
+    app_state.clear_selected_conversation()
+
+    assert co.api_job_queue.focus_source.call_args_list == [call("source-uuid"), call(None)]
+
+
+@pytest.mark.parametrize(
+    ("queue_is_idle", "decryption_is_idle"), [(True, True), (True, False), (False, True)]
+)
+def test_Controller_on_sync_success_runs_database_maintenance_when_idle(
+    homedir, config, mocker, queue_is_idle, decryption_is_idle
+):
+    """
+    Database maintenance only runs if no jobs are queued, running or decrypting after a sync.
+    """
+    co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
+    co.authenticated_user = factory.User()
+    co.update_sources = mocker.MagicMock()
+    co.download_new_messages = mocker.MagicMock()
+    co.download_new_replies = mocker.MagicMock()
+    co.gpg = mocker.MagicMock()
+    co.resume_queues = mocker.MagicMock()
+    co.api_job_queue = mocker.MagicMock()
+    co.api_job_queue.is_idle.return_value = queue_is_idle
+    co.decryption_stage = mocker.MagicMock()
+    co.decryption_stage.is_idle.return_value = decryption_is_idle
+    co.database_maintenance = mocker.MagicMock()
+    co.prefetch_if_idle = mocker.MagicMock()
+    mock_storage = mocker.patch("securedrop_client.logic.storage")
+    mock_storage.update_missing_files.return_value = []
+
+    co.on_sync_success()
+
+    assert co.database_maintenance.run_if_due.called is (queue_is_idle and decryption_is_idle)
+    assert co.prefetch_if_idle.called is (queue_is_idle and decryption_is_idle)
+
+
+@pytest.mark.parametrize(
+    ("queue_is_idle", "decryption_is_idle"), [(True, True), (True, False), (False, True)]
+)
+def test_Controller_prefetch_if_idle(homedir, config, mocker, queue_is_idle, decryption_is_idle):
+    """
+    The file chosen by the prefetch policy is queued as a prefetch job only if no jobs are queued,
+    running or decrypting.
+    """
+    co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
+    co.api = mocker.MagicMock()
+    co.api_job_queue = mocker.MagicMock()
+    co.api_job_queue.is_idle.return_value = queue_is_idle
+    co.decryption_stage = mocker.MagicMock()
+    co.decryption_stage.is_idle.return_value = decryption_is_idle
+    co.prefetch_policy = mocker.MagicMock()
+    co.prefetch_policy.next_file.return_value = factory.File(
+        uuid="file-uuid", size=1234, source=factory.Source(uuid="source-uuid")
+    )
+    add_job_emissions = QSignalSpy(co.add_job)
+
+    co.prefetch_if_idle()
+
+    if not (queue_is_idle and decryption_is_idle):
+        assert len(add_job_emissions) == 0
+        return
+    assert len(add_job_emissions) == 1
+    job = add_job_emissions[0][0]
+    assert isinstance(job, FileDownloadJob)
+    assert job.prefetch
+    assert (job.uuid, job.source_uuid, job.size) == ("file-uuid", "source-uuid", 1234)
+
+
+def test_Controller_prefetch_if_idle_when_disabled(homedir, config, mocker):
+    co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
+    co.api = mocker.MagicMock()
+    co.api_job_queue = mocker.MagicMock()
+    add_job_emissions = QSignalSpy(co.add_job)
+
+    co.prefetch_if_idle()
+
+    assert co.prefetch_policy is None
+    assert len(add_job_emissions) == 0
+
+
+def test_Controller_on_prefetch_success(homedir, config, mocker):
+    co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
+    co.on_file_download_success = mocker.MagicMock()
+    co.prefetch_if_idle = mocker.MagicMock()
+
+    co.on_prefetch_success("file-uuid")
+
+    co.on_file_download_success.assert_called_once_with("file-uuid")
+    co.prefetch_if_idle.assert_called_once_with()
+
+
+def test_Controller_on_prefetch_failure(homedir, config, mocker):
+    """
+    A file that fails to prefetch is not chosen again, and the failure is not shown to the user.
+    """
+    mock_gui = mocker.MagicMock()
+    co = Controller("http://localhost", mock_gui, mocker.MagicMock(), homedir, None)
+    co.api = mocker.MagicMock()
+    co.prefetch_policy = mocker.MagicMock()
+    co.prefetch_policy.next_file.return_value = None
+
+    co.on_prefetch_failure(DownloadDecryptionException("mock", db.File, "file-uuid"))
+    co.prefetch_if_idle()
+
+    mock_gui.update_error_status.assert_not_called()
+    co.prefetch_policy.next_file.assert_called_once_with(co.session, skip={"file-uuid"})
+
+
+def test_Controller_evict_files(homedir, config, mocker, qtbot):
+    """
+    Evicted files are shown as not downloaded once they are marked as such, without blocking the
+    GUI thread on the write, and are not prefetched again.
+    """
+    co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
+    evicted = factory.File(uuid="file-uuid", source=factory.Source(uuid="source-uuid"))
+    eviction = Future()
+    co.file_cache = mocker.MagicMock()
+    co.file_cache.evict.return_value = eviction
+    file_missing_emissions = QSignalSpy(co.file_missing)
+
+    co.evict_files(keep={"kept-uuid"})
+
+    co.file_cache.evict.assert_called_once_with(co.session, {"kept-uuid"})
+    assert len(file_missing_emissions) == 0
+
+    # Completed on the database writer's thread
+    threading.Thread(target=eviction.set_result, args=([evicted],)).start()
+    qtbot.waitUntil(lambda: len(file_missing_emissions) == 1)
+
+    assert list(file_missing_emissions) == [["source-uuid", "file-uuid", str(evicted)]]
+    assert "file-uuid" in co._prefetch_skipped
+
+
+def test_Controller_evict_files_failure(homedir, config, mocker):
+    co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
+    co.session = mocker.MagicMock()
+    co.file_cache = mocker.MagicMock()
+    co.file_cache.evict.side_effect = sqlalchemy.exc.SQLAlchemyError("mock")
+
+    co.evict_files()
+
+    co.session.rollback.assert_called_once_with()
+
+
 def test_Controller_on_sync_success_when_current_user_deleted(mocker, homedir):
     co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
 
@@ -777,6 +981,7 @@ def test_Controller_mark_seen_with_unseen_item_of_each_type(
         [unseen_file.uuid, unseen_file_for_current_user.uuid],
         [unseen_message.uuid, unseen_message_for_current_user.uuid],
         [unseen_reply.uuid, unseen_reply_for_current_user.uuid],
+        source.uuid,
     )
 
 
@@ -793,7 +998,7 @@ def test_Controller_mark_seen_with_unseen_file_only(
 
     co.mark_seen(source)
 
-    job.assert_called_once_with(["file-uuid-1"], [], [])
+    job.assert_called_once_with(["file-uuid-1"], [], [], source.uuid)
 
 
 def test_Controller_mark_seen_with_unseen_message_only(
@@ -809,7 +1014,7 @@ def test_Controller_mark_seen_with_unseen_message_only(
 
     co.mark_seen(source)
 
-    job.assert_called_once_with([], ["msg-uuid-1"], [])
+    job.assert_called_once_with([], ["msg-uuid-1"], [], source.uuid)
 
 
 def test_Controller_mark_seen_with_unseen_reply_only(
@@ -825,7 +1030,7 @@ def test_Controller_mark_seen_with_unseen_reply_only(
 
     co.mark_seen(source)
 
-    job.assert_called_once_with([], [], ["reply-uuid-1"])
+    job.assert_called_once_with([], [], ["reply-uuid-1"], source.uuid)
 
 
 def test_Controller_mark_seen_skips_if_no_unseen_items(
@@ -992,7 +1197,8 @@ def test_Controller_on_update_star_failed(homedir, config, mocker):
     co = Controller("http://localhost", gui, mocker.MagicMock(), homedir, None)
     star_update_failed_emissions = QSignalSpy(co.star_update_failed)
     source = factory.Source()
-    co.session.query().filter_by().one.return_value = source
+    lookup_by_uuid = mocker.patch("securedrop_client.logic.lookup_by_uuid")
+    lookup_by_uuid().params().one.return_value = source
 
     error = UpdateStarJobError("mock_message", source.uuid)
     co.on_update_star_failure(error)
@@ -1174,7 +1380,26 @@ def test_Controller_download_conversation(homedir, config, session, mocker, sess
 
     co.download_conversation(conversation_id)
 
-    expected = [call(some_file_id, co.data_dir, co.gpg), call(another_file_id, co.data_dir, co.gpg)]
+    expected = [
+        call(
+            some_file_id,
+            co.data_dir,
+            co.gpg,
+            co.database_writer,
+            co.decryption_stage,
+            source_uuid=conversation_id,
+            size=None,
+        ),
+        call(
+            another_file_id,
+            co.data_dir,
+            co.gpg,
+            co.database_writer,
+            co.decryption_stage,
+            source_uuid=conversation_id,
+            size=None,
+        ),
+    ]
     assert file_download_job_constructor.mock_calls == expected
 
     assert len(add_job_emissions) == 2
@@ -1261,7 +1486,15 @@ def test_Controller_on_file_download_Submission(homedir, config, session, mocker
 
     co.on_submission_download(db.File, file_.uuid)
 
-    mock_job_cls.assert_called_once_with(file_.uuid, co.data_dir, co.gpg)
+    mock_job_cls.assert_called_once_with(
+        file_.uuid,
+        co.data_dir,
+        co.gpg,
+        co.database_writer,
+        co.decryption_stage,
+        source_uuid=source.uuid,
+        size=file_.size,
+    )
     assert len(add_job_emissions) == 1
     assert add_job_emissions[0] == [mock_job]
     mock_success_signal.connect.assert_called_once_with(co.on_file_download_success)
@@ -1300,7 +1533,7 @@ def test_Controller_on_file_download_Submission_no_auth(
     assert co.on_action_requiring_login.called
 
 
-def test_Controller_on_file_downloaded_success(homedir, config, mocker, session_maker):
+def test_Controller_on_file_downloaded_success(homedir, config, mocker, session_maker, qtbot):
     """
     Using the `config` fixture to ensure the config is written to disk.
     """
@@ -1321,14 +1554,22 @@ def test_Controller_on_file_downloaded_success(homedir, config, mocker, session_
 
     mocker.patch("securedrop_client.logic.storage", mock_storage)
 
+    co.file_cache = mocker.MagicMock()
+    co.file_cache.evict.return_value = completed([])
+
     co.on_file_download_success("file_uuid")
 
-    assert len(file_ready_emissions) == 1
+    qtbot.waitUntil(lambda: len(file_ready_emissions) == 1)
+    mock_storage.update_file_size.assert_called_once_with(
+        "file_uuid", co.data_dir, session=mocker.ANY, commit=False
+    )
     assert file_ready_emissions[0] == ["a_uuid", "file_uuid", "foo.txt"]
+    co.file_cache.record_open.assert_called_once_with("file_uuid")
+    co.file_cache.evict.assert_called_once_with(co.session, {"file_uuid"})
 
 
 def test_Controller_on_file_downloaded_success_updates_application_state(
-    homedir, config, mocker, session_maker
+    homedir, config, mocker, session_maker, qtbot
 ):
     """
     Using the `config` fixture to ensure the config is written to disk.
@@ -1346,6 +1587,9 @@ def test_Controller_on_file_downloaded_success_updates_application_state(
     mock_storage.get_file.return_value = mock_file
     mocker.patch("securedrop_client.logic.storage", mock_storage)
 
+    co.file_cache = mocker.MagicMock()
+    co.file_cache.evict.return_value = completed([])
+
     app_state.add_file("a_uuid", state.FileId("file_uuid"))
 
     assert app_state.file(state.FileId("file_uuid"))
@@ -1353,7 +1597,7 @@ def test_Controller_on_file_downloaded_success_updates_application_state(
 
     co.on_file_download_success("file_uuid")
 
-    assert app_state.file(state.FileId("file_uuid")).is_downloaded
+    qtbot.waitUntil(lambda: app_state.file(state.FileId("file_uuid")).is_downloaded)
 
 
 def test_Controller_on_file_downloaded_api_failure(homedir, config, mocker, session_maker):
@@ -1463,7 +1707,8 @@ def test_Controller_on_file_open(homedir, config, mocker, session, session_maker
 
 def test_Controller_on_file_open_not_qubes(homedir, config, mocker, session, session_maker, source):
     """
-    Check that we just check if the file exists if not running on Qubes.
+    Check that we just check if the file exists and record that it was opened if not running on
+    Qubes.
     """
     co = Controller("http://localhost", mocker.MagicMock(), session_maker, homedir, None)
     co.qubes = False
@@ -1477,6 +1722,10 @@ def test_Controller_on_file_open_not_qubes(homedir, config, mocker, session, ses
         pass
 
     co.on_file_open(file)
+    co.database_writer.stop()
+
+    session.refresh(file)
+    assert file.last_opened_at is not None
 
 
 def test_Controller_on_file_open_when_orig_file_already_exists(
@@ -1895,11 +2144,13 @@ def test_Controller_on_delete_source_success(mocker, homedir, session_maker):
     """
     co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
     co.source_deleted = mocker.MagicMock()
+    co.disk_deleter = mocker.MagicMock()
     storage = mocker.patch("securedrop_client.logic.storage")
 
     co.on_delete_source_success("uuid")
 
     storage.delete_local_source_by_uuid.assert_called_once_with(co.session, "uuid", co.data_dir)
+    co.disk_deleter.wake.assert_called_once_with()
 
 
 def test_Controller_on_delete_source_failure(homedir, config, mocker, session_maker):
@@ -1950,6 +2201,7 @@ def test_Controller_delete_source(homedir, config, mocker, session_maker, sessio
     session.add(source)
     session.commit()
 
+    co.api_job_queue = mocker.MagicMock()
     co.delete_sources([source])
 
     assert len(source_deleted_emissions) == 1
@@ -1959,6 +2211,7 @@ def test_Controller_delete_source(homedir, config, mocker, session_maker, sessio
     assert add_job_emissions[0] == [mock_job]
     mock_success_signal.connect.assert_called_once_with(co.on_delete_source_success)
     mock_failure_signal.connect.assert_called_once_with(co.on_delete_source_failure)
+    co.api_job_queue.cancel_jobs_for_sources.assert_called_once_with({source.uuid})
 
 
 def test_Controller_on_delete_conversation_success(mocker, homedir):
@@ -1966,6 +2219,7 @@ def test_Controller_on_delete_conversation_success(mocker, homedir):
     info_logger = mocker.patch("securedrop_client.logic.logger.info")
 
     co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
+    co.disk_deleter = mocker.MagicMock()
     mock_storage = mocker.MagicMock()
     mocker.patch("securedrop_client.logic.storage", mock_storage)
 
@@ -1977,6 +2231,7 @@ def test_Controller_on_delete_conversation_success(mocker, homedir):
     mock_storage.delete_local_conversation_by_source_uuid.assert_called_once_with(
         co.session, "uuid-blah", co.data_dir
     )
+    co.disk_deleter.wake.assert_called_once_with()
 
 
 def test_Controller_on_delete_conversation_failure(homedir, config, mocker, session_maker, session):
@@ -2026,6 +2281,7 @@ def test_Controller_delete_conversation(homedir, config, mocker, session_maker,
     session.add(source)
     session.commit()
 
+    co.api_job_queue = mocker.MagicMock()
     co.delete_conversation(source)
 
     assert len(conversation_deleted_emissions) == 1
@@ -2033,6 +2289,9 @@ def test_Controller_delete_conversation(homedir, config, mocker, session_maker,
     mock_job_cls.assert_called_once_with(source.uuid)
     assert len(add_job_emissions) == 1
     assert add_job_emissions[0] == [mock_job]
+    co.api_job_queue.cancel_jobs_for_sources.assert_called_once_with(
+        {source.uuid}, conversation_only=True
+    )
     mock_success_signal.connect.assert_called_once_with(co.on_delete_conversation_success)
     mock_failure_signal.connect.assert_called_once_with(co.on_delete_conversation_failure)
 
@@ -2041,7 +2300,7 @@ def test_Controller_send_reply_success(
     homedir, config, mocker, session_maker, session, reply_status_codes
 ):
     """
-    Check that a SendReplyJob is submitted to the queue when send_reply is called.
+    Check that a SendReplyJob is submitted to be encrypted when send_reply is called.
     """
     mock_gui = mocker.MagicMock()
     co = Controller("http://localhost", mock_gui, session_maker, homedir, None)
@@ -2058,7 +2317,7 @@ def test_Controller_send_reply_success(
         success_signal=mock_success_signal, failure_signal=mock_failure_signal
     )
     mock_job_cls = mocker.patch("securedrop_client.logic.SendReplyJob", return_value=mock_job)
-    add_job_emissions = QSignalSpy(co.add_job)
+    co.reply_encryptor = mocker.MagicMock()
 
     source = factory.Source()
     session.add(source)
@@ -2068,8 +2327,7 @@ def test_Controller_send_reply_success(
 
     mock_job_cls.assert_called_once_with(source.uuid, user.uuid, "mock_msg", co.gpg)
 
-    assert len(add_job_emissions) == 1
-    assert add_job_emissions[0] == [mock_job]
+    co.reply_encryptor.submit.assert_called_once_with(mock_job)
     mock_success_signal.connect.assert_called_once_with(co.on_reply_success)
     mock_failure_signal.connect.assert_called_once_with(co.on_reply_failure)
 
@@ -2288,6 +2546,16 @@ def test_Controller_on_queue_cleared(homedir, config, mocker, session_maker):
     fail_draft_replies.called_once_with(co.session)
 
 
+def test_Controller_on_queue_resumed(homedir, config, mocker, session_maker):
+    """
+    Check that the error status shown when the queue paused is cleared when it resumes on its own.
+    """
+    mock_gui = mocker.MagicMock()
+    co = Controller("http://localhost", mock_gui, session_maker, homedir, None)
+    co.on_queue_resumed()
+    mock_gui.clear_error_status.assert_called_once_with()
+
+
 def test_Controller_on_queue_paused(homedir, config, mocker, session_maker):
     """
     Check that a paused queue is communicated to the user via the error status bar
@@ -2348,6 +2616,19 @@ def test_get_file(mocker, session, homedir):
     assert obj == file
 
 
+def test_Controller_search_sources(mocker, homedir):
+    co = Controller("http://localhost", mocker.MagicMock(), mocker.MagicMock(), homedir, None)
+    storage = mocker.patch("securedrop_client.logic.storage")
+    storage.search.return_value = [
+        ("source-2", "message-1"),
+        ("source-1", "reply-1"),
+        ("source-2", "file-1"),
+    ]
+
+    assert co.search_sources("landing") == ["source-2", "source-1"]
+    storage.search.assert_called_once_with(co.session, "landing")
+
+
 def test_Controller_update_failed_replies(homedir, config, mocker, session, session_maker):
     """
     The "reply_failed" signal is emitted for each pending reply marked as failed.
@@ -2370,3 +2651,16 @@ def test_Controller_update_failed_replies(homedir, config, mocker, session, sess
     controller.update_failed_replies()
     for failed in failed_drafts:
         controller.reply_failed.emit.assert_called_once_with(failed.uuid)
+
+
+def test_Controller_queues_encrypted_replies(homedir, config, mocker, session_maker):
+    """
+    Check that a SendReplyJob is added to the queue once its reply has been encrypted.
+    """
+    co = Controller("http://localhost", mocker.MagicMock(), session_maker, homedir, None)
+    add_job_emissions = QSignalSpy(co.add_job)
+    mock_job = mocker.MagicMock()
+
+    co.reply_encryptor.encrypted.emit(mock_job)
+
+    assert list(add_job_emissions) == [[mock_job]]
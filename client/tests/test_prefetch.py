@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+from securedrop_client.config import Config
+from securedrop_client.prefetch import PrefetchPolicy
+from tests import factory
+
+
+def make_file(session, source, **attrs):
+    file = factory.File(source=source, is_downloaded=False, is_decrypted=None, **attrs)
+    session.add(file)
+    return file
+
+
+def test_PrefetchPolicy_from_config():
+    config = Config(
+        journalist_key_fingerprint="foo",
+        prefetch_max_file_size=1000,
+        prefetch_disk_budget=5000,
+        prefetch_recency_days=3,
+    )
+
+    assert PrefetchPolicy.from_config(config) == PrefetchPolicy(1000, 5000, 3)
+
+
+def test_PrefetchPolicy_from_config_caps_budget_at_file_cache_quota():
+    config = Config(
+        journalist_key_fingerprint="foo",
+        prefetch_max_file_size=1000,
+        prefetch_disk_budget=5000,
+        file_cache_quota=3000,
+    )
+
+    assert PrefetchPolicy.from_config(config).disk_budget == 3000
+
+
+def test_PrefetchPolicy_from_config_when_disabled():
+    config = Config(journalist_key_fingerprint="foo")
+
+    assert config.prefetch_max_file_size == 0
+    assert PrefetchPolicy.from_config(config) is None
+
+
+def test_PrefetchPolicy_next_file_prefers_recent_sources(session):
+    old_source = factory.Source(last_updated=datetime.utcnow() - timedelta(days=1))
+    new_source = factory.Source(last_updated=datetime.utcnow())
+    inactive_source = factory.Source(last_updated=datetime.utcnow() - timedelta(days=30))
+    session.add_all([old_source, new_source, inactive_source])
+    make_file(session, old_source, filename="1-doc.gz.gpg")
+    earlier_file = make_file(session, new_source, filename="1-doc.gz.gpg")
+    later_file = make_file(session, new_source, filename="2-doc.gz.gpg")
+    make_file(session, inactive_source, filename="3-doc.gz.gpg")
+    session.commit()
+
+    policy = PrefetchPolicy(max_file_size=1000, disk_budget=5000, recency_days=7)
+
+    assert policy.next_file(session) == later_file
+    assert policy.next_file(session, skip={later_file.uuid}) == earlier_file
+
+
+def test_PrefetchPolicy_next_file_within_limits(session):
+    """
+    Files that are too large, have already been downloaded, failed to download, or would exceed the
+    disk budget are not prefetched.
+    """
+    source = factory.Source()
+    session.add(source)
+    session.add(factory.File(source=source, size=3000))
+    make_file(session, source, filename="2-doc.gz.gpg", size=5000)
+    make_file(session, source, filename="3-doc.gz.gpg", size=2500)
+    make_file(session, source, filename="4-doc.gz.gpg", size=10, download_error_id=1)
+    small_file = make_file(session, source, filename="1-doc.gz.gpg", size=1500)
+    session.commit()
+
+    policy = PrefetchPolicy(max_file_size=4000, disk_budget=5000, recency_days=7)
+    assert policy.next_file(session) == small_file
+
+    policy = PrefetchPolicy(max_file_size=4000, disk_budget=3000, recency_days=7)
+    assert policy.next_file(session) is None
@@ -2,11 +2,14 @@
 Testing for the ApiJobQueue and related classes.
 """
 
-from queue import Queue
+import threading
+from queue import Empty, Queue
+from unittest.mock import call
 
 import pytest
 from PyQt5.QtTest import QSignalSpy
 
+from securedrop_client import storage
 from securedrop_client.api_jobs.base import ApiInaccessibleError, ClearQueueJob, PauseQueueJob
 from securedrop_client.api_jobs.downloads import (
     FileDownloadJob,
@@ -14,9 +17,12 @@ from securedrop_client.api_jobs.downloads import (
     ReplyDownloadJob,
 )
 from securedrop_client.api_jobs.seen import SeenJob
+from securedrop_client.api_jobs.sources import DeleteConversationJob, DeleteSourceJob
+from securedrop_client.api_jobs.updatestar import UpdateStarJob
 from securedrop_client.api_jobs.uploads import SendReplyJob
 from securedrop_client.app import threads
-from securedrop_client.queue import ApiJobQueue, RunnableQueue
+from securedrop_client.config import Config
+from securedrop_client.queue import ApiJobQueue, CircuitBreaker, JobJournal, RunnableQueue
 from securedrop_client.sdk import RequestTimeoutError, ServerConnectionError
 from tests import factory
 
@@ -63,6 +69,7 @@ def test_RunnableQueue_job_timeout(mocker, exception):
     Add two jobs to the queue. The first times out, and then gets resubmitted for the next pass
     through the loop.
     """
+    mocker.patch("securedrop_client.api_jobs.base.backoff_delay", return_value=0)
     queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
     queue.pause = mocker.MagicMock()
     job_cls = factory.dummy_job_factory(mocker, exception(), remaining_attempts=5)
@@ -92,6 +99,41 @@ def test_RunnableQueue_job_timeout(mocker, exception):
     assert queue.queue.get(block=True) == (1, job2)
 
 
+def test_RunnableQueue_retries_after_backoff_without_blocking(mocker):
+    """
+    A job that times out with attempts left is retried once its backoff delay has passed, and the
+    queue runs the jobs behind it in the meantime.
+    """
+    clock = mocker.patch("securedrop_client.queue.time")
+    clock.monotonic.return_value = 100.0
+    mocker.patch("securedrop_client.api_jobs.base.backoff_delay", return_value=60.0)
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    job_cls = factory.dummy_job_factory(mocker, [RequestTimeoutError(), "mock"])
+    other_cls = factory.dummy_job_factory(mocker, "mock")
+    queue.JOB_PRIORITIES = {job_cls: 1, other_cls: 2}
+    job = job_cls()
+    other = other_cls()
+    queue.add_job(job)
+    queue.add_job(other)
+
+    _, first = queue.queue.get_eligible(queue._can_start)
+    with queue.condition_add_or_remove_job:
+        queue._handle_error(first, queue._run_job(first))
+
+    assert first is job
+    assert job in queue.queue
+    assert queue.queue.get_eligible(queue._can_start) == (2, other)
+    with pytest.raises(Empty):
+        queue.queue.get_eligible(queue._can_start)
+    assert queue.queue.time_until_due() == 60.0
+    assert not queue.is_idle()
+
+    clock.monotonic.return_value = 160.0
+    assert queue.queue.get_eligible(queue._can_start) == (1, job)
+    assert queue._run_job(job) is None
+    assert not job.failure_signal.emit.called
+
+
 def test_RunnableQueue_process_ClearQueueJob(mocker):
     api_client = mocker.MagicMock()
     session_maker = mocker.MagicMock(return_value=mocker.MagicMock())
@@ -194,26 +236,65 @@ def test_RunnableQueue_duplicate_jobs(mocker):
     debug_logger = mocker.patch("securedrop_client.queue.logger.debug")
 
     # Queue begins empty (0 entries).
-    assert len(queue.queue.queue) == 0
+    assert queue.queue.qsize() == 0
 
     queue.add_job(dl_job)
-    assert len(queue.queue.queue) == 1
+    assert queue.queue.qsize() == 1
 
     # Now add the same job again.
     queue.add_job(dl_job)
-    assert len(queue.queue.queue) == 1
+    assert queue.queue.qsize() == 1
 
     assert debug_logger.call_args_list[1][0] == (f"Duplicate job {dl_job}, skipping",)
 
     # Now add a _different_ job with the same arguments (same uuid).
     queue.add_job(msg_dl_job)
-    assert len(queue.queue.queue) == 2
+    assert queue.queue.qsize() == 2
 
     # Ensure that using _re_add_job in the case of a timeout won't allow duplicate
     # jobs to be added.
     with queue.condition_add_or_remove_job:
         queue._re_add_job(msg_dl_job)
-    assert len(queue.queue.queue) == 2
+    assert queue.queue.qsize() == 2
+
+
+def test_RunnableQueue_duplicate_jobs_index(mocker):
+    """
+    The index of queued jobs used to check for duplicates is kept up to date as jobs are added,
+    processed, re-added and cleared.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    job = FileDownloadJob("mock", "mock", "mock")
+    queue.add_job(job)
+    assert FileDownloadJob("mock", "other", "other") in queue.queue
+    assert FileDownloadJob("other", "mock", "mock") not in queue.queue
+    assert MessageDownloadJob("mock", "mock", "mock") not in queue.queue
+
+    with queue.condition_add_or_remove_job:
+        priority, queue.current_job = queue.queue.get(block=False)
+    assert job not in queue.queue
+    queue.add_job(FileDownloadJob("mock", "other", "other"))  # still a duplicate of current_job
+    assert queue.queue.empty()
+
+    with queue.condition_add_or_remove_job:
+        job, queue.current_job = queue.current_job, None
+        queue._re_add_job(job)
+    assert job in queue.queue
+
+    queue._clear()
+    assert job not in queue.queue
+    queue.add_job(job)
+    assert queue.queue.qsize() == 1
+
+
+def test_RunnableQueue_clear_keeps_queue_updated_signal(mocker):
+    signal = mocker.MagicMock()
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), queue_updated_signal=signal)
+
+    queue._clear()
+    queue.add_job(MessageDownloadJob("mock", "mock", "mock"))
+
+    signal.emit.assert_called_once_with(1)
 
 
 def test_RunnableQueue_job_generic_exception(mocker):
@@ -274,6 +355,538 @@ def test_RunnableQueue_clear(mocker):
     assert queue.queue.empty()
 
 
+def test_RunnableQueue_is_idle(mocker):
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    assert queue.is_idle()
+
+    queue.add_job(PauseQueueJob())
+    assert not queue.is_idle()
+
+    queue.queue.get()
+    queue.current_job = PauseQueueJob()
+    assert not queue.is_idle()
+
+
+def blocking_job_factory(mocker, release: threading.Event):
+    """
+    Create a dummy job class whose jobs block until `release` is set.
+    """
+    dummy_job_cls = factory.dummy_job_factory(mocker, "mock")
+
+    class BlockingJob(dummy_job_cls):
+        def call_api(self, api_client, session):
+            release.wait()
+            return super().call_api(api_client, session)
+
+    return BlockingJob
+
+
+def test_RunnableQueue_workers_respect_concurrency_limits(mocker, qtbot):
+    """
+    With a worker pool, a job type that has reached its concurrency limit does not hold up
+    lower-priority jobs of other types, and the pool never runs more jobs than it has workers.
+    """
+    release = threading.Event()
+    download_job_cls = blocking_job_factory(mocker, release)
+    reply_job_cls = blocking_job_factory(mocker, release)
+    seen_job_cls = blocking_job_factory(mocker, release)
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), num_workers=3)
+    queue.JOB_PRIORITIES = {
+        download_job_cls: 1,
+        reply_job_cls: 2,
+        seen_job_cls: 3,
+        PauseQueueJob: 4,
+    }
+    queue.JOB_CONCURRENCY_LIMITS = {download_job_cls: 2}
+
+    for job in [download_job_cls() for i in range(3)] + [reply_job_cls(), seen_job_cls()]:
+        queue.add_job(job)
+    queue.add_job(PauseQueueJob())  # Pause queue so our test exits the processing loop
+
+    processing = threading.Thread(target=queue.process)
+    processing.start()
+    try:
+        qtbot.waitUntil(lambda: sum(queue.running_jobs.values()) == 3)
+        assert queue._running_job_types == {download_job_cls: 2, reply_job_cls: 1}
+        assert queue.queue.count(download_job_cls) == 1
+        assert queue.queue.count(seen_job_cls) == 1
+    finally:
+        release.set()
+        processing.join()
+
+    assert queue.queue.empty()
+    assert not queue.running_jobs
+    assert queue.is_idle()
+
+
+def test_RunnableQueue_workers_pause_once_on_timeout(mocker):
+    """
+    When several running jobs time out, the queue is paused once and all of them are added back to
+    the queue to be retried when it resumes.
+    """
+    mocker.patch("securedrop_client.api_jobs.base.backoff_delay", return_value=0)
+    job_cls = factory.dummy_job_factory(mocker, RequestTimeoutError())
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), num_workers=2)
+    queue.JOB_PRIORITIES = {PauseQueueJob: 0, job_cls: 1}
+    queue.JOB_CONCURRENCY_LIMITS = {job_cls: 2}
+    paused_spy = QSignalSpy(queue.paused)
+
+    job1 = job_cls()
+    job2 = job_cls()
+    queue.add_job(job1)
+    queue.add_job(job2)
+    queue.process()
+
+    assert len(paused_spy) == 1
+    assert queue.queue.qsize() == 2
+    assert queue.queue.count(PauseQueueJob) == 0
+    assert job1 in queue.queue
+    assert job2 in queue.queue
+    assert not queue.running_jobs
+
+
+def test_RunnableQueue_workers_stop_when_not_authed(mocker):
+    """
+    When a job running on a worker sees an ApiInaccessibleError, the processing loop returns and
+    api_client is set to None.
+    """
+    job_cls = factory.dummy_job_factory(mocker, ApiInaccessibleError())
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), num_workers=2)
+    queue.JOB_PRIORITIES = {job_cls: 1}
+
+    queue.add_job(job_cls())
+    queue.process()
+
+    assert queue.queue.empty()
+    assert queue.api_client is None
+    assert not queue._api_inaccessible
+
+
+def test_RunnableQueue_workers_finish_before_pause(mocker, qtbot):
+    """
+    A PauseQueueJob takes effect only after the jobs that are already running have finished.
+    """
+    release = threading.Event()
+    job_cls = blocking_job_factory(mocker, release)
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), num_workers=2)
+    queue.JOB_PRIORITIES = {job_cls: 1, PauseQueueJob: 2}
+    paused_spy = QSignalSpy(queue.paused)
+
+    queue.add_job(job_cls())
+    queue.add_job(PauseQueueJob())
+    processing = threading.Thread(target=queue.process)
+    processing.start()
+    try:
+        qtbot.waitUntil(lambda: isinstance(queue.current_job, PauseQueueJob))
+        assert len(paused_spy) == 0
+        assert len(queue.running_jobs) == 1
+    finally:
+        release.set()
+        processing.join()
+
+    assert len(paused_spy) == 1
+    assert queue.is_idle()
+
+
+def test_RunnableQueue_duplicate_running_jobs(mocker):
+    """
+    A job that is equal to one running on a worker is not added to the queue.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), num_workers=2)
+    job = FileDownloadJob("mock", "mock", "mock")
+    queue.running_jobs[job] += 1
+
+    queue.add_job(FileDownloadJob("mock", "mock", "mock"))
+
+    assert queue.queue.empty()
+    assert not queue.is_idle()
+
+
+def test_RunnableQueue_cancel_jobs_for_sources(mocker):
+    """
+    Queued downloads, seen and star updates of deleted sources are removed from the queue and the
+    journal, and other jobs are kept.
+    """
+    journal = mocker.MagicMock()
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), journal=journal)
+    gpg = mocker.MagicMock()
+    deleted_download = MessageDownloadJob("deleted", "mock", gpg, source_uuid="deleted-source")
+    kept_download = MessageDownloadJob("kept", "mock", gpg, source_uuid="kept-source")
+    deleted_seen = SeenJob([], ["deleted"], [], "deleted-source")
+    deleted_star = UpdateStarJob("deleted-source", False)
+    kept_reply = SendReplyJob("deleted-source", "reply-uuid", "message", gpg)
+    for job in [deleted_download, kept_download, deleted_seen, deleted_star, kept_reply]:
+        queue.add_job(job)
+
+    assert queue.cancel_jobs_for_sources({"deleted-source"}, conversation_only=True) == 2
+    assert queue.queue.qsize() == 3
+    assert deleted_download not in queue.queue
+    assert journal.record_finished.call_count == 2
+
+    assert queue.cancel_jobs_for_sources({"deleted-source"}) == 1
+    assert queue.queue.get(block=False) == (15, kept_reply)
+    assert queue.queue.get(block=False) == (17, kept_download)
+    assert queue.queue.empty()
+
+
+def test_ApiJobQueue_cancel_jobs_for_sources(mocker):
+    with threads(2) as [main_thread, file_download_thread]:
+        job_queue = ApiJobQueue(
+            mocker.MagicMock(), mocker.MagicMock(), main_thread, file_download_thread
+        )
+        job_queue.main_queue.add_job(UpdateStarJob("source-uuid", False))
+        job_queue.download_file_queue.add_job(
+            FileDownloadJob("file-uuid", "mock", "mock", source_uuid="source-uuid")
+        )
+
+        job_queue.cancel_jobs_for_sources({"source-uuid"}, conversation_only=True)
+        assert job_queue.main_queue.queue.qsize() == 1
+        assert job_queue.download_file_queue.queue.empty()
+
+        job_queue.cancel_jobs_for_sources({"source-uuid"})
+        assert job_queue.is_idle()
+
+
+def test_RunnableQueue_coalesces_seen_jobs(mocker):
+    """
+    Seen jobs added while one is queued are merged into it, and its signals are emitted for every
+    merged job.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    first = SeenJob(["file-1"], ["message-1"], [])
+    second = SeenJob(["file-1", "file-2"], [], ["reply-1"])
+    first_spy = QSignalSpy(first.success_signal)
+    second_spy = QSignalSpy(second.success_signal)
+
+    queue.add_job(first)
+    queue.add_job(second)
+
+    assert queue.queue.qsize() == 1
+    assert first.files == ["file-1", "file-2"]
+    assert first.messages == ["message-1"]
+    assert first.replies == ["reply-1"]
+
+    api_client = mocker.MagicMock()
+    first._do_call_api(api_client, mocker.MagicMock())
+
+    api_client.seen.assert_called_once_with(["file-1", "file-2"], ["message-1"], ["reply-1"])
+    assert list(first_spy) == [[None]]
+    assert list(second_spy) == [[None]]
+
+
+def test_RunnableQueue_coalesces_star_updates(mocker):
+    """
+    Opposing star updates for a queued source cancel out, and a third one is applied. Updates for
+    other sources are kept apart.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    star = UpdateStarJob("source-1", False)
+    unstar = UpdateStarJob("source-1", True)
+    other = UpdateStarJob("source-2", False)
+
+    queue.add_job(star)
+    queue.add_job(unstar)
+    queue.add_job(other)
+
+    assert queue.queue.qsize() == 2
+    assert star.is_cancelled_out
+
+    api_client = mocker.MagicMock()
+    star_spy = QSignalSpy(star.success_signal)
+    unstar_spy = QSignalSpy(unstar.success_signal)
+    assert not star._do_call_api(api_client, mocker.MagicMock())
+
+    api_client.add_star.assert_not_called()
+    api_client.remove_star.assert_not_called()
+    assert list(star_spy) == [["source-1"]]
+    assert list(unstar_spy) == [["source-1"]]
+
+    # Toggling the star a third time leaves the source starred
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    star = UpdateStarJob("source-1", False)
+    for job in [star, UpdateStarJob("source-1", True), UpdateStarJob("source-1", False)]:
+        queue.add_job(job)
+
+    assert queue.queue.qsize() == 1
+    assert not star.is_cancelled_out
+    assert star._do_call_api(api_client, mocker.MagicMock())
+    api_client.add_star.assert_called_once()
+
+
+def test_RunnableQueue_coalesce_looks_up_partner_by_key(mocker):
+    """
+    Jobs that cannot be merged are not offered to queued jobs, and a merge only considers the
+    queued job with the same coalesce key, until that job leaves the queue.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    coalesce = mocker.spy(UpdateStarJob, "coalesce")
+    star = UpdateStarJob("source-1", False)
+    queue.add_job(star)
+    for i in range(3):
+        queue.add_job(UpdateStarJob(f"source-{i + 2}", False))
+        queue.add_job(FileDownloadJob(f"file-{i}", "mock", "mock"))
+    assert coalesce.call_count == 0
+
+    queue.add_job(UpdateStarJob("source-1", True))
+    assert coalesce.call_count == 1
+    assert star.is_cancelled_out
+
+    # Once the job is taken off the queue, later jobs are not merged into it
+    queue.queue.remove_if(lambda job: job is star)
+    later = UpdateStarJob("source-1", False)
+    queue.add_job(later)
+    assert coalesce.call_count == 1
+    assert later in queue.queue.get_queued(UpdateStarJob)
+
+
+def test_RunnableQueue_star_update_while_running(mocker):
+    """
+    A star update for a source whose previous update is running is queued rather than dropped as a
+    duplicate.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), num_workers=2)
+    queue.running_jobs[UpdateStarJob("source-1", False)] += 1
+
+    queue.add_job(UpdateStarJob("source-1", True))
+
+    assert queue.queue.qsize() == 1
+
+
+def test_RunnableQueue_schedules_small_file_downloads_first(mocker):
+    """
+    A small file overtakes a large file that was queued shortly before it, but not one that has
+    already waited longer than the large file's size is worth.
+    """
+    mocker.patch("securedrop_client.queue.time.monotonic", side_effect=[0.0, 1.0, 3000.0])
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), num_workers=3)
+    gpg = mocker.MagicMock()
+    large = FileDownloadJob("large", "mock", gpg, size=2_000_000_000)
+    small = FileDownloadJob("small", "mock", gpg, size=50_000)
+    late = FileDownloadJob("late", "mock", gpg, size=50_000)
+
+    queue.add_job(large)
+    queue.add_job(small)
+    queue.add_job(late)
+
+    assert queue.queue.get(block=False) == (13, small)
+    assert queue.queue.get(block=False) == (13, large)
+    assert queue.queue.get(block=False) == (13, late)
+
+
+def test_RunnableQueue_file_downloads_limited_by_workers(mocker):
+    """
+    File downloads have no concurrency limit of their own, so every worker can download a file.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), num_workers=3)
+    for uuid in ["1", "2", "3"]:
+        queue.add_job(FileDownloadJob(uuid, "mock", "mock"))
+    queue.running_jobs.update([FileDownloadJob("4", "mock", "mock")] * 2)
+    queue._running_job_types[FileDownloadJob] = 2
+    assert queue._can_dispatch()
+
+    queue.running_jobs[FileDownloadJob("5", "mock", "mock")] += 1
+    queue._running_job_types[FileDownloadJob] += 1
+    assert queue._can_start(FileDownloadJob)
+    assert not queue._can_dispatch()
+
+
+def test_RunnableQueue_records_job_times(mocker):
+    """
+    The time a job waited in the queue and the time it ran are recorded by job type.
+    """
+    mocker.patch("securedrop_client.queue.time.monotonic", side_effect=[10.0, 12.0, 15.0])
+    job_cls = factory.dummy_job_factory(mocker, "mock")
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    queue.JOB_PRIORITIES = {job_cls: 1, PauseQueueJob: 2}
+
+    queue.add_job(job_cls())
+    job = queue.queue.get(block=False)[1]
+    queue._run_job(job)
+
+    times = queue.job_times[job_cls]
+    assert times.count == 1
+    assert times.mean_wait == 2.0
+    assert times.max_service == 3.0
+    assert queue.job_times[PauseQueueJob].count == 0
+
+
+def test_RunnableQueue_focus_source(mocker):
+    """
+    Focusing a source moves its queued downloads ahead of other downloads without adding or
+    dropping any, and focusing another source moves them back.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    gpg = mocker.MagicMock()
+    other = MessageDownloadJob("other", "mock", gpg, source_uuid="other-source")
+    seen = SeenJob([], [], [])
+    selected = MessageDownloadJob("selected", "mock", gpg, source_uuid="selected-source")
+    reply = ReplyDownloadJob("reply", "mock", gpg, source_uuid="selected-source")
+    for job in [other, seen, selected, reply]:
+        queue.add_job(job)
+
+    queue.focus_source("selected-source")
+
+    assert queue.queue.qsize() == 4
+    assert queue.queue.get(block=False) == (16.5, selected)
+    assert queue.queue.get(block=False) == (16.5, reply)
+
+    # Downloads added later for the focused source are also run first
+    late = MessageDownloadJob("late", "mock", gpg, source_uuid="selected-source")
+    queue.add_job(late)
+    queue.add_job(selected)
+    assert queue.queue.get(block=False) == (16.5, late)
+    assert queue.queue.get(block=False) == (16.5, selected)
+
+    queue.add_job(reply)
+    queue.focus_source(None)
+
+    assert queue.queue.qsize() == 3
+    assert queue.queue.get(block=False) == (17, other)
+    assert queue.queue.get(block=False) == (17, reply)
+    assert queue.queue.get(block=False) == (18, seen)
+
+
+def test_RunnableQueue_focused_downloads_run_after_user_initiated_jobs(mocker):
+    """
+    Downloads of the focused source run ahead of the other jobs of their type, but after the jobs
+    that the user started and that have a higher priority in JOB_PRIORITIES.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    gpg = mocker.MagicMock()
+    focused_file = FileDownloadJob("focused-file", "mock", gpg, source_uuid="selected-source")
+    other_file = FileDownloadJob("other-file", "mock", gpg, source_uuid="other-source")
+    focused = MessageDownloadJob("focused", "mock", gpg, source_uuid="selected-source")
+    other = MessageDownloadJob("other", "mock", gpg, source_uuid="other-source")
+    user_jobs = [
+        DeleteSourceJob("source-uuid"),
+        DeleteConversationJob("other-source-uuid"),
+        SendReplyJob("source-uuid", "reply-uuid", "ciphertext", gpg),
+        UpdateStarJob("source-uuid", False),
+    ]
+    queue.focus_source("selected-source")
+    for job in [other_file, other, focused_file, focused, SeenJob([], [], []), *user_jobs]:
+        queue.add_job(job)
+
+    order = [queue.queue.get(block=False)[1] for _ in range(queue.queue.qsize())]
+
+    assert order.index(focused_file) < order.index(other_file)
+    assert order.index(focused) < order.index(other)
+    for job in user_jobs:
+        assert order.index(job) < order.index(focused)
+        assert queue._get_priority(job) == queue.JOB_PRIORITIES[type(job)]
+
+
+def test_ApiJobQueue_focus_source(mocker):
+    with threads(2) as [main_thread, file_download_thread]:
+        job_queue = ApiJobQueue(
+            mocker.MagicMock(), mocker.MagicMock(), main_thread, file_download_thread
+        )
+        job_queue.focus_source("source-uuid")
+
+        assert job_queue.main_queue.focused_source_uuid == "source-uuid"
+        assert job_queue.download_file_queue.focused_source_uuid == "source-uuid"
+
+
+def test_RunnableQueue_journals_download_jobs(mocker):
+    """
+    Download jobs are recorded when they are queued and started, and removed from the journal
+    once they have finished.
+    """
+    journal = mocker.MagicMock()
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), journal=journal)
+    job = MessageDownloadJob("mock", "mock", mocker.MagicMock())
+    mocker.patch.object(job, "_try_call_api")
+
+    queue.add_job(job)
+    queue.add_job(job)  # Duplicates are not recorded
+    queue._run_job(queue.queue.get(block=False)[1])
+
+    assert journal.mock_calls == [
+        call.record_queued(job),
+        call.record_started(job),
+        call.record_finished(job),
+    ]
+
+
+@pytest.mark.parametrize("exception", [RequestTimeoutError, ApiInaccessibleError])
+def test_RunnableQueue_keeps_interrupted_jobs_in_journal(mocker, exception):
+    journal = mocker.MagicMock()
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), journal=journal)
+    job = MessageDownloadJob("mock", "mock", mocker.MagicMock())
+    mocker.patch.object(job, "_try_call_api", side_effect=exception())
+
+    queue._run_job(job)
+
+    journal.record_started.assert_called_once_with(job)
+    journal.record_finished.assert_not_called()
+
+
+def test_RunnableQueue_keeps_download_in_journal_until_decrypted(mocker):
+    """
+    A download that was handed to the decryption stage is only removed from the journal once its
+    file has been decrypted, so that it is restored if the client stops while decrypting.
+    """
+    journal = mocker.MagicMock()
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), journal=journal)
+    job = MessageDownloadJob("mock", "mock", mocker.MagicMock())
+
+    def hand_to_decryption_stage(api_client, session):
+        job._decryption_pending = True
+
+    mocker.patch.object(job, "_try_call_api", side_effect=hand_to_decryption_stage)
+
+    queue._run_job(job)
+
+    journal.record_finished.assert_not_called()
+
+    job.emit_decryption_result(None)
+
+    journal.record_finished.assert_called_once_with(job)
+
+
+def test_JobJournal_records_download_jobs_only(mocker):
+    writer = mocker.MagicMock()
+    journal = JobJournal(writer)
+    job = FileDownloadJob("file-uuid", "mock", mocker.MagicMock())
+
+    journal.record_queued(job)
+    journal.record_started(job)
+    journal.record_finished(job)
+    journal.record_queued(SeenJob([], [], []))
+    journal.record_queued(PauseQueueJob())
+
+    assert writer.submit.call_args_list == [
+        call(storage.add_queued_job, "FileDownloadJob", "file-uuid"),
+        call(storage.mark_queued_job_as_started, "FileDownloadJob", "file-uuid"),
+        call(storage.delete_queued_job, "FileDownloadJob", "file-uuid"),
+    ]
+
+
+def test_ApiJobQueue_is_idle(mocker):
+    with threads(2) as [main_thread, file_download_thread]:
+        job_queue = ApiJobQueue(
+            mocker.MagicMock(), mocker.MagicMock(), main_thread, file_download_thread
+        )
+        assert job_queue.is_idle()
+
+        job_queue.download_file_queue.add_job(PauseQueueJob())
+        assert not job_queue.is_idle()
+
+
+def test_ApiJobQueue_main_queue_workers(mocker):
+    """
+    Both queues run jobs on worker pools sized from the configuration.
+    """
+    mocker.patch("securedrop_client.queue.Config.load", return_value=Config("foobar"))
+    with threads(2) as [main_thread, file_download_thread]:
+        job_queue = ApiJobQueue(
+            mocker.MagicMock(), mocker.MagicMock(), main_thread, file_download_thread
+        )
+
+        assert job_queue.main_queue.num_workers == 4
+        assert job_queue.download_file_queue.num_workers == 3
+
+
 def test_ApiJobQueue_enqueue_when_queues_are_running(mocker):
     mock_client = mocker.MagicMock()
     mock_session_maker = mocker.MagicMock()
@@ -322,6 +935,127 @@ def test_ApiJobQueue_enqueue_when_queues_are_running(mocker):
         assert not mock_download_file_add_job.called
 
 
+def test_RunnableQueue_prefetch_jobs(mocker):
+    """
+    Prefetch jobs run after every other job, are not journaled, and can be cancelled on their own.
+    """
+    writer = mocker.MagicMock()
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), journal=JobJournal(writer))
+    prefetch = FileDownloadJob("prefetched", "mock", "mock", prefetch=True)
+    download = FileDownloadJob("downloaded", "mock", "mock")
+    queue.add_job(prefetch)
+    queue.add_job(download)
+
+    writer.submit.assert_called_once_with(storage.add_queued_job, "FileDownloadJob", "downloaded")
+    assert queue.queue.get(block=False) == (13, download)
+    assert queue.queue.get(block=False) == (19, prefetch)
+
+    queue.add_job(prefetch)
+    queue.add_job(download)
+
+    assert queue.cancel_prefetch_jobs() == 1
+    assert queue.queue.get(block=False) == (13, download)
+    assert queue.queue.empty()
+
+
+def test_RunnableQueue_cancel_prefetch_jobs_without_any_queued(mocker):
+    """
+    Cancelling prefetch jobs does not walk the queue unless a prefetch job is queued.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    prefetch = FileDownloadJob("prefetched", "mock", "mock", prefetch=True)
+    for i in range(3):
+        queue.add_job(FileDownloadJob(f"file-{i}", "mock", "mock"))
+    remove_if = mocker.spy(queue.queue, "remove_if")
+
+    assert queue.cancel_prefetch_jobs() == 0
+    remove_if.assert_not_called()
+
+    queue.add_job(prefetch)
+    assert queue.queue.has_prefetch_jobs()
+    assert queue.cancel_prefetch_jobs() == 1
+    assert not queue.queue.has_prefetch_jobs()
+
+    queue.add_job(prefetch)
+    queue.queue.get(block=False)
+    queue.queue.get(block=False)
+    queue.queue.get(block=False)
+    assert queue.queue.get(block=False) == (19, prefetch)
+    assert not queue.queue.has_prefetch_jobs()
+
+
+def test_ApiJobQueue_enqueue_preempts_prefetch_jobs(mocker):
+    """
+    Any other job removes the queued prefetch jobs, so that a download the user asks for replaces a
+    queued prefetch of the same file.
+    """
+    with threads(2) as [main_thread, file_download_thread]:
+        job_queue = ApiJobQueue(
+            mocker.MagicMock(), mocker.MagicMock(), main_thread, file_download_thread
+        )
+        job_queue.main_thread.isRunning = mocker.MagicMock(return_value=True)
+        job_queue.download_file_thread.isRunning = mocker.MagicMock(return_value=True)
+        download_file_queue = job_queue.download_file_queue
+
+        job_queue.enqueue(FileDownloadJob("mock", "mock", "mock", prefetch=True))
+        job_queue.enqueue(FileDownloadJob("other", "mock", "mock", prefetch=True))
+        download = FileDownloadJob("mock", "mock", "mock")
+        job_queue.enqueue(download)
+
+        assert download_file_queue.queue.get(block=False) == (13, download)
+        assert download_file_queue.queue.empty()
+
+
+def test_RunnableQueue_add_job_upgrades_running_prefetch_job(mocker):
+    """
+    A download that the user asks for while the file is being prefetched upgrades the running
+    prefetch job, which is then journaled, runs with the priority of a download, and emits the
+    signals of the user's job instead of its own.
+    """
+    writer = mocker.MagicMock()
+    queue = RunnableQueue(
+        mocker.MagicMock(), mocker.MagicMock(), num_workers=2, journal=JobJournal(writer)
+    )
+    prefetch = FileDownloadJob("mock", "mock", "mock", prefetch=True)
+    prefetch_failures = []
+    prefetch.failure_signal.connect(prefetch_failures.append)
+    queue.running_jobs[prefetch] += 1
+    download = FileDownloadJob("mock", "mock", "mock")
+    download_failures = []
+    download.failure_signal.connect(download_failures.append)
+
+    queue.add_job(download)
+
+    assert queue.queue.empty()
+    assert not prefetch.prefetch
+    assert queue._get_priority(prefetch) == 13
+    writer.submit.assert_called_once_with(storage.add_queued_job, "FileDownloadJob", "mock")
+
+    error = Exception("mock")
+    prefetch.emit_decryption_result(error)
+
+    assert prefetch_failures == []
+    assert download_failures == [error]
+
+
+def test_RunnableQueue_add_job_after_prefetch_job_finished(mocker):
+    """
+    A download that the user asks for just after the prefetch of the file emitted its result is
+    queued rather than skipped as a duplicate.
+    """
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), num_workers=2)
+    prefetch = FileDownloadJob("mock", "mock", "mock", prefetch=True)
+    queue.running_jobs[prefetch] += 1
+    prefetch.emit_decryption_result(None)
+    download = FileDownloadJob("mock", "mock", "mock")
+
+    queue.add_job(download)
+
+    assert prefetch.prefetch
+    assert queue.queue.get(block=False) == (13, download)
+    assert queue.queue.empty()
+
+
 def test_ApiJobQueue_enqueue_when_queues_are_not_running(mocker):
     mock_client = mocker.MagicMock()
     mock_session_maker = mocker.MagicMock()
@@ -404,6 +1138,125 @@ def test_ApiJobQueue_on_file_download_queue_paused(mocker):
         job_queue.paused.emit.assert_called_once_with()
 
 
+def test_CircuitBreaker_probes_after_backoff(mocker, qtbot):
+    """
+    A failure opens the breaker, which probes the server once the backoff delay has passed, and
+    closes again when a request goes through.
+    """
+    mocker.patch("securedrop_client.queue.backoff_delay", return_value=0.01)
+    breaker = CircuitBreaker()
+    probe_spy = QSignalSpy(breaker.probe)
+    closed_spy = QSignalSpy(breaker.closed)
+
+    breaker.record_success()
+    assert len(closed_spy) == 0
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    qtbot.waitUntil(lambda: breaker.state == CircuitBreaker.HALF_OPEN)
+    assert len(probe_spy) == 1
+
+    breaker.record_failure()
+    assert breaker.consecutive_failures == 2
+    qtbot.waitUntil(lambda: len(probe_spy) == 2)
+
+    breaker.record_success()
+    assert breaker.is_closed()
+    assert breaker.consecutive_failures == 0
+    assert len(closed_spy) == 1
+
+
+def test_CircuitBreaker_reset_cancels_probe(mocker):
+    breaker = CircuitBreaker()
+    timer = mocker.patch("securedrop_client.queue.threading.Timer")
+
+    breaker.record_failure()
+    breaker.reset()
+
+    timer.return_value.cancel.assert_called_once_with()
+    assert breaker.is_closed()
+    breaker._on_delay_elapsed()
+    assert breaker.is_closed()
+
+
+def test_RunnableQueue_circuit_breaker(mocker):
+    """
+    A timeout opens the circuit breaker, after which the queue runs one job at a time until a job
+    goes through.
+    """
+    mocker.patch("securedrop_client.queue.threading.Timer")
+    breaker = CircuitBreaker()
+    queue = RunnableQueue(
+        mocker.MagicMock(), mocker.MagicMock(), num_workers=2, circuit_breaker=breaker
+    )
+    queue.add_job(FileDownloadJob("timed-out", "mock", "mock"))
+    queue.add_job(FileDownloadJob("other", "mock", "mock"))
+    job = queue.queue.get(block=False)[1]
+
+    with queue.condition_add_or_remove_job:
+        queue._handle_error(job, RequestTimeoutError())
+    assert breaker.state == CircuitBreaker.OPEN
+
+    queue.running_jobs[job] += 1
+    assert not queue._can_dispatch()
+
+    probe_cls = factory.dummy_job_factory(mocker, "mock")
+    queue._run_job(probe_cls())
+    assert breaker.is_closed()
+    assert queue._can_dispatch()
+
+
+@pytest.mark.parametrize("made_request", [False, True])
+def test_RunnableQueue_circuit_breaker_ignores_jobs_that_did_not_reach_server(mocker, made_request):
+    """
+    A job that failed, or that succeeded without sending a request, does not close the circuit
+    breaker.
+    """
+    mocker.patch("securedrop_client.queue.threading.Timer")
+    breaker = CircuitBreaker()
+    breaker.record_failure()
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock(), circuit_breaker=breaker)
+
+    failing_cls = factory.dummy_job_factory(mocker, Exception())
+    queue._run_job(failing_cls())
+    assert breaker.state == CircuitBreaker.OPEN
+
+    skipping_cls = factory.dummy_job_factory(mocker, "mock")
+    skipping_job = skipping_cls()
+    mocker.patch.object(skipping_job, "_try_call_api", return_value=made_request)
+    queue._run_job(skipping_job)
+    assert breaker.is_closed() == made_request
+
+
+def test_ApiJobQueue_resumes_paused_queues_when_circuit_breaker_closes(mocker):
+    """
+    When the server can be reached again, the queues that are paused are resumed without waiting
+    for a sync, and the resumed signal is emitted.
+    """
+    with threads(2) as [main_thread, file_download_thread]:
+        job_queue = ApiJobQueue(
+            mocker.MagicMock(), mocker.MagicMock(), main_thread, file_download_thread
+        )
+        mocker.patch.object(job_queue.main_queue, "resume")
+        mocker.patch.object(job_queue.download_file_queue, "resume")
+        job_queue.main_thread.isRunning = mocker.MagicMock(return_value=True)
+        job_queue.download_file_thread.isRunning = mocker.MagicMock(return_value=True)
+        resumed_spy = QSignalSpy(job_queue.resumed)
+
+        job_queue.download_file_queue.is_paused = True
+        job_queue.on_circuit_breaker_probe()
+
+        job_queue.main_queue.resume.emit.assert_not_called()
+        job_queue.download_file_queue.resume.emit.assert_called_once_with()
+        assert len(resumed_spy) == 0
+
+        job_queue.main_queue.is_paused = True
+        job_queue.on_circuit_breaker_closed()
+
+        job_queue.main_queue.resume.emit.assert_called_once_with()
+        assert len(resumed_spy) == 1
+
+
 def test_ApiJobQueue_resume_queues_emits_resume_signal_if_queues_are_running(mocker):
     """
     Ensure resume signal is emitted if the queues are running.
@@ -571,8 +1424,12 @@ def test_ApiJobQueue_stop_results_in_queue_threads_not_running(mocker):
 
 
 def test_ApiJobQueue_emits_main_queue_updated_signal_when_message_or_reply_download_added(
-    mocker,
+    mocker, qtbot
 ):
+    """
+    The first change is emitted straight away. Changes made within UPDATE_INTERVAL_SECONDS of an
+    emission are coalesced into one emission of the latest count.
+    """
     mock_client = mocker.MagicMock()
     mock_session_maker = mocker.MagicMock()
 
@@ -587,25 +1444,19 @@ def test_ApiJobQueue_emits_main_queue_updated_signal_when_message_or_reply_downl
 
         job_queue.enqueue(message_download_job)
         job_queue.enqueue(reply_download_job)
-        main_queue_updated_emissions.wait(MAX_SIGNAL_WAITING_TIME)
-        main_queue_updated_emissions.wait(MAX_SIGNAL_WAITING_TIME)
-
-        assert len(main_queue_updated_emissions) == 2
+        assert len(main_queue_updated_emissions) == 1
         assert main_queue_updated_emissions[0][0] == 1
+        qtbot.waitUntil(lambda: len(main_queue_updated_emissions) == 2)
         assert main_queue_updated_emissions[1][0] == 2
 
         job_queue.main_queue.queue.get()
         job_queue.main_queue.queue.get()
-        main_queue_updated_emissions.wait(MAX_SIGNAL_WAITING_TIME)
-        main_queue_updated_emissions.wait(MAX_SIGNAL_WAITING_TIME)
-
-        assert len(main_queue_updated_emissions) == 4
-        assert main_queue_updated_emissions[2][0] == 1
-        assert main_queue_updated_emissions[3][0] == 0
+        qtbot.waitUntil(lambda: len(main_queue_updated_emissions) == 3)
+        assert main_queue_updated_emissions[2][0] == 0
 
 
 def test_ApiJobQueue_does_not_emit_main_queue_updated_signal_when_non_message_job_added(
-    mocker,
+    mocker, qtbot
 ):
     mock_client = mocker.MagicMock()
     mock_session_maker = mocker.MagicMock()
@@ -619,13 +1470,24 @@ def test_ApiJobQueue_does_not_emit_main_queue_updated_signal_when_non_message_jo
         job_queue.download_file_thread.isRunning = mocker.MagicMock(return_value=True)
 
         job_queue.enqueue(message_download_job)
-        main_queue_updated_emissions.wait(MAX_SIGNAL_WAITING_TIME)
 
+        # The initial count is emitted once
         assert len(main_queue_updated_emissions) == 1
         assert main_queue_updated_emissions[0][0] == 0
 
         job_queue.main_queue.queue.get()
-        main_queue_updated_emissions.wait(MAX_SIGNAL_WAITING_TIME)
+        qtbot.wait(int(job_queue.main_queue.queue.UPDATE_INTERVAL_SECONDS * 2000))
+
+        assert len(main_queue_updated_emissions) == 1
+
+
+def test_RunnablePriorityQueue_counts_jobs_by_type(mocker):
+    queue = RunnableQueue(mocker.MagicMock(), mocker.MagicMock())
+    queue.add_job(MessageDownloadJob("mock-1", "mock", "mock"))
+    queue.add_job(ReplyDownloadJob("mock-2", "mock", "mock"))
+    queue.add_job(SeenJob("mock", "mock", "mock"))
+
+    assert queue.queue._get_num_message_or_reply_download_jobs() == 2
 
-        assert len(main_queue_updated_emissions) == 2
-        assert main_queue_updated_emissions[1][0] == 0
+    queue.queue.get()
+    assert queue.queue._get_num_message_or_reply_download_jobs() == 1
@@ -22,10 +22,12 @@ from securedrop_client.storage import (
     _cleanup_directory_if_empty,
     _cleanup_flagged_locally_deleted,
     _delete_source_collection_from_db,
+    add_queued_job,
     create_or_update_user,
     delete_local_conversation_by_source_uuid,
     delete_local_source_by_uuid,
-    delete_single_submission_or_reply_on_disk,
+    delete_pending_deletion_on_disk,
+    delete_queued_job,
     find_new_files,
     find_new_messages,
     find_new_replies,
@@ -35,12 +37,20 @@ from securedrop_client.storage import (
     get_local_replies,
     get_local_sources,
     get_message,
+    get_pending_deletions,
+    get_queued_jobs,
     get_remote_data,
     get_reply,
     mark_all_pending_drafts_as_failed,
     mark_as_decrypted,
     mark_as_downloaded,
     mark_as_not_downloaded,
+    mark_queued_job_as_started,
+    schedule_deletion_on_disk,
+    schedule_submission_or_reply_deletion,
+    search,
+    set_download_error,
+    set_draft_reply_ciphertext,
     set_message_or_reply_content,
     source_exists,
     update_draft_replies,
@@ -50,6 +60,7 @@ from securedrop_client.storage import (
     update_messages,
     update_missing_files,
     update_replies,
+    update_search_index,
     update_sources,
 )
 from tests import factory
@@ -141,10 +152,11 @@ def test_get_local_sources(mocker):
 
 def test_delete_local_source_by_uuid(homedir, mocker):
     """
-    Delete the referenced source in the session. Ensure that both
-    the database object and the corresponding source documents are deleted.
+    Delete the referenced source in the session. Ensure that the database object is
+    deleted and the corresponding source documents are scheduled for deletion.
     """
     mock_session = mocker.MagicMock()
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
     source = factory.RemoteSource()
     source.journalist_filename = "sourcey_mcsource"
 
@@ -157,21 +169,20 @@ def test_delete_local_source_by_uuid(homedir, mocker):
     with open(path_to_source_document, "w") as f:
         f.write("this is a source document")
 
-    mock_session.query().filter_by().one_or_none.return_value = source
-    mock_session.query.reset_mock()
+    lookup_by_uuid().params().one_or_none.return_value = source
+    lookup_by_uuid.reset_mock()
     delete_local_source_by_uuid(mock_session, "uuid", homedir)
-    mock_session.query.assert_called_once_with(securedrop_client.db.Source)
-    mock_session.query().filter_by.assert_called_once_with(uuid="uuid")
-    assert mock_session.query().filter_by().one_or_none.call_count == 1
+    lookup_by_uuid.assert_called_once_with(mock_session, securedrop_client.db.Source)
+    lookup_by_uuid().params.assert_called_once_with(uuid="uuid")
+    assert lookup_by_uuid().params().one_or_none.call_count == 1
     mock_session.delete.assert_called_once_with(source)
     mock_session.commit.assert_called_once_with()
 
-    # Ensure both source folder and its containing file are gone.
-    with pytest.raises(FileNotFoundError):
-        f = open(path_to_source_document)
-
-    with pytest.raises(FileNotFoundError):
-        f = open(source_directory)
+    # Ensure the source folder is left for the DiskDeleter to delete.
+    assert os.path.exists(path_to_source_document)
+    pending_deletion = mock_session.add.call_args_list[0][0][0]
+    assert isinstance(pending_deletion, db.PendingDeletion)
+    assert pending_deletion.path == source_directory
 
 
 def test_delete_local_source_by_uuid_no_files(homedir, mocker):
@@ -180,14 +191,15 @@ def test_delete_local_source_by_uuid_no_files(homedir, mocker):
     corresponding to this source, no exception should be raised.
     """
     mock_session = mocker.MagicMock()
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
     source = factory.RemoteSource()
     source.journalist_filename = "sourcey_mcsource"
-    mock_session.query().filter_by().one_or_none.return_value = source
-    mock_session.query.reset_mock()
+    lookup_by_uuid().params().one_or_none.return_value = source
+    lookup_by_uuid.reset_mock()
     delete_local_source_by_uuid(mock_session, "uuid", homedir)
-    mock_session.query.assert_called_once_with(securedrop_client.db.Source)
-    mock_session.query().filter_by.assert_called_once_with(uuid="uuid")
-    assert mock_session.query().filter_by().one_or_none.call_count == 1
+    lookup_by_uuid.assert_called_once_with(mock_session, securedrop_client.db.Source)
+    lookup_by_uuid().params.assert_called_once_with(uuid="uuid")
+    assert lookup_by_uuid().params().one_or_none.call_count == 1
     mock_session.delete.assert_called_once_with(source)
     mock_session.commit.assert_called_once_with()
 
@@ -442,7 +454,7 @@ def test_update_sources_no_skipped_uuids(homedir, mocker, session_maker, session
 
     local_sources = [local_source1, local_source2]
 
-    file_delete_fcn = mocker.patch("securedrop_client.storage.delete_source_collection")
+    file_delete_fcn = mocker.patch("securedrop_client.storage.schedule_source_collection_deletion")
 
     # Don't pass in UUIDS to skip, test that separately
     update_sources(remote_sources, local_sources, [], [], session, homedir)
@@ -462,8 +474,8 @@ def test_update_sources_no_skipped_uuids(homedir, mocker, session_maker, session
         session.query(db.Source).filter_by(uuid=local_source2.uuid).one()
 
     # Ensure that we called the method to delete the source collection.
-    # This will delete any content in that source's data directory.
-    assert file_delete_fcn.call_count == 1
+    # This will schedule deletion of any content in that source's data directory.
+    file_delete_fcn.assert_called_once_with(session, local_source2.journalist_filename, homedir)
 
 
 def add_test_file_to_temp_dir(home_dir, filename):
@@ -479,11 +491,21 @@ def add_test_file_to_temp_dir(home_dir, filename):
     return dest
 
 
+def delete_pending_deletions_on_disk(mock_session, data_dir):
+    """
+    Delete everything that was scheduled for deletion using the given mock session, as the
+    DiskDeleter would once the session has been committed.
+    """
+    for call in mock_session.add.call_args_list:
+        if isinstance(call[0][0], db.PendingDeletion):
+            delete_pending_deletion_on_disk(mock_session, call[0][0], data_dir)
+
+
 def test_update_submissions_deletes_files_associated_with_the_submission(homedir, mocker):
     """
     Check that:
 
-    * Submissions are deleted on disk after sync.
+    * Submissions are scheduled for deletion on disk during sync.
     """
     mock_session = mocker.MagicMock()
 
@@ -514,15 +536,16 @@ def test_update_submissions_deletes_files_associated_with_the_submission(homedir
     mock_session.query().filter_by.return_value = [local_source]
     update_files(remote_submissions, local_submissions, [], [], mock_session, homedir)
 
-    # Ensure the files associated with the submission are deleted on disk.
-    assert not os.path.exists(abs_local_filename)
-
     # Ensure the record for the local submission is gone.
     mock_session.delete.assert_called_once_with(local_submission)
 
     # Session is committed to database.
     assert mock_session.commit.call_count == 1
 
+    # Ensure the files associated with the submission are deleted on disk.
+    delete_pending_deletions_on_disk(mock_session, homedir)
+    assert not os.path.exists(abs_local_filename)
+
 
 def test_update_local_storage_does_not_call_update_functions_w_insecure_filenames(mocker, homedir):
     """
@@ -570,7 +593,7 @@ def test_update_replies_deletes_files_associated_with_the_reply(homedir, mocker)
     """
     Check that:
 
-    * Replies are deleted on disk after sync.
+    * Replies are scheduled for deletion on disk during sync.
     """
     mock_session = mocker.MagicMock()
 
@@ -596,21 +619,22 @@ def test_update_replies_deletes_files_associated_with_the_reply(homedir, mocker)
     # test skipped UUIDs separately, for now pass empty list
     update_replies(remote_replies, local_replies, [], [], mock_session, homedir)
 
-    # Ensure the file associated with the reply are deleted on disk.
-    assert not os.path.exists(abs_local_filename)
-
     # Ensure the record for the local reply is gone.
     mock_session.delete.assert_called_once_with(local_reply)
 
     # Session is committed to database.
     assert mock_session.commit.call_count == 1
 
+    # Ensure the file associated with the reply are deleted on disk.
+    delete_pending_deletions_on_disk(mock_session, homedir)
+    assert not os.path.exists(abs_local_filename)
+
 
 def test_update_sources_deletes_files_associated_with_the_source(homedir, mocker, session_maker):
     """
     Check that:
 
-    * Sources are deleted on disk after sync.
+    * Sources are scheduled for deletion on disk during sync.
     """
     mock_session = mocker.MagicMock()
 
@@ -674,10 +698,6 @@ def test_update_sources_deletes_files_associated_with_the_source(homedir, mocker
     # Don't pass UUIDs to skip, test that separately
     update_sources(remote_sources, local_sources, [], [], mock_session, homedir)
 
-    # Ensure the files associated with the reply are deleted on disk.
-    for test_filename in test_filename_absolute_paths:
-        assert not os.path.exists(test_filename)
-
     # Ensure the record for the local source is gone, along with its
     # related files.
     mock_session.delete.assert_called_with(local_source)
@@ -685,6 +705,11 @@ def test_update_sources_deletes_files_associated_with_the_source(homedir, mocker
     # Session is committed to database.
     assert mock_session.commit.call_count == 1
 
+    # Ensure the files associated with the reply are deleted on disk.
+    delete_pending_deletions_on_disk(mock_session, homedir)
+    for test_filename in test_filename_absolute_paths:
+        assert not os.path.exists(test_filename)
+
 
 def test_update_files(homedir, mocker):
     """
@@ -697,6 +722,7 @@ def test_update_files(homedir, mocker):
     """
     data_dir = os.path.join(homedir, "data")
     mock_session = mocker.MagicMock()
+    lookup_by_uuid = mocker.patch("securedrop_client.utils.lookup_by_uuid")
     # Source object related to the submissions.
     source = mocker.MagicMock()
     source.uuid = str(uuid.uuid4())
@@ -724,9 +750,9 @@ def test_update_files(homedir, mocker):
     local_source = mocker.MagicMock()
     local_source.uuid = source.uuid
     local_source.id = 666  # };-)
-    mock_session.query().filter_by().first.return_value = local_source
+    lookup_by_uuid().params().first.return_value = local_source
     mock_delete_submission_files = mocker.patch(
-        "securedrop_client.storage.delete_single_submission_or_reply_on_disk"
+        "securedrop_client.storage.schedule_submission_or_reply_deletion"
     )
 
     # don't set any uuids to skip--test separately
@@ -748,7 +774,7 @@ def test_update_files(homedir, mocker):
     # Ensure the record for the local source that is missing from the results
     # of the API is deleted.
     mock_session.delete.assert_called_once_with(local_sub_delete)
-    mock_delete_submission_files.assert_called_once_with(local_sub_delete, data_dir)
+    mock_delete_submission_files.assert_called_once_with(mock_session, local_sub_delete, data_dir)
     # Session is committed to database.
     assert mock_session.commit.call_count == 1
 
@@ -921,6 +947,7 @@ def test_update_messages(homedir, mocker):
     """
     data_dir = os.path.join(homedir, "data")
     mock_session = mocker.MagicMock()
+    lookup_by_uuid = mocker.patch("securedrop_client.utils.lookup_by_uuid")
     # Source object related to the submissions.
     source = mocker.MagicMock()
     source.uuid = str(uuid.uuid4())
@@ -949,11 +976,11 @@ def test_update_messages(homedir, mocker):
     local_source.id = 666  # };-)
     local_user = mocker.MagicMock()
     local_user.id = 42
-    mock_session.query().filter_by().first.return_value = local_source
+    lookup_by_uuid().params().first.return_value = local_source
     mock_focu = mocker.MagicMock(return_value=local_user)
     mocker.patch("securedrop_client.storage.create_or_update_user", mock_focu)
     mock_delete_submission_files = mocker.patch(
-        "securedrop_client.storage.delete_single_submission_or_reply_on_disk"
+        "securedrop_client.storage.schedule_submission_or_reply_deletion"
     )
 
     # Don't pass in skipped UUIDs, test that separately
@@ -975,7 +1002,9 @@ def test_update_messages(homedir, mocker):
     # Ensure the record for the local source that is missing from the results
     # of the API is deleted.
     mock_session.delete.assert_called_once_with(local_message_delete)
-    mock_delete_submission_files.assert_called_once_with(local_message_delete, data_dir)
+    mock_delete_submission_files.assert_called_once_with(
+        mock_session, local_message_delete, data_dir
+    )
     # Session is committed to database.
     assert mock_session.commit.call_count == 1
 
@@ -1438,11 +1467,12 @@ def test_create_or_update_user_existing_uuid(mocker):
     Return an existing user object with the referenced uuid.
     """
     mock_session = mocker.MagicMock()
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
     mock_user = mocker.MagicMock()
     mock_user.username = "foobar"
     mock_user.firstname = "foobar"
     mock_user.lastname = "foobar"
-    mock_session.query().filter_by().one_or_none.return_value = mock_user
+    lookup_by_uuid().params().one_or_none.return_value = mock_user
     assert create_or_update_user("uuid", "username", "fn", "ln", mock_session) == mock_user
 
 
@@ -1466,7 +1496,8 @@ def test_create_or_update_user_new(mocker):
     Create and return a user object for an unknown username.
     """
     mock_session = mocker.MagicMock()
-    mock_session.query().filter_by().one_or_none.return_value = None
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
+    lookup_by_uuid().params().one_or_none.return_value = None
     new_user = create_or_update_user("uuid", "unknown", "unknown", "unknown", mock_session)
     assert new_user.username == "unknown"
     mock_session.add.assert_called_once_with(new_user)
@@ -1624,8 +1655,9 @@ def test_set_message_decryption_status_with_content_with_content(session, source
 
 def test_mark_file_as_not_downloaded(mocker):
     session = mocker.MagicMock()
-    file = factory.File(source=factory.Source(), is_downloaded=True, is_decrypted=True)
-    session.query().filter_by().one.return_value = file
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
+    file = factory.File(id=1, source=factory.Source(), is_downloaded=True, is_decrypted=True)
+    lookup_by_uuid().params().one.return_value = file
     mark_as_not_downloaded("mock_uuid", session)
     assert file.is_downloaded is False
     assert file.is_decrypted is None
@@ -1635,8 +1667,9 @@ def test_mark_file_as_not_downloaded(mocker):
 
 def test_mark_file_as_downloaded(mocker):
     session = mocker.MagicMock()
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
     file = factory.File(source=factory.Source(), is_downloaded=False)
-    session.query().filter_by().one.return_value = file
+    lookup_by_uuid().params().one.return_value = file
     mark_as_downloaded(type(file), "mock_uuid", session)
     assert file.is_downloaded is True
     session.add.assert_called_once_with(file)
@@ -1645,8 +1678,9 @@ def test_mark_file_as_downloaded(mocker):
 
 def test_mark_message_as_downloaded(mocker):
     session = mocker.MagicMock()
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
     message = factory.Message(source=factory.Source(), is_downloaded=False)
-    session.query().filter_by().one.return_value = message
+    lookup_by_uuid().params().one.return_value = message
     mark_as_downloaded(type(message), "mock_uuid", session)
     assert message.is_downloaded is True
     session.add.assert_called_once_with(message)
@@ -1655,84 +1689,184 @@ def test_mark_message_as_downloaded(mocker):
 
 def test_mark_reply_as_downloaded(mocker):
     session = mocker.MagicMock()
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
     reply = factory.Reply(source=factory.Source(), is_downloaded=False)
-    session.query().filter_by().one.return_value = reply
+    lookup_by_uuid().params().one.return_value = reply
     mark_as_downloaded(type(reply), "mock_uuid", session)
     assert reply.is_downloaded is True
     session.add.assert_called_once_with(reply)
     session.commit.assert_called_once_with()
 
 
-def test_delete_single_submission_or_reply_race_guard(homedir, mocker):
+def test_mark_as_downloaded_clears_download_error(session, source, download_error_codes):
+    message = factory.Message(
+        source=source["source"], is_downloaded=False, is_decrypted=None, content=None
+    )
+    session.add(message)
+    session.commit()
+    set_download_error(type(message), message.uuid, db.DownloadErrorCodes.CHECKSUM_ERROR, session)
+    assert message.download_error.name == db.DownloadErrorCodes.CHECKSUM_ERROR.name
+
+    mark_as_downloaded(type(message), message.uuid, session)
+
+    message = session.query(db.Message).get(message.id)
+    assert message.is_downloaded is True
+    assert message.download_error is None
+
+
+def test_mark_as_decrypted_false_keeps_download_error(session, source, download_error_codes):
+    message = factory.Message(source=source["source"], is_downloaded=True, is_decrypted=None)
+    session.add(message)
+    session.commit()
+    set_download_error(type(message), message.uuid, db.DownloadErrorCodes.DECRYPTION_ERROR, session)
+
+    mark_as_decrypted(type(message), message.uuid, session, is_decrypted=False)
+
+    message = session.query(db.Message).get(message.id)
+    assert message.is_decrypted is False
+    assert message.download_error.name == db.DownloadErrorCodes.DECRYPTION_ERROR.name
+
+
+def test_storage_writes_without_commit(mocker):
+    session = mocker.MagicMock()
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
+    file = factory.File(id=1, source=factory.Source(), is_downloaded=False)
+    lookup_by_uuid().params().one.return_value = file
+
+    mark_as_downloaded(type(file), "mock_uuid", session, commit=False)
+    mark_as_decrypted(type(file), "mock_uuid", session, commit=False)
+    mark_as_not_downloaded("mock_uuid", session, commit=False)
+
+    session.commit.assert_not_called()
+
+
+def test_schedule_submission_or_reply_deletion_file(homedir, session):
     """
-    This test checks that if there is a file is deleted
-    locally through another method, that an unhandled exception
-    will not occur in delete_single_submission_or_reply_on_disk
+    Scheduling deletion of a file schedules deletion of the folder it's inside.
     """
+    source = factory.Source(journalist_designation="dissolved-steak")
+    test_obj = factory.File(source=source, filename="1-dissolved-steak-doc.gz.gpg")
 
-    test_obj = mocker.MagicMock()
-    test_obj.filename = "1-dissolved-steak-msg.gpg"
-    add_test_file_to_temp_dir(homedir, test_obj.filename)
+    schedule_submission_or_reply_deletion(session, test_obj, homedir)
+    session.commit()
 
-    mock_remove = mocker.patch("os.remove", side_effect=FileNotFoundError)
-    delete_single_submission_or_reply_on_disk(test_obj, homedir)
+    [pending_deletion] = get_pending_deletions(session)
+    assert pending_deletion.path == os.path.dirname(test_obj.location(homedir))
 
-    assert mock_remove.call_count == 1
 
+def test_schedule_submission_or_reply_deletion_message(homedir, session):
+    source = factory.Source(journalist_designation="dissolved-steak")
+    test_obj = factory.Message(source=source, filename="1-dissolved-steak-msg.gpg")
 
-def test_delete_single_submission_or_reply_single_file(homedir, mocker):
+    schedule_submission_or_reply_deletion(session, test_obj, homedir)
+    session.commit()
+
+    [pending_deletion] = get_pending_deletions(session)
+    assert pending_deletion.path == test_obj.location(homedir)
+
+
+def test_delete_pending_deletion_on_disk_directory(homedir, session):
     """
-    This test checks that calling the delete_single_submission_or_reply
-    method deletes the file as well as the folder it's inside.
+    Deleting a file's folder also removes the source folder if it is left empty.
     """
-
+    data_dir = os.path.join(homedir, "data")
     source = factory.Source(journalist_designation="dissolved-steak")
-    file_server_filename = "1-dissolved-steak-msg.gpg"
-    test_obj = db.File(
-        source=source,
-        uuid="test",
-        size=123,
-        filename=file_server_filename,
-        download_url="http://test/test",
-    )
-    source_directory = os.path.dirname(test_obj.location(homedir))
-    add_test_file_to_temp_dir(source_directory, file_server_filename)
+    test_obj = factory.File(source=source, filename="1-dissolved-steak-doc.gz.gpg")
+    file_directory = os.path.dirname(test_obj.location(data_dir))
+    add_test_file_to_temp_dir(file_directory, test_obj.filename)
+    schedule_submission_or_reply_deletion(session, test_obj, data_dir)
+    session.commit()
+
+    delete_pending_deletion_on_disk(session, get_pending_deletions(session)[0], data_dir)
+
+    assert not os.path.exists(file_directory)
+    assert not os.path.exists(os.path.join(data_dir, source.journalist_filename))
+    assert os.path.isdir(data_dir)
+    assert get_pending_deletions(session) == []
 
-    delete_single_submission_or_reply_on_disk(test_obj, homedir)
 
-    # Ensure both file and its containing folder are gone.
-    with pytest.raises(FileNotFoundError):
-        open(os.path.join(source_directory, file_server_filename))
+def test_delete_pending_deletion_on_disk_keeps_nonempty_parent(homedir, session):
+    data_dir = os.path.join(homedir, "data")
+    source = factory.Source(journalist_designation="dissolved-steak")
+    message = factory.Message(source=source, filename="1-dissolved-steak-msg.gpg")
+    reply = factory.Reply(source=source, filename="2-dissolved-steak-reply.gpg")
+    source_directory = os.path.join(data_dir, source.journalist_filename)
+    add_test_file_to_temp_dir(source_directory, os.path.basename(message.location(data_dir)))
+    add_test_file_to_temp_dir(source_directory, os.path.basename(reply.location(data_dir)))
+    schedule_submission_or_reply_deletion(session, message, data_dir)
+    session.commit()
 
-    with pytest.raises(FileNotFoundError):
-        open(source_directory)
+    delete_pending_deletion_on_disk(session, get_pending_deletions(session)[0], data_dir)
 
+    assert not os.path.exists(message.location(data_dir))
+    assert os.path.exists(reply.location(data_dir))
+    assert get_pending_deletions(session) == []
 
-def test_delete_single_submission_or_reply_single_file_no_folder(homedir, mocker):
+
+def test_delete_pending_deletion_on_disk_race_guard(homedir, mocker, session):
     """
-    This test checks that calling the delete_single_submission_or_reply
-    method deletes the file even if its not in a per-document folder.
+    If the path was already deleted, the tombstone is still removed.
     """
+    data_dir = os.path.join(homedir, "data")
+    schedule_deletion_on_disk(session, os.path.join(data_dir, "dissolved_steak"))
+    session.commit()
+    info_logger = mocker.patch("securedrop_client.storage.logger.info")
 
-    source = factory.Source(journalist_designation="dissolved-steak")
-    file_server_filename = "1-dissolved-steak-msg.gpg"
-    test_obj = db.File(
-        source=source,
-        uuid="test",
-        size=123,
-        filename=file_server_filename,
-        download_url="http://test/test",
-    )
-    original_location = test_obj.location
-    test_obj.location = mocker.MagicMock(
-        side_effect=[os.path.join(homedir, file_server_filename), original_location(homedir)]
-    )
-    add_test_file_to_temp_dir(homedir, file_server_filename)
+    delete_pending_deletion_on_disk(session, get_pending_deletions(session)[0], data_dir)
+
+    assert "already deleted" in info_logger.call_args[0][0]
+    assert get_pending_deletions(session) == []
 
-    delete_single_submission_or_reply_on_disk(test_obj, homedir)
 
-    with pytest.raises(FileNotFoundError):
-        open(os.path.join(homedir, file_server_filename))
+@pytest.mark.parametrize("relative_path", ["", "..", "../svs.sqlite", "dissolved_steak/../.."])
+def test_delete_pending_deletion_on_disk_outside_data_dir(homedir, mocker, session, relative_path):
+    data_dir = os.path.join(homedir, "data")
+    schedule_deletion_on_disk(session, os.path.join(data_dir, relative_path))
+    session.commit()
+    error_logger = mocker.patch("securedrop_client.storage.logger.error")
+    mock_rmtree = mocker.patch("securedrop_client.storage.shutil.rmtree")
+    mock_remove = mocker.patch("securedrop_client.storage.os.remove")
+
+    delete_pending_deletion_on_disk(session, get_pending_deletions(session)[0], data_dir)
+
+    error_logger.assert_called_once_with("Refusing to delete path outside of the data directory")
+    mock_rmtree.assert_not_called()
+    mock_remove.assert_not_called()
+    assert get_pending_deletions(session) == []
+
+
+def test_delete_pending_deletion_on_disk_error_keeps_tombstone(homedir, mocker, session):
+    data_dir = os.path.join(homedir, "data")
+    schedule_deletion_on_disk(session, os.path.join(data_dir, "dissolved_steak"))
+    session.commit()
+    mocker.patch("securedrop_client.storage.os.remove", side_effect=PermissionError)
+
+    with pytest.raises(PermissionError):
+        delete_pending_deletion_on_disk(session, get_pending_deletions(session)[0], data_dir)
+
+    session.rollback()
+    assert len(get_pending_deletions(session)) == 1
+
+
+def test_queued_jobs_journal(session):
+    add_queued_job("MessageDownloadJob", "message-uuid", session)
+    add_queued_job("FileDownloadJob", "file-uuid", session)
+    add_queued_job("MessageDownloadJob", "message-uuid", session)  # Not duplicated
+    mark_queued_job_as_started("MessageDownloadJob", "message-uuid", session)
+
+    queued_jobs = get_queued_jobs(session)
+    assert [(j.job_type, j.uuid, j.is_started) for j in queued_jobs] == [
+        ("MessageDownloadJob", "message-uuid", True),
+        ("FileDownloadJob", "file-uuid", False),
+    ]
+
+    # Queued again after a timeout
+    add_queued_job("MessageDownloadJob", "message-uuid", session)
+    session.expire_all()
+    assert get_queued_jobs(session)[0].is_started is False
+
+    delete_queued_job("MessageDownloadJob", "message-uuid", session)
+    assert [j.uuid for j in get_queued_jobs(session)] == ["file-uuid"]
 
 
 def test_source_exists_true(homedir, mocker):
@@ -1791,6 +1925,111 @@ def test_get_reply(mocker, session):
     assert result == reply
 
 
+def test_search(session, source):
+    message = factory.Message(source=source["source"], content="Meet me at the café")
+    reply = factory.Reply(source=source["source"], content="Which cafe?")
+    file = factory.File(source=source["source"], is_decrypted=None, is_downloaded=True)
+    session.add_all([message, reply, file])
+    session.commit()
+    for db_obj in [message, reply, file]:
+        update_search_index(session, db_obj)
+    mark_as_decrypted(type(file), file.uuid, session, original_filename="cafe-receipt.pdf")
+
+    results = search(session, "CAFE")
+    assert sorted(results) == sorted(
+        [
+            (source["uuid"], message.uuid),
+            (source["uuid"], reply.uuid),
+            (source["uuid"], file.uuid),
+        ]
+    )
+    assert search(session, "meet caf") == [(source["uuid"], message.uuid)]
+    assert search(session, "receipt.pdf") == [(source["uuid"], file.uuid)]
+    assert search(session, "café latte") == []
+
+
+def test_search_limit_keeps_best_matches_of_every_type(session, source):
+    """
+    The limit keeps the best matches whichever table they come from, even if other items were
+    stored after them.
+    """
+    file = factory.File(source=source["source"], is_downloaded=True, is_decrypted=None)
+    session.add(file)
+    session.commit()
+    mark_as_decrypted(type(file), file.uuid, session, original_filename="landing.pdf")
+    messages = [
+        factory.Message(source=source["source"], content=f"landing {i} and some other words")
+        for i in range(3)
+    ]
+    session.add_all(messages)
+    session.commit()
+    for message in messages:
+        update_search_index(session, message)
+
+    results = search(session, "landing", limit=2)
+
+    assert len(results) == 2
+    assert results[0] == (source["uuid"], file.uuid)
+    assert len(search(session, "landing")) == 4
+
+
+def test_search_treats_query_as_plain_text(session, source):
+    message = factory.Message(source=source["source"], content='He said "NOT now" (again)')
+    session.add(message)
+    session.commit()
+    update_search_index(session, message)
+
+    assert search(session, '"NOT now') == [(source["uuid"], message.uuid)]
+    assert search(session, "(again) OR") == []
+    assert search(session, "   ") == []
+    assert search(session, "*") == []
+
+
+def test_search_index_follows_content_updates_and_deletes(session, source):
+    message = factory.Message(
+        source=source["source"], is_downloaded=True, is_decrypted=None, content=None
+    )
+    session.add(message)
+    session.commit()
+
+    set_message_or_reply_content(type(message), message.uuid, "first draft", session)
+    assert search(session, "first") == [(source["uuid"], message.uuid)]
+
+    set_message_or_reply_content(type(message), message.uuid, "second draft", session)
+    assert search(session, "first") == []
+    assert search(session, "second") == [(source["uuid"], message.uuid)]
+
+    session.delete(message)
+    session.commit()
+    assert search(session, "draft") == []
+
+
+def test_search_index_removes_deleted_conversation(homedir, session, source):
+    message = factory.Message(source=source["source"], content="hello")
+    reply = factory.Reply(source=source["source"], content="hello back")
+    session.add_all([message, reply])
+    session.commit()
+    update_search_index(session, message)
+    update_search_index(session, reply)
+    assert len(search(session, "hello")) == 2
+
+    delete_local_conversation_by_source_uuid(session, source["uuid"], os.path.join(homedir, "data"))
+
+    assert search(session, "hello") == []
+
+
+def test_mark_file_as_not_downloaded_removes_it_from_search_index(session, source):
+    file = factory.File(source=source["source"], is_downloaded=True, is_decrypted=None)
+    session.add(file)
+    session.commit()
+    mark_as_decrypted(type(file), file.uuid, session, original_filename="minutes.odt")
+    assert search(session, "minutes") == [(source["uuid"], file.uuid)]
+
+    mark_as_not_downloaded(file.uuid, session)
+
+    assert search(session, "minutes") == []
+
+
 def test_get_object_does_not_exist_returns_None(mocker, session):
     source = factory.Source()
     # Add the source, but not the items
@@ -2038,7 +2277,7 @@ def test___update_submissions_skip_uuids_successful(mocker, session, homedir):
 
     # Emulate race condition where records are deleted by background sync
     mock_delete = mocker.patch(
-        "securedrop_client.storage.delete_single_submission_or_reply_on_disk",
+        "securedrop_client.storage.schedule_submission_or_reply_deletion",
         side_effect=NoResultFound,
     )
 
@@ -2058,7 +2297,7 @@ def test___update_submissions_skip_uuids_successful(mocker, session, homedir):
     assert session.query(db.Message).filter_by(source_id=source.id).count() == 1
     assert session.query(db.Message).filter_by(source_id=skip_source.id).count() == 0
     assert session.query(db.Source).filter_by(id=locally_deleted_source.id).count() == 0
-    mock_delete.assert_called_once_with(local_msg_delete, data_dir)
+    mock_delete.assert_called_once_with(session, local_msg_delete, data_dir)
 
 
 def test__cleanup_directory_if_empty(mocker, session, homedir):
@@ -2120,31 +2359,25 @@ def test__cleanup_directory_error(mocker, session, homedir):
     mocked_error.assert_called_with(MatchingLogline(msg="Could not clean up directory"))
 
 
-def test___update_submissions_cleanup_empty_folder_with_error(mocker, session, homedir):
-    """ """
-
-    class MatchingLogline:
-        def __init__(self, msg):
-            self.msg = msg
-
-        def __eq__(self, other):
-            return other.find(self.msg) > -1
-
+def test___update_submissions_schedules_deletion_on_disk(mocker, session, homedir):
+    """
+    Files of deleted submissions are left on disk for the DiskDeleter, so that the sync
+    transaction does not wait for them to be deleted.
+    """
     local_source = factory.Source()
     session.add(local_source)
     local_file = factory.File(source=local_source, source_id=local_source.id)
     session.add(local_file)
     session.commit()
-    local_submissions = [local_file]
-
-    mock_error = mocker.patch("securedrop_client.storage.logger.error")
-    mocker.patch("securedrop_client.storage._cleanup_directory_if_empty", side_effect=OSError)
     data_dir = os.path.join(homedir, "data")
+    file_location = local_file.location(data_dir)
+    add_test_file_to_temp_dir(os.path.dirname(file_location), local_file.filename)
 
-    update_files([], local_submissions, [], [], session, data_dir)
-    mock_error.assert_called_once_with(
-        MatchingLogline(msg=f"Could not check {local_file.source.journalist_designation}")
-    )
+    update_files([], [local_file], [], [], session, data_dir)
+
+    assert session.query(db.File).count() == 0
+    assert os.path.exists(file_location)
+    assert [p.path for p in get_pending_deletions(session)] == [os.path.dirname(file_location)]
 
 
 def test___update_replies_skip_uuids_successful(mocker, session, homedir):
@@ -2257,7 +2490,7 @@ def test___update_replies_skip_uuids_successful(mocker, session, homedir):
     # Simulate a race condition for deletion where local database is modified
     # by sync and records are removed
     delete_call = mocker.patch(
-        "securedrop_client.storage.delete_single_submission_or_reply_on_disk",
+        "securedrop_client.storage.schedule_submission_or_reply_deletion",
         side_effect=NoResultFound,
     )
 
@@ -2292,7 +2525,7 @@ def test___update_replies_skip_uuids_successful(mocker, session, homedir):
     assert session.query(db.Reply).filter_by(uuid=locally_deleted_source.uuid).count() == 0
 
     # Ensure the local reply that is not in the API results is deleted.
-    delete_call.assert_called_once_with(local_reply_delete, data_dir)
+    delete_call.assert_called_once_with(session, local_reply_delete, data_dir)
 
 
 def test__delete_source_collection_from_db_success(mocker, session, homedir):
@@ -2402,7 +2635,8 @@ def test__delete_source_collection_from_db_uuid_not_found(mocker, homedir):
 def test__delete_source_collection_from_db_query_error(mocker, session):
     mock_session = mocker.MagicMock()
     mock_session.query().filter_by().all.return_value = [mocker.MagicMock()]
-    mock_session.query().filter_by().one_or_none.side_effect = SQLAlchemyError()
+    lookup_by_uuid = mocker.patch("securedrop_client.storage.lookup_by_uuid")
+    lookup_by_uuid().params().one_or_none.side_effect = SQLAlchemyError()
     mock_error = mocker.patch("securedrop_client.storage.logger.error")
 
     # Match the logline outside of the SQLalchemy error
@@ -2425,6 +2659,7 @@ def test__delete_source_collection_from_db_commit_error(mocker, session):
     mock_session = mocker.MagicMock()
     mock_session.commit.return_value = [mocker.MagicMock()]
     mock_session.commit.side_effect = SQLAlchemyError()
+    mocker.patch("securedrop_client.storage.lookup_by_uuid")
     mock_error = mocker.patch("securedrop_client.storage.logger.error")
 
     # Match logline outside of SQLAlchemy error
@@ -2454,14 +2689,16 @@ def test_delete_local_conversation_by_source_uuid_success(homedir, mocker, sessi
     source = factory.Source(journalist_designation="source skip", uuid=source_delete_uuid)
     session.add(source)
     session.commit()
-    mock_delete_collection = mocker.patch("securedrop_client.storage.delete_source_collection")
+    mock_delete_collection = mocker.patch(
+        "securedrop_client.storage.schedule_source_collection_deletion"
+    )
     mock_delete_from_db = mocker.patch(
         "securedrop_client.storage._delete_source_collection_from_db"
     )
 
     delete_local_conversation_by_source_uuid(session, source_delete_uuid, data_dir)
 
-    mock_delete_collection.assert_called_once_with(source.journalist_filename, data_dir)
+    mock_delete_collection.assert_called_once_with(session, source.journalist_filename, data_dir)
     mock_delete_from_db.assert_called_once_with(session, source)
 
 
@@ -2500,3 +2737,19 @@ def test__cleanup_flagged_locally_deleted_sources(mocker, session):
 
     _cleanup_flagged_locally_deleted(session, target_convo, target_source)
     session.delete.assert_called_once_with(target_source[0])
+
+
+def test_set_draft_reply_ciphertext(session):
+    source = factory.Source()
+    session.add(source)
+    draft_reply = factory.DraftReply(source=source)
+    session.add(draft_reply)
+    session.commit()
+
+    set_draft_reply_ciphertext(draft_reply.uuid, "s3kr1t m3ss1dg3", session)
+    # A draft that has been deleted in the meantime is ignored
+    set_draft_reply_ciphertext("deleted-draft-uuid", "s3kr1t m3ss1dg3", session)
+
+    session.refresh(draft_reply)
+    assert draft_reply.ciphertext == "s3kr1t m3ss1dg3"
+    assert draft_reply.content == "content"
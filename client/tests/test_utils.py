@@ -1,17 +1,23 @@
+import gzip
 import os
 import tempfile
 from pathlib import Path
 
 import pytest
 
+from securedrop_client import db
 from securedrop_client.utils import (
+    backoff_delay,
     check_all_permissions,
     check_dir_permissions,
     check_path_traversal,
     humanize_filesize,
+    lookup_by_uuid,
     relative_filepath,
+    safe_gzip_decompress,
     safe_mkdir,
 )
+from tests import factory
 
 
 def test_humanize_file_size_bytes():
@@ -32,6 +38,15 @@ def test_humanize_file_size_megabytes():
     assert expected_humanized_filesize == actual_humanized_filesize
 
 
+def test_backoff_delay():
+    """
+    The delay doubles with each attempt up to the maximum, and is between half and all of it.
+    """
+    for attempt, bound in [(0, 1.0), (1, 2.0), (3, 8.0), (10, 30.0)]:
+        for _ in range(20):
+            assert bound / 2 <= backoff_delay(attempt, 1.0, 30.0) <= bound
+
+
 def test_safe_mkdir_with_unsafe_path(homedir):
     """
     Ensure an error is raised if the path contains path traversal string.
@@ -259,6 +274,38 @@ def test_relative_filepath_error(args, expected):
     assert expected == str(e.value)
 
 
+def test_safe_gzip_decompress(homedir):
+    chunks = [gzip.compress(b"first member, "), gzip.compress(b"second member")]
+    data = b"".join(chunks)
+    dest_path = os.path.join(homedir, "data", "1-doc.gz.gpg")
+
+    # Split the data into chunks that do not line up with the gzip members
+    path = safe_gzip_decompress([data[:10], data[10:40], data[40:]], dest_path, "doc.txt", homedir)
+
+    assert path == Path(homedir, "data", "doc.txt")
+    assert path.read_bytes() == b"first member, second member"
+    assert path.stat().st_mode & 0o777 == 0o600
+
+
+def test_safe_gzip_decompress_truncated(homedir):
+    data = gzip.compress(b"a document")
+    dest_path = os.path.join(homedir, "data", "1-doc.gz.gpg")
+
+    with pytest.raises(EOFError):
+        safe_gzip_decompress([data[:-4]], dest_path, "doc.txt", homedir)
+
+    assert not Path(homedir, "data", "doc.txt").exists()
+
+
+def test_safe_gzip_decompress_with_path_traversal_attack(homedir):
+    dest_path = os.path.join(homedir, "data", "1-doc.gz.gpg")
+
+    with pytest.raises(ValueError):
+        safe_gzip_decompress([gzip.compress(b"x")], dest_path, "../../traversed", homedir)
+
+    assert not Path(homedir, "traversed").exists()
+
+
 def test_check_path_traversal():
     check_path_traversal("/good/path")
     check_path_traversal("good/path")
@@ -317,3 +364,15 @@ def test_check_dir_permissions_unsafe(mocker):
 
         with pytest.raises(RuntimeError):
             check_dir_permissions(os.path.join(temp_dir, "bad"))
+
+
+def test_lookup_by_uuid(session, source):
+    file = factory.File(source=source["source"], uuid="shared-uuid")
+    message = factory.Message(source=source["source"], uuid="shared-uuid")
+    session.add_all([file, message])
+    session.commit()
+
+    assert lookup_by_uuid(session, db.File).params(uuid="shared-uuid").one() == file
+    assert lookup_by_uuid(session, db.Message).params(uuid="shared-uuid").one() == message
+    assert lookup_by_uuid(session, db.Reply).params(uuid="shared-uuid").one_or_none() is None
+    assert lookup_by_uuid(session, db.File).params(uuid="missing").one_or_none() is None